@@ -11,3 +11,7 @@ class BagConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bag'
+
+    def ready(self):
+        import bag.checks
+        import bag.signals
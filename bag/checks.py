@@ -0,0 +1,29 @@
+"""
+bag/checks.py: system checks for the bag storage setting.
+"""
+
+from django.conf import settings
+from django.core import checks
+
+from .storage import storage_class
+from .storage.cache import CacheBagStorage
+
+LOCMEM_CACHE = 'django.core.cache.backends.locmem.LocMemCache'
+
+
+@checks.register()
+def check_bag_storage(app_configs, **kwargs):
+    """
+    The cache bag storage needs a cache every worker process shares, or
+    a shopper's bag depends on which process serves the request
+    """
+    if not issubclass(storage_class(), CacheBagStorage):
+        return []
+    if settings.CACHES['default']['BACKEND'] != LOCMEM_CACHE:
+        return []
+    return [checks.Error(
+        'BAG_STORAGE keeps bags in the cache, but the default cache is '
+        'not shared between processes.',
+        hint='Set CACHES to a shared backend, such as the database cache.',
+        id='bag.E001',
+    )]
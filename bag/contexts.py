@@ -1,22 +1,37 @@
 """
 bag/contexts.py: enables the bag contents to be accessed throughout the site.
+
+The bag is built at most once per request, and only when something reads
+it: get_bag() memoizes it on the request, and the context processor hands
+templates callables that templates call on first use.
 """
 
 from decimal import Decimal
 from django.conf import settings
-from django.shortcuts import get_object_or_404
-from products.models import Product
 
+from .snapshots import get_snapshots
+from .storage import get_storage
 
-def bag_contents(request):
 
+def build_bag(request, fresh=False):
+    """
+    The bag lines and totals for the stored bag, priced from the
+    product snapshots, or from the database if fresh. Lines whose product
+    no longer exists are dropped and pruned from the bag storage.
+    """
     bag_items = []
     total = 0
     product_count = 0
-    bag = request.session.get('bag', {})
+    storage = get_storage(request)
+    bag = storage.load()
+    products = get_snapshots(request, bag, fresh=fresh)
 
+    stale = []
     for item_id, quantity in bag.items():
-        product = get_object_or_404(Product, pk=item_id)
+        product = products.get(str(item_id))
+        if product is None:
+            stale.append(item_id)
+            continue
         total += quantity * product.price
         product_count += quantity
         bag_items.append({
@@ -25,6 +40,11 @@ def bag_contents(request):
             'product': product,
         })
 
+    if stale:
+        for item_id in stale:
+            bag.pop(item_id)
+        storage.save(bag)
+
     if total < settings.FREE_DELIVERY_THRESHOLD:
         delivery = total * Decimal(settings.STANDARD_DELIVERY_PERCENTAGE / 100)
         free_delivery_delta = settings.FREE_DELIVERY_THRESHOLD - total
@@ -44,3 +64,47 @@ def bag_contents(request):
     }
 
     return context
+
+
+BAG_KEYS = (
+    'bag_items',
+    'total',
+    'product_count',
+    'delivery',
+    'free_delivery_delta',
+    'grand_total',
+)
+
+
+def get_bag(request, fresh=False):
+    """
+    The bag for this request, built on first use. fresh rebuilds it from
+    the database's prices, which the rest of the request then shows.
+    """
+    if not fresh:
+        try:
+            return request.bag_contents
+        except AttributeError:
+            pass
+    request.bag_contents = build_bag(request, fresh=fresh)
+    return request.bag_contents
+
+
+def forget_bag(request):
+    """
+    Drop the memoized bag after the stored bag changes
+    """
+    request.__dict__.pop('bag_contents', None)
+
+
+def bag_contents(request):
+    """
+    Context processor exposing the bag to every template. Each value is
+    a callable, which the template language calls when it is first read.
+    """
+    def lazy(key):
+        return lambda: get_bag(request)[key]
+
+    context = {key: lazy(key) for key in BAG_KEYS}
+    context['free_delivery_threshold'] = settings.FREE_DELIVERY_THRESHOLD
+    return context
@@ -0,0 +1,63 @@
+"""
+bag/management/commands/benchmark_bag.py: times build_bag and counts
+its queries for bags of increasing size, before and after the bag's
+products are snapshotted. The products it seeds are rolled back
+afterwards.
+"""
+
+import statistics
+import time
+
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.http import HttpRequest
+
+from bag.contexts import build_bag
+from gamesrus.query_budget import QueryRecorder
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """
+    Show that build_bag runs a constant number of queries
+    """
+    help = ('Count the queries and time build_bag for bags of 1 to '
+            '1000 lines. All seeded rows are rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[1, 10, 100, 1000])
+        parser.add_argument('--runs', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            Product.objects.bulk_create([
+                Product(name=f'Bench {i}', price='9.99',
+                        description='Benchmark product', sku=f'bench-{i}')
+                for i in range(max(options['sizes']))])
+            ids = list(Product.objects.filter(
+                sku__startswith='bench-').values_list('id', flat=True))
+            for size in options['sizes']:
+                self._report(size, ids[:size], options['runs'])
+            transaction.set_rollback(True)
+
+    def _report(self, size, ids, runs):
+        request = HttpRequest()
+        request.session = SessionBase()
+        request.session['bag'] = {str(item_id): 1 for item_id in ids}
+
+        # The first build snapshots the products into the session, and
+        # later builds read the snapshots
+        with QueryRecorder() as cold:
+            build_bag(request)
+        with QueryRecorder() as warm:
+            build_bag(request)
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            build_bag(request)
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f'{size:>6} lines  {len(cold):>3} queries cold  '
+            f'{len(warm):>3} warm  p50 {statistics.median(timings):8.2f}ms')
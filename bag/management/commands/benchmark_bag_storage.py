@@ -0,0 +1,127 @@
+"""
+bag/management/commands/benchmark_bag_storage.py: compares how many bag
+writes per second each bag storage backend sustains under concurrent
+requests. The users, sessions and saved bags it creates are deleted
+afterwards.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.http import HttpRequest, HttpResponse
+
+from bag.storage.cache import CacheBagStorage
+from bag.storage.cookie import CookieBagStorage
+from bag.storage.database import DatabaseBagStorage
+from bag.storage.session import SessionBagStorage
+
+BACKENDS = {
+    'session': SessionBagStorage,
+    'cookie': CookieBagStorage,
+    'cache': CacheBagStorage,
+    'database': DatabaseBagStorage,
+}
+
+
+class Shopper:
+    """
+    One visitor's cookies and session, carried from request to request
+    the way a browser and SessionMiddleware would
+    """
+    def __init__(self, user=None):
+        self.user = user or AnonymousUser()
+        self.cookies = {}
+        self.session_key = None
+
+    def request(self, storage_class, item_id):
+        request = HttpRequest()
+        request.COOKIES = dict(self.cookies)
+        request.user = self.user
+        request.session = import_module(
+            settings.SESSION_ENGINE).SessionStore(self.session_key)
+
+        storage = storage_class(request)
+        bag = storage.load()
+        bag[item_id] = bag.get(item_id, 0) % 99 + 1
+        storage.save(bag)
+
+        response = HttpResponse()
+        storage.update(response)
+        if request.session.modified:
+            request.session.save()
+            self.session_key = request.session.session_key
+        for name, morsel in response.cookies.items():
+            self.cookies[name] = morsel.value
+
+
+class Command(BaseCommand):
+    """
+    Measure bag write throughput per storage backend
+    """
+    help = ('Time concurrent bag writes against the session, cookie, '
+            'cache and database bag storage backends.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backends', nargs='+', choices=sorted(BACKENDS),
+            default=list(BACKENDS))
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--writes', type=int, default=200,
+            help='Bag writes made by each thread.')
+
+    def handle(self, *args, **options):
+        users = [
+            User(username=f'bag-bench-{i}')
+            for i in range(options['threads'])]
+        for user in users:
+            user.set_unusable_password()
+        User.objects.bulk_create(users)
+        users = list(User.objects.filter(
+            username__startswith='bag-bench-').order_by('id'))
+        try:
+            for name in options['backends']:
+                self._report(
+                    name, BACKENDS[name], users, options['writes'])
+        finally:
+            # Deleting the users deletes their saved bags too
+            User.objects.filter(username__startswith='bag-bench-').delete()
+
+    def _report(self, name, storage_class, users, writes):
+        signed_in = name == 'database'
+        shoppers = [Shopper(user if signed_in else None) for user in users]
+        errors = []
+        lock = threading.Lock()
+
+        def shop(shopper):
+            try:
+                for i in range(writes):
+                    try:
+                        shopper.request(storage_class, str(i % 20 + 1))
+                    except DatabaseError:
+                        with lock:
+                            errors.append(shopper)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(shoppers)) as pool:
+            list(pool.map(shop, shoppers))
+        elapsed = time.perf_counter() - started
+
+        Session.objects.filter(session_key__in=[
+            shopper.session_key for shopper in shoppers
+            if shopper.session_key]).delete()
+        total = len(shoppers) * writes
+        rate = (total - len(errors)) / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{name:>9}  {total} writes from {len(shoppers)} threads in '
+            f'{elapsed:6.2f}s  {rate:9,.0f} writes/sec  '
+            f'{len(errors)} failed')
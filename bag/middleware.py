@@ -0,0 +1,16 @@
+"""
+bag/middleware.py: lets the bag storage write to the response.
+"""
+
+from django.utils.deprecation import MiddlewareMixin
+
+
+class BagMiddleware(MiddlewareMixin):
+    """
+    Hands the response to the request's bag storage, if one was used
+    """
+    def process_response(self, request, response):
+        storage = getattr(request, '_bag_storage', None)
+        if storage is not None:
+            storage.update(response)
+        return response
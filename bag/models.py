@@ -1,3 +1,21 @@
+"""
+bag/models.py: the stored bag for signed-in users, used by
+bag.storage.database.DatabaseBagStorage.
+"""
+
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class SavedBag(models.Model):
+    """
+    A user's bag: product id to quantity, as kept in the session
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE,
+        related_name='saved_bag')
+    contents = models.JSONField(default=dict, blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f'Bag of {self.user}'
@@ -0,0 +1,18 @@
+"""
+bag/signals.py: merges the anonymous bag into the saved one on login.
+"""
+
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+
+from .storage import storage_class
+from .storage.database import DatabaseBagStorage
+
+
+@receiver(user_logged_in)
+def merge_bag_on_login(sender, request, user, **kwargs):
+    """
+    Keep what was added before signing in when bags are stored per user
+    """
+    if request is not None and issubclass(storage_class(), DatabaseBagStorage):
+        DatabaseBagStorage.merge_session_bag(request, user)
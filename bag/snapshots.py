@@ -0,0 +1,106 @@
+"""
+bag/snapshots.py: product snapshots kept next to the bag by its storage.
+
+Each bag line stores the few product fields the bag shows. The
+snapshots are trusted for as long as the catalog version from
+products.listing_cache stays the same, so browsing with a full bag reads
+no products. When the catalog changes, every line is revalidated with
+one bulk query.
+"""
+
+from decimal import Decimal
+
+from products import listing_cache
+from products.models import Product
+from .storage import get_storage
+SNAPSHOT_FIELDS = ('id', 'name', 'sku', 'price', 'image')
+# Changed whenever the stored fields change, so older snapshots are
+# fetched again rather than read with missing keys
+SNAPSHOT_FORMAT = 2
+
+
+class ProductSnapshot:
+    """
+    The product fields the bag templates use, without the model
+    """
+    def __init__(self, id, name, sku, price, image_src):
+        # pylint: disable=redefined-builtin, too-many-arguments
+        self.id = id
+        self.name = name
+        self.sku = sku
+        self.price = price
+        # The uploaded image's URL, not Product.image_url
+        self.image_src = image_src
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, ProductSnapshot)
+            and self.to_session() == other.to_session())
+
+    @classmethod
+    def from_product(cls, product):
+        return cls(
+            product.id, product.name, product.sku, product.price,
+            product.image.url if product.image else None)
+
+    @classmethod
+    def from_session(cls, data):
+        return cls(
+            data['id'], data['name'], data['sku'], Decimal(data['price']),
+            data['image_src'])
+
+    def to_session(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'sku': self.sku,
+            'price': str(self.price),
+            'image_src': self.image_src,
+        }
+
+
+def _fetch(item_ids):
+    """
+    Snapshot the given bag items with one query, keyed by bag item id
+    """
+    ids = [int(item_id) for item_id in item_ids if str(item_id).isdigit()]
+    if not ids:
+        return {}
+    # filter() rather than in_bulk(), which SQLite splits into batches
+    products = Product.objects.only(*SNAPSHOT_FIELDS).filter(pk__in=ids)
+    return {
+        str(product.pk): ProductSnapshot.from_product(product).to_session()
+        for product in products}
+
+
+def get_snapshots(request, bag, fresh=False):
+    """
+    A ProductSnapshot for each bag line whose product still exists.
+    Snapshots taken under an older catalog version, and lines added since
+    the last snapshot, are fetched in one query and saved by the bag
+    storage. fresh fetches every line, for prices that are charged.
+    """
+    storage = get_storage(request)
+    catalog_version = listing_cache.get_version()
+    stored = storage.load_snapshot() or {}
+    lines = {}
+    current = (
+        stored.get('format') == SNAPSHOT_FORMAT
+        and stored.get('catalog_version') == catalog_version)
+    if current and not fresh:
+        lines = {
+            item_id: data for item_id, data in stored['lines'].items()
+            if item_id in bag}
+
+    missing = [item_id for item_id in bag if item_id not in lines]
+    if missing:
+        lines.update(_fetch(missing))
+
+    snapshot = {
+        'format': SNAPSHOT_FORMAT, 'catalog_version': catalog_version,
+        'lines': lines}
+    if snapshot != stored and (bag or stored):
+        storage.save_snapshot(snapshot)
+    return {
+        item_id: ProductSnapshot.from_session(data)
+        for item_id, data in lines.items()}
@@ -0,0 +1,28 @@
+"""
+bag/storage/__init__.py: picks the bag storage backend named by the
+BAG_STORAGE setting, the same way MESSAGE_STORAGE picks the messages one.
+"""
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_STORAGE = 'bag.storage.session.SessionBagStorage'
+
+
+def storage_class():
+    """
+    The configured bag storage class
+    """
+    return import_string(getattr(settings, 'BAG_STORAGE', DEFAULT_STORAGE))
+
+
+def get_storage(request):
+    """
+    The bag storage for this request, created on first use. BagMiddleware
+    hands it the response so cookie-based backends can write to it.
+    """
+    try:
+        return request._bag_storage
+    except AttributeError:
+        request._bag_storage = storage_class()(request)
+        return request._bag_storage
@@ -0,0 +1,73 @@
+"""
+bag/storage/base.py: the interface every bag storage backend implements.
+
+A bag is a dict of product id (as a string) to quantity. Views load it,
+change a copy and save it back; the backend decides where it lives.
+Backends also keep the bag's product snapshots (see bag/snapshots.py),
+which default to the session.
+"""
+
+MAX_QUANTITY = 99
+SNAPSHOT_KEY = 'bag_snapshot'
+
+
+class BaseBagStorage:
+    """
+    Loads and saves one visitor's bag. Subclasses implement _load() and
+    _store(), and may override update() to write to the response.
+    """
+    def __init__(self, request):
+        self.request = request
+        self._bag = None
+        self.changed = False
+
+    def load(self):
+        """
+        A copy of the bag, read from the backend once per request
+        """
+        if self._bag is None:
+            self._bag = self._load() or {}
+        return dict(self._bag)
+
+    def save(self, bag):
+        """
+        Replace the stored bag
+        """
+        self._bag = dict(bag)
+        self.changed = True
+        self._store(self._bag)
+
+    def clear(self):
+        """
+        Empty the bag
+        """
+        self.save({})
+
+    def update(self, response):
+        """
+        Called by BagMiddleware with the outgoing response
+        """
+
+    def load_snapshot(self):
+        return self.request.session.get(SNAPSHOT_KEY)
+
+    def save_snapshot(self, snapshot):
+        self.request.session[SNAPSHOT_KEY] = snapshot
+
+    def _load(self):
+        raise NotImplementedError(
+            'subclasses of BaseBagStorage must provide a _load() method')
+
+    def _store(self, bag):
+        raise NotImplementedError(
+            'subclasses of BaseBagStorage must provide a _store() method')
+
+
+def merge_bags(first, second):
+    """
+    The two bags combined, adding quantities of shared lines
+    """
+    merged = dict(first)
+    for item_id, quantity in second.items():
+        merged[item_id] = min(merged.get(item_id, 0) + quantity, MAX_QUANTITY)
+    return merged
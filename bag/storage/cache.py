@@ -0,0 +1,60 @@
+"""
+bag/storage/cache.py: keeps the bag, and its product snapshots, in the
+default cache under a random bag id carried in a signed cookie.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .base import BaseBagStorage
+
+
+class CacheBagStorage(BaseBagStorage):
+    """
+    The bag under 'bag:<bag id>' in the cache
+    """
+    cookie_name = 'bag_id'
+    salt = 'bag.storage.cache'
+
+    def __init__(self, request):
+        super().__init__(request)
+        self.bag_id = request.get_signed_cookie(
+            self.cookie_name, default=None, salt=self.salt)
+        self.new_id = self.bag_id is None
+
+    @property
+    def cache_key(self):
+        if self.bag_id is None:
+            self.bag_id = uuid.uuid4().hex
+        return f'bag:{self.bag_id}'
+
+    def _load(self):
+        if self.new_id:
+            return None
+        return cache.get(self.cache_key)
+
+    def _store(self, bag):
+        cache.set(self.cache_key, bag, settings.SESSION_COOKIE_AGE)
+
+    def update(self, response):
+        # Only hand out a bag id once something has been stored under it
+        if self.new_id and self.changed:
+            response.set_signed_cookie(
+                self.cookie_name, self.bag_id, salt=self.salt,
+                max_age=settings.SESSION_COOKIE_AGE,
+                secure=settings.SESSION_COOKIE_SECURE or None,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+
+    def load_snapshot(self):
+        if self.new_id:
+            return None
+        return cache.get(f'{self.cache_key}:snapshot')
+
+    def save_snapshot(self, snapshot):
+        cache.set(
+            f'{self.cache_key}:snapshot', snapshot,
+            settings.SESSION_COOKIE_AGE)
@@ -0,0 +1,64 @@
+"""
+bag/storage/cookie.py: keeps the bag in a signed cookie, so changing it
+writes nothing on the server.
+
+Product snapshots are not kept either: they would not fit in a cookie,
+so each bag read fetches its products with one query.
+"""
+
+import json
+
+from django.conf import settings
+
+from .base import BaseBagStorage
+
+
+class CookieBagStorage(BaseBagStorage):
+    """
+    The bag as signed JSON in the 'bag' cookie
+    """
+    cookie_name = 'bag'
+    salt = 'bag.storage.cookie'
+
+    def _load(self):
+        value = self.request.get_signed_cookie(
+            self.cookie_name, default=None, salt=self.salt,
+            max_age=settings.SESSION_COOKIE_AGE)
+        if value is None:
+            return None
+        try:
+            bag = json.loads(value)
+        except ValueError:
+            return None
+        return bag if isinstance(bag, dict) else None
+
+    def _store(self, bag):
+        """
+        Nothing to do until the response is ready
+        """
+
+    def update(self, response):
+        if not self.changed:
+            return
+        if self._bag:
+            response.set_signed_cookie(
+                self.cookie_name,
+                json.dumps(self._bag, separators=(',', ':')),
+                salt=self.salt,
+                max_age=settings.SESSION_COOKIE_AGE,
+                secure=settings.SESSION_COOKIE_SECURE or None,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+        else:
+            response.delete_cookie(
+                self.cookie_name,
+                samesite=settings.SESSION_COOKIE_SAMESITE)
+
+    def load_snapshot(self):
+        return None
+
+    def save_snapshot(self, snapshot):
+        """
+        Snapshots are not kept between requests
+        """
@@ -0,0 +1,61 @@
+"""
+bag/storage/database.py: keeps a signed-in shopper's bag in the SavedBag
+table, so it follows them between devices. Anonymous visitors keep theirs
+in the session until they sign in, when the two are merged.
+"""
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from bag.models import SavedBag
+from .base import merge_bags
+from .session import SessionBagStorage
+
+
+class DatabaseBagStorage(SessionBagStorage):
+    """
+    The SavedBag row for signed-in users, the session for everyone else
+    """
+    def _user(self):
+        user = getattr(self.request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return user
+        return None
+
+    def _load(self):
+        user = self._user()
+        if user is None:
+            return super()._load()
+        return SavedBag.objects.filter(user=user).values_list(
+            'contents', flat=True).first()
+
+    def _store(self, bag):
+        user = self._user()
+        if user is None:
+            super()._store(bag)
+            return
+        # One UPDATE on every change after the first, which creates the row
+        changed = SavedBag.objects.filter(user=user).update(
+            contents=bag, updated=timezone.now())
+        if not changed:
+            try:
+                with transaction.atomic():
+                    SavedBag.objects.create(user=user, contents=bag)
+            except IntegrityError:
+                SavedBag.objects.filter(user=user).update(
+                    contents=bag, updated=timezone.now())
+
+    @classmethod
+    def merge_session_bag(cls, request, user):
+        """
+        Move the anonymous session bag into the user's SavedBag
+        """
+        anonymous = request.session.pop(cls.session_key, None)
+        if not anonymous:
+            return
+        with transaction.atomic():
+            saved, _ = SavedBag.objects.select_for_update().get_or_create(
+                user=user)
+            saved.contents = merge_bags(saved.contents, anonymous)
+            saved.save(update_fields=['contents', 'updated'])
+        request.__dict__.pop('_bag_storage', None)
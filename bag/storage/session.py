@@ -0,0 +1,19 @@
+"""
+bag/storage/session.py: keeps the bag in the session, as the site always
+has. Every change is a write to the session table.
+"""
+
+from .base import BaseBagStorage
+
+
+class SessionBagStorage(BaseBagStorage):
+    """
+    The bag under request.session['bag']
+    """
+    session_key = 'bag'
+
+    def _load(self):
+        return self.request.session.get(self.session_key)
+
+    def _store(self, bag):
+        self.request.session[self.session_key] = bag
@@ -0,0 +1,337 @@
+"""
+bag/tests.py: Contains testing of the bag app.
+"""
+# pylint: disable=no-member
+
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.base import SessionBase
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from bag import contexts
+from bag.checks import check_bag_storage
+from bag.models import SavedBag
+from checkout.fake_stripe import FakeStripe
+from gamesrus.query_budget import BUDGET_SIZES, QueryBudgetTestMixin
+from products.models import Product
+
+
+class TestBagContents(TestCase):
+    """
+    Tests the bag_contents context processor
+    """
+    def setUp(self):
+        """
+        Create two products
+        """
+        cache.clear()
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        self.chair = Product.objects.create(
+            name='Chair', price='100.00', description='Test Description')
+
+    def set_bag(self, bag):
+        session = self.client.session
+        session['bag'] = bag
+        session.save()
+
+    def test_totals(self):
+        """
+        Totals and counts cover every line
+        """
+        self.set_bag({str(self.mouse.id): 3, str(self.chair.id): 1})
+        response = self.client.get('/bag/')
+        bag = contexts.get_bag(response.wsgi_request)
+        self.assertEqual(bag['total'], Decimal('130.00'))
+        self.assertEqual(bag['product_count'], 4)
+        self.assertEqual(
+            [item['product'].name for item in bag['bag_items']],
+            ['Mouse', 'Chair'])
+
+    def test_stale_lines_are_pruned(self):
+        """
+        A deleted product drops out of the bag instead of raising a 404
+        """
+        self.set_bag({str(self.mouse.id): 1, str(self.chair.id): 2})
+        self.chair.delete()
+        response = self.client.get('/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['product_count'](), 1)
+        self.assertEqual(
+            self.client.session['bag'], {str(self.mouse.id): 1})
+
+    def test_snapshots_spare_product_queries(self):
+        """
+        Once snapshotted, the bag is shown without reading products
+        """
+        self.set_bag({str(self.mouse.id): 1, str(self.chair.id): 1})
+        self.client.get('/bag/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/bag/')
+        self.assertContains(response, 'Chair')
+
+    def test_catalog_change_revalidates_snapshots(self):
+        """
+        A product edit reaches the bag with its new price
+        """
+        self.set_bag({str(self.mouse.id): 2})
+        self.client.get('/bag/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mouse.price = Decimal('12.50')
+            self.mouse.save()
+        response = self.client.get('/bag/')
+        bag = contexts.get_bag(response.wsgi_request)
+        self.assertEqual(bag['total'], Decimal('25.00'))
+        self.assertEqual(
+            bag['bag_items'][0]['product'].price, Decimal('12.50'))
+
+    def test_older_snapshot_format_is_refetched(self):
+        """
+        Snapshots saved with other fields are fetched again
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        self.client.get('/bag/')
+        session = self.client.session
+        snapshot = session['bag_snapshot']
+        del snapshot['format']
+        snapshot['lines'][str(self.mouse.id)] = {'id': self.mouse.id}
+        session['bag_snapshot'] = snapshot
+        session.save()
+        response = self.client.get('/bag/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.client.session['bag_snapshot']['lines'][
+                str(self.mouse.id)]['name'], self.mouse.name)
+
+    def test_bag_is_built_once_per_request(self):
+        """
+        The templates and the checkout view share one bag
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        with mock.patch('bag.contexts.build_bag',
+                        wraps=contexts.build_bag) as build_bag, \
+                FakeStripe() as fake, fake.use():
+            response = self.client.get('/checkout/')
+        self.assertContains(response, 'Mouse')
+        build_bag.assert_called_once()
+
+    def test_bag_is_not_built_unless_read(self):
+        """
+        Rendering with the context processor alone runs no bag query
+        """
+        request = RequestFactory().get('/')
+        request.session = SessionBase()
+        request.session['bag'] = {str(self.mouse.id): 1}
+        context = contexts.bag_contents(request)
+        with self.assertNumQueries(0):
+            context['free_delivery_threshold']
+        with self.assertNumQueries(1):
+            self.assertEqual(context['grand_total'](), context['total']() +
+                             context['delivery']())
+
+
+class TestBagApi(TestCase):
+    """
+    Tests the JSON add, adjust and remove endpoints
+    """
+    def setUp(self):
+        """
+        Create a product below the free delivery threshold
+        """
+        cache.clear()
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        self.url_id = str(self.mouse.id)
+
+    def post(self, action, quantity=None, item_id=None):
+        data = {} if quantity is None else {'quantity': quantity}
+        return self.client.post(
+            f'/bag/api/{action}/{item_id or self.url_id}/', data)
+
+    def test_add_returns_totals(self):
+        """
+        Adding returns the line subtotal and the recomputed totals
+        """
+        self.post('add', 2)
+        data = self.post('add', 1).json()
+        self.assertEqual(data['quantity'], 3)
+        self.assertEqual(data['line_subtotal'], '30.00')
+        self.assertEqual(data['total'], '30.00')
+        self.assertEqual(data['delivery'], '1.50')
+        self.assertEqual(data['grand_total'], '31.50')
+        self.assertEqual(self.client.session['bag'], {self.url_id: 3})
+
+    def test_adjust_and_remove(self):
+        """
+        Adjusting changes the line and zero or remove deletes it
+        """
+        self.post('add', 1)
+        self.assertEqual(self.post('adjust', 5).json()['line_subtotal'],
+                         '50.00')
+        data = self.post('adjust', 0).json()
+        self.assertEqual(data['quantity'], 0)
+        self.assertEqual(data['grand_total'], '0.00')
+        self.post('add', 1)
+        self.assertEqual(self.post('remove').json()['product_count'], 0)
+        self.assertEqual(self.client.session['bag'], {})
+
+    def test_invalid_changes_are_rejected(self):
+        """
+        Bad quantities, unknown products and GETs leave the bag alone
+        """
+        self.assertEqual(self.post('add', 'lots').status_code, 400)
+        self.assertEqual(self.post('add', 100).status_code, 400)
+        self.assertEqual(self.post('add', 1, item_id='999').status_code, 404)
+        self.assertEqual(self.post('adjust', 1).status_code, 404)
+        self.assertEqual(
+            self.client.get(f'/bag/api/add/{self.url_id}/').status_code, 405)
+        self.assertNotIn('bag', self.client.session)
+
+    def test_adjust_reads_no_products(self):
+        """
+        Changing a snapshotted line only reads and writes the session
+        """
+        self.post('add', 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.post('adjust', 4)
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if 'products_product' in query['sql']])
+
+
+class TestBagStorage(TestCase):
+    """
+    Tests the cookie, cache and database bag storage backends
+    """
+    def setUp(self):
+        """
+        Create a product and a shopper
+        """
+        cache.clear()
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        self.url_id = str(self.mouse.id)
+        self.user = User.objects.create_user(
+            username='shopper', password='secret-password')
+
+    def add(self, quantity):
+        return self.client.post(
+            f'/bag/api/add/{self.url_id}/', {'quantity': quantity})
+
+    @override_settings(BAG_STORAGE='bag.storage.cookie.CookieBagStorage')
+    def test_cookie_storage_writes_nothing_on_the_server(self):
+        """
+        The bag round-trips through a signed cookie and no session is saved
+        """
+        self.add(2)
+        self.assertEqual(self.add(1).json()['quantity'], 3)
+        self.assertIn('bag', self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+        self.assertContains(self.client.get('/bag/'), 'Mouse')
+
+    @override_settings(BAG_STORAGE='bag.storage.cookie.CookieBagStorage')
+    def test_tampered_cookie_is_an_empty_bag(self):
+        """
+        A cookie that fails its signature check is ignored
+        """
+        self.client.cookies['bag'] = f'{{"{self.url_id}":5}}'
+        response = self.client.get('/bag/')
+        self.assertEqual(response.context['product_count'](), 0)
+
+    @override_settings(BAG_STORAGE='bag.storage.cache.CacheBagStorage')
+    def test_cache_storage(self):
+        """
+        The bag lives in the cache under the id in the bag_id cookie
+        """
+        self.add(2)
+        self.assertEqual(self.add(1).json()['quantity'], 3)
+        bag_id = self.client.cookies['bag_id'].value.split(':')[0]
+        self.assertEqual(cache.get(f'bag:{bag_id}'), {self.url_id: 3})
+        self.assertFalse(Session.objects.exists())
+
+    def test_cache_storage_needs_a_shared_cache(self):
+        """
+        The cache storage is refused with the local-memory cache
+        """
+        with override_settings(
+                BAG_STORAGE='bag.storage.cache.CacheBagStorage'):
+            self.assertEqual(
+                [error.id for error in check_bag_storage(None)],
+                ['bag.E001'])
+            with override_settings(CACHES={'default': {
+                    'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                    'LOCATION': 'gamesrus_cache'}}):
+                self.assertEqual(check_bag_storage(None), [])
+        self.assertEqual(check_bag_storage(None), [])
+
+    @override_settings(BAG_STORAGE='bag.storage.database.DatabaseBagStorage')
+    def test_database_storage_for_signed_in_users(self):
+        """
+        A signed-in user's bag is a SavedBag row, not session data
+        """
+        self.client.force_login(self.user)
+        self.add(2)
+        self.assertEqual(
+            SavedBag.objects.get(user=self.user).contents, {self.url_id: 2})
+        self.assertNotIn('bag', self.client.session)
+
+    @override_settings(BAG_STORAGE='bag.storage.database.DatabaseBagStorage')
+    def test_database_storage_merges_on_login(self):
+        """
+        What was added before signing in joins the saved bag
+        """
+        SavedBag.objects.create(user=self.user, contents={self.url_id: 98})
+        self.add(3)
+        self.assertEqual(self.client.session['bag'], {self.url_id: 3})
+        self.client.login(username='shopper', password='secret-password')
+        self.assertEqual(
+            SavedBag.objects.get(user=self.user).contents, {self.url_id: 99})
+        self.assertNotIn('bag', self.client.session)
+
+
+class TestQueryBudgets(QueryBudgetTestMixin, TestCase):
+    """
+    Tests that the bag page stays within its query budget
+    however many lines the bag holds
+    """
+    def fill_bag(self, size):
+        """
+        Put size distinct products in the session bag
+        """
+        Product.objects.all().delete()
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', price='9.99',
+                    description='Test Description')
+            for i in range(size)])
+        session = self.client.session
+        session['bag'] = {
+            str(product.id): 1 for product in Product.objects.all()}
+        session.save()
+
+    def test_view_bag_budget(self):
+        """
+        The bag page runs a fixed number of queries once the bag's
+        products are snapshotted in the session
+        """
+        for size in BUDGET_SIZES:
+            with self.subTest(size=size):
+                self.fill_bag(size)
+                self.client.get('/bag/')
+                with self.assertQueryBudget('view_bag'):
+                    response = self.client.get('/bag/')
+                self.assertEqual(response.status_code, 200)
+
+    def test_missing_budget_fails_clearly(self):
+        """
+        A URL name with no declared budget fails naming it
+        """
+        with self.assertRaisesMessage(
+                AssertionError, "No query budget for 'no_such_view'"):
+            with self.assertQueryBudget('no_such_view'):
+                pass
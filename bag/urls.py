@@ -6,4 +6,10 @@ urlpatterns = [
     path('', views.view_bag, name='view_bag'),
     path('add/<item_id>/', views.add_to_bag, name='add_to_bag'),
     path('adjust/<item_id>/', views.adjust_bag, name='adjust_bag'),
+    path('api/add/<item_id>/', views.add_to_bag_json,
+         name='add_to_bag_json'),
+    path('api/adjust/<item_id>/', views.adjust_bag_json,
+         name='adjust_bag_json'),
+    path('api/remove/<item_id>/', views.remove_from_bag_json,
+         name='remove_from_bag_json'),
 ]
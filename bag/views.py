@@ -4,11 +4,20 @@ functionality for it. Most of the code is from the Code Institute
 Boutique Ado project.
 """
 
+from decimal import Decimal, ROUND_HALF_UP
+
 from django.shortcuts import (
     render, redirect, reverse, HttpResponse, get_object_or_404)
 from django.contrib import messages
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
 
 from products.models import Product
+from .contexts import forget_bag, get_bag
+from .snapshots import get_snapshots
+from .storage import get_storage
+from .storage.base import MAX_QUANTITY
+from .templatetags.bag_tools import calc_subtotal
 
 
 def view_bag(request):
@@ -26,7 +35,8 @@ def add_to_bag(request, item_id):
     product = get_object_or_404(Product, pk=item_id)
     quantity = int(request.POST.get('quantity'))
     redirect_url = request.POST.get('redirect_url')
-    bag = request.session.get('bag', {})
+    storage = get_storage(request)
+    bag = storage.load()
 
     if item_id in list(bag.keys()):
         bag[item_id] += quantity
@@ -36,7 +46,7 @@ def add_to_bag(request, item_id):
         bag[item_id] = quantity
         messages.success(request, f'Added {product.name} to your bag')
 
-    request.session['bag'] = bag
+    storage.save(bag)
     return redirect(redirect_url)
 
 
@@ -46,9 +56,10 @@ def adjust_bag(request, item_id):
     """
 
     quantity = int(request.POST.get('quantity'))
+    storage = get_storage(request)
     if 'quantity' in request.POST:
 
-        bag = request.session.get('bag', {})
+        bag = storage.load()
 
     if quantity:
         if quantity > 0:
@@ -63,7 +74,7 @@ def adjust_bag(request, item_id):
         else:
             bag.pop(item_id)
 
-    request.session['bag'] = bag
+    storage.save(bag)
     return redirect(reverse('view_bag'))
 
 
@@ -73,7 +84,8 @@ def remove_from_bag(request, item_id):
     """
 
     try:
-        bag = request.session.get('bag', {})
+        storage = get_storage(request)
+        bag = storage.load()
         quantity = int(request.POST.get('quantity'))
 
         if quantity:
@@ -83,8 +95,110 @@ def remove_from_bag(request, item_id):
         else:
             bag.pop(item_id)
 
-        request.session['bag'] = bag
+        storage.save(bag)
         return HttpResponse(status=200)
 
     except Exception as e:
         return HttpResponse(status=500)
+
+
+def _money(value):
+    """
+    Format an amount the way the floatformat:2 filter shows it
+    """
+    return str(Decimal(value).quantize(Decimal('0.01'), ROUND_HALF_UP))
+
+
+def _read_quantity(request, minimum):
+    """
+    The posted quantity, or None if it is missing or out of range
+    """
+    try:
+        quantity = int(request.POST.get('quantity', ''))
+    except ValueError:
+        return None
+    if not minimum <= quantity <= MAX_QUANTITY:
+        return None
+    return quantity
+
+
+def _bag_response(request, item_id, status=200):
+    """
+    The changed line and the recomputed bag totals as JSON
+    """
+    forget_bag(request)
+    bag = get_bag(request)
+    line = next(
+        (item for item in bag['bag_items'] if str(item['item_id']) == item_id),
+        None)
+    quantity = line['quantity'] if line else 0
+    return JsonResponse({
+        'item_id': item_id,
+        'quantity': quantity,
+        'line_subtotal': _money(
+            calc_subtotal(line['product'].price, quantity) if line else 0),
+        'product_count': bag['product_count'],
+        'total': _money(bag['total']),
+        'delivery': _money(bag['delivery']),
+        'free_delivery_delta': _money(bag['free_delivery_delta']),
+        'grand_total': _money(bag['grand_total']),
+    }, status=status)
+
+
+def _error(message, status=400):
+    return JsonResponse({'error': message}, status=status)
+
+
+@require_POST
+def add_to_bag_json(request, item_id):
+    """
+    Add a quantity of a product to the bag and return the new totals
+    """
+    quantity = _read_quantity(request, 1)
+    if quantity is None:
+        return _error(f'Quantity must be between 1 and {MAX_QUANTITY}.')
+    storage = get_storage(request)
+    bag = storage.load()
+    if item_id not in get_snapshots(request, {**bag, item_id: quantity}):
+        return _error('Product not found.', status=404)
+
+    bag[item_id] = min(bag.get(item_id, 0) + quantity, MAX_QUANTITY)
+    storage.save(bag)
+    return _bag_response(request, item_id)
+
+
+@require_POST
+def adjust_bag_json(request, item_id):
+    """
+    Set the quantity of a bag line, removing it at zero, and return
+    the new totals
+    """
+    quantity = _read_quantity(request, 0)
+    if quantity is None:
+        return _error(f'Quantity must be between 0 and {MAX_QUANTITY}.')
+    storage = get_storage(request)
+    bag = storage.load()
+    if item_id not in bag:
+        return _error('That product is not in your bag.', status=404)
+
+    if quantity:
+        bag[item_id] = quantity
+    else:
+        bag.pop(item_id)
+    storage.save(bag)
+    return _bag_response(request, item_id)
+
+
+@require_POST
+def remove_from_bag_json(request, item_id):
+    """
+    Remove a line from the bag and return the new totals
+    """
+    storage = get_storage(request)
+    bag = storage.load()
+    if item_id not in bag:
+        return _error('That product is not in your bag.', status=404)
+
+    bag.pop(item_id)
+    storage.save(bag)
+    return _bag_response(request, item_id)
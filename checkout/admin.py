@@ -3,9 +3,21 @@ checkout/admin.py: admin models for the checkout app.
 Credit to Code Institute's Boutique Ado project.
 """
 
+from datetime import timedelta
+
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.db.models import Max, Sum
+from django.template.response import TemplateResponse
+from django.utils import timezone
+
+from .models import (
+    DailyProductSales, DailySales, Order, OrderLineItem, OutboxEmail)
+from .sales import DAY_FIELDS
 
-from .models import Order, OrderLineItem
+DASHBOARD_DAYS = (7, 30, 90, 365)
+DEFAULT_DASHBOARD_DAYS = 30
+TOP_PRODUCTS = 10
 
 
 class OrderLineItemAdminInline(admin.TabularInline):
@@ -14,7 +26,17 @@ class OrderLineItemAdminInline(admin.TabularInline):
     in the Django admin
     """
     model = OrderLineItem
-    readonly_fields = ('lineitem_total',)
+    # Show the line item's copy of the product rather than loading it
+    fields = ('product_name', 'product_sku', 'unit_price', 'quantity',
+              'lineitem_total')
+    # The order's totals and the sales rollups were taken from its line
+    # items, so they can't be edited or removed here
+    readonly_fields = fields
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        # Line items are made by the checkout, which snapshots the product
+        return False
 
 
 class OrderAdmin(admin.ModelAdmin):
@@ -42,4 +64,74 @@ class OrderAdmin(admin.ModelAdmin):
     ordering = ('-date',)
 
 
+class OutboxEmailAdmin(admin.ModelAdmin):
+    """
+    Shows queued emails and why any failed
+    """
+    list_display = ('subject', 'to_email', 'status', 'attempts',
+                    'send_after', 'sent_at')
+    list_filter = ('status',)
+    readonly_fields = ('order', 'created', 'sent_at', 'attempts',
+                       'last_error')
+    ordering = ('-created',)
+
+
+class DailySalesAdmin(admin.ModelAdmin):
+    """
+    A sales dashboard in place of the change list. It reads only the
+    daily rollups, so it costs the same however many orders there are.
+    """
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        try:
+            days = int(request.GET.get('days', DEFAULT_DASHBOARD_DAYS))
+        except ValueError:
+            days = DEFAULT_DASHBOARD_DAYS
+        if days not in DASHBOARD_DAYS:
+            days = DEFAULT_DASHBOARD_DAYS
+        since = timezone.localdate() - timedelta(days=days - 1)
+
+        daily = list(
+            DailySales.objects.filter(date__gte=since).order_by('-date'))
+        totals = {
+            field: sum(getattr(day, field) for day in daily)
+            for field in DAY_FIELDS}
+        sold = DailyProductSales.objects.filter(date__gte=since)
+        top_products = sold.values('product_id').annotate(
+            name=Max('product_name'), units=Sum('units'),
+            revenue=Sum('revenue')).order_by('-revenue')[:TOP_PRODUCTS]
+        categories = sold.values(
+            'category__name', 'category__friendly_name').annotate(
+                units=Sum('units'), revenue=Sum('revenue')).order_by(
+                    '-revenue')
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': 'Sales',
+            'opts': self.model._meta,
+            'days': days,
+            'day_choices': DASHBOARD_DAYS,
+            'since': since,
+            'daily': daily,
+            'totals': totals,
+            'top_products': top_products,
+            'categories': categories,
+            **(extra_context or {}),
+        }
+        return TemplateResponse(
+            request, 'admin/checkout/dailysales/dashboard.html', context)
+
+
 admin.site.register(Order, OrderAdmin)
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
+admin.site.register(DailySales, DailySalesAdmin)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CheckoutConfig(AppConfig):
@@ -6,3 +7,6 @@ class CheckoutConfig(AppConfig):
 
     def ready(self):
         import checkout.signals
+        if settings.STRIPE_API_BASE:
+            import stripe
+            stripe.api_base = settings.STRIPE_API_BASE
@@ -0,0 +1,155 @@
+"""
+checkout/emails.py: order confirmation emails, sent through an outbox.
+
+place_order() queues the confirmation in the order's transaction, and
+the send_outbox_emails command drains the outbox in batches over one
+mail connection. Failed sends are retried with exponential backoff until
+MAX_ATTEMPTS, then marked failed.
+
+Nothing else sends the emails: the Procfile's worker process runs
+send_outbox_emails --loop, and it must be scaled up for customers to
+get their confirmations.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubling with each failed attempt
+RETRY_BASE = 30
+RETRY_MAX = 60 * 60
+
+
+def queue_confirmation_email(order):
+    """
+    Add the order's confirmation to the outbox
+    """
+    subject = render_to_string(
+        'checkout/confirmation_emails/confirmation_email_subject.txt',
+        {'order': order})
+    body = render_to_string(
+        'checkout/confirmation_emails/confirmation_email.body.txt',
+        {'order': order,
+         'contact_email': settings.DEFAULT_FROM_EMAIL})
+    return OutboxEmail.objects.create(
+        order=order,
+        to_email=order.email,
+        from_email=settings.DEFAULT_FROM_EMAIL or '',
+        # Headers cannot span lines
+        subject=' '.join(subject.split()),
+        body=body,
+    )
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait after the given number of failed attempts
+    """
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+class OutboxMetrics:
+    """
+    Counts from draining the outbox
+    """
+    def __init__(self):
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+        self.elapsed = 0.0
+
+    @property
+    def rate(self):
+        return self.sent / self.elapsed if self.elapsed else 0
+
+    def __str__(self):
+        return (
+            f'{self.sent} sent, {self.retried} to retry, {self.failed} '
+            f'failed in {self.batches} batches, {self.elapsed:.2f}s '
+            f'({self.rate:,.1f} emails/sec)')
+
+
+def _due(batch_size):
+    return list(OutboxEmail.objects.filter(
+        status=OutboxEmail.PENDING, send_after__lte=timezone.now(),
+    ).order_by('send_after', 'id')[:batch_size])
+
+
+def _record_failure(email, error, max_attempts, metrics):
+    email.attempts += 1
+    email.last_error = f'{type(error).__name__}: {error}'
+    if email.attempts >= max_attempts:
+        email.status = OutboxEmail.FAILED
+        metrics.failed += 1
+    else:
+        email.send_after = timezone.now() + timedelta(
+            seconds=retry_delay(email.attempts))
+        metrics.retried += 1
+    email.save(update_fields=[
+        'attempts', 'last_error', 'status', 'send_after'])
+
+
+def _reconnect(connection):
+    """
+    Replace a connection a failed send may have left broken
+    """
+    try:
+        connection.close()
+        connection.open()
+    except Exception:  # pylint: disable=broad-except
+        # Every send left in the batch will fail and be rescheduled
+        pass
+
+
+def _send_batch(batch, connection, max_attempts, metrics):
+    sent = []
+    for email in batch:
+        message = EmailMessage(
+            email.subject, email.body, email.from_email or None,
+            [email.to_email], connection=connection)
+        try:
+            message.send()
+        except Exception as error:  # pylint: disable=broad-except
+            _record_failure(email, error, max_attempts, metrics)
+            _reconnect(connection)
+        else:
+            sent.append(email.id)
+    OutboxEmail.objects.filter(id__in=sent).update(
+        status=OutboxEmail.SENT, sent_at=timezone.now(),
+        attempts=F('attempts') + 1)
+    metrics.sent += len(sent)
+
+
+def drain_outbox(batch_size=BATCH_SIZE, max_attempts=MAX_ATTEMPTS,
+                 connection=None):
+    """
+    Send every due email, batch by batch, over one connection opened
+    only if there is something to send. Emails that fail are
+    rescheduled rather than retried in this run. If the connection can't
+    be opened, the error is raised and the emails stay due. Meant to be
+    run by one worker at a time.
+    """
+    metrics = OutboxMetrics()
+    started = time.perf_counter()
+    # An empty outbox never connects to the mail server
+    batch = _due(batch_size)
+    if batch:
+        connection = connection or get_connection()
+        # Opening once keeps the SMTP session up for every batch
+        with connection:
+            while batch:
+                metrics.batches += 1
+                _send_batch(batch, connection, max_attempts, metrics)
+                batch = _due(batch_size)
+    metrics.elapsed = time.perf_counter() - started
+    return metrics
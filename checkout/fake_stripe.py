@@ -0,0 +1,310 @@
+"""
+checkout/fake_stripe.py: a local HTTP server that answers the Stripe
+PaymentIntent calls the checkout makes, for tests and offline runs.
+
+It keeps intents in memory and counts every call it receives. Point the
+stripe library at it with the use() context manager:
+
+    with FakeStripe() as fake, fake.use():
+        ...
+        fake.count('POST', '/v1/payment_intents')
+
+Given a webhook_url, confirming an intent sends its signed
+payment_intent.succeeded event there from a background thread, the way
+Stripe would once the customer's card is charged.
+"""
+
+import copy
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError
+from urllib.parse import parse_qsl
+from urllib.request import Request, urlopen
+
+import stripe
+
+API_VERSION = '2020-08-27'
+ADDRESS_FIELDS = (
+    'city', 'country', 'line1', 'line2', 'postal_code', 'state')
+
+
+def _parse_form(body):
+    """
+    Stripe's form encoding, with bracketed keys such as
+    shipping[address][city] gathered into nested dicts
+    """
+    params = {}
+    for key, value in parse_qsl(body, keep_blank_values=True):
+        parts = key.replace(']', '').split('[')
+        target = params
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return params
+
+
+def sign(payload, secret, timestamp=None):
+    """
+    A Stripe-Signature header for the payload, as
+    stripe.Webhook.construct_event checks it
+    """
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    digest = hmac.new(
+        secret.encode(), f'{timestamp}.{payload}'.encode(),
+        hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={digest}'
+
+
+def _address(address):
+    return {field: (address or {}).get(field, '') for field in ADDRESS_FIELDS}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    Routes requests to the FakeStripe that owns the server
+    """
+    server_version = 'FakeStripe/1.0'
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+    def _respond(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode() if length else ''
+        status, response = self.server.fake.handle(
+            method, self.path.split('?')[0], _parse_form(body))
+        self._respond(status, response)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        self._dispatch('GET')
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        self._dispatch('POST')
+
+
+class FakeStripe:
+    """
+    An in-memory Stripe serving PaymentIntent create, retrieve, modify
+    and confirm, and delivering the events confirming sends.
+
+    duplicates is how many extra copies of each event are delivered
+    alongside it, as Stripe's at-least-once delivery may.
+    """
+    PREFIX = '/v1/payment_intents'
+
+    def __init__(self, host='127.0.0.1', port=0, webhook_url=None,
+                 webhook_secret='', duplicates=0):
+        self.intents = {}
+        self.calls = []
+        self.events = []
+        # (event id, HTTP status or None, seconds) for each delivery
+        self.deliveries = []
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.duplicates = duplicates
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._senders = []
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextmanager
+    def use(self):
+        """
+        Send the stripe library's API calls here for the duration
+        """
+        saved = stripe.api_base, stripe.api_key
+        stripe.api_base = self.url
+        stripe.api_key = stripe.api_key or 'sk_test_fake'
+        try:
+            yield self
+        finally:
+            stripe.api_base, stripe.api_key = saved
+
+    def count(self, method=None, path=None):
+        """
+        How many calls matched the method and path, where given
+        """
+        with self._lock:
+            return sum(
+                1 for call_method, call_path in self.calls
+                if method in (None, call_method)
+                and path in (None, call_path))
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def confirm(self, pid, **params):
+        """
+        Pay for an intent as Stripe.js would, with shipping and
+        payment_method_data={'billing_details': ...} params
+        """
+        return self.handle('POST', f'{self.PREFIX}/{pid}/confirm', params)
+
+    def wait_for_deliveries(self, timeout=None):
+        """
+        Block until every event sent so far has been delivered
+        """
+        with self._lock:
+            senders = list(self._senders)
+        for sender in senders:
+            sender.join(timeout)
+
+    def handle(self, method, path, params):
+        """
+        Answer one API call with (status, JSON body)
+        """
+        with self._lock:
+            self.calls.append((method, path))
+            if path == self.PREFIX and method == 'POST':
+                return 200, self._create(params)
+            if path.startswith(self.PREFIX + '/'):
+                pid, _, action = path[len(self.PREFIX) + 1:].partition('/')
+                intent = self.intents.get(pid)
+                if intent is None:
+                    return 404, _error('No such payment_intent')
+                if method == 'GET' and not action:
+                    return 200, intent
+                if method == 'POST' and not action:
+                    return self._modify(intent, params)
+                if method == 'POST' and action == 'confirm':
+                    return self._confirm(intent, params)
+            return 404, _error(f'Unrecognized request URL ({path})')
+
+    def _create(self, params):
+        pid = f'pi_fake{next(self._ids):06d}'
+        intent = {
+            'id': pid,
+            'object': 'payment_intent',
+            'amount': int(params.get('amount', 0)),
+            'currency': params.get('currency', 'usd'),
+            'client_secret': f'{pid}_secret_fake',
+            'status': 'requires_payment_method',
+            'metadata': params.get('metadata', {}),
+        }
+        self.intents[pid] = intent
+        return intent
+
+    def _modify(self, intent, params):
+        if intent['status'] in ('succeeded', 'canceled'):
+            return 400, _error(
+                'This PaymentIntent could not be updated because it has a '
+                f'status of {intent["status"]}.')
+        if 'amount' in params:
+            intent['amount'] = int(params['amount'])
+        intent['metadata'].update(params.get('metadata', {}))
+        return 200, intent
+
+    def _confirm(self, intent, params):
+        if intent['status'] in ('succeeded', 'canceled'):
+            return 400, _error(
+                'You cannot confirm this PaymentIntent because it has a '
+                f'status of {intent["status"]}.')
+        shipping = params.get('shipping') or {}
+        billing_details = {
+            'email': None, 'name': None, 'phone': None,
+            **params.get('payment_method_data', {}).get(
+                'billing_details', {})}
+        billing_details['address'] = _address(billing_details.get('address'))
+        intent.update({
+            'status': 'succeeded',
+            'amount_received': intent['amount'],
+            'shipping': {
+                'name': shipping.get('name'),
+                'phone': shipping.get('phone'),
+                'address': _address(shipping.get('address')),
+            },
+            'charges': {'object': 'list', 'data': [{
+                'id': f'ch_fake{next(self._ids):06d}',
+                'object': 'charge',
+                'amount': intent['amount'],
+                'billing_details': billing_details,
+                'paid': True,
+                'payment_intent': intent['id'],
+            }]},
+        })
+        self._send(self._event('payment_intent.succeeded', intent))
+        return 200, intent
+
+    def _event(self, event_type, obj):
+        event = {
+            'id': f'evt_fake{next(self._ids):06d}',
+            'object': 'event',
+            'api_version': API_VERSION,
+            'created': int(time.time()),
+            'livemode': False,
+            'type': event_type,
+            'data': {'object': copy.deepcopy(obj)},
+        }
+        self.events.append(event)
+        return event
+
+    def _send(self, event):
+        if not self.webhook_url:
+            return
+        payload = json.dumps(event)
+        for _ in range(1 + self.duplicates):
+            sender = threading.Thread(
+                target=self._deliver, args=(event['id'], payload),
+                daemon=True)
+            self._senders.append(sender)
+            sender.start()
+
+    def _deliver(self, event_id, payload):
+        request = Request(self.webhook_url, data=payload.encode(), headers={
+            'Content-Type': 'application/json',
+            'Stripe-Signature': sign(payload, self.webhook_secret),
+        })
+        started = time.perf_counter()
+        try:
+            with urlopen(request, timeout=30) as response:
+                status = response.status
+        except HTTPError as e:
+            status = e.code
+        except OSError:
+            status = None
+        with self._lock:
+            self.deliveries.append(
+                (event_id, status, time.perf_counter() - started))
+
+
+def _error(message):
+    return {'error': {'type': 'invalid_request_error', 'message': message}}
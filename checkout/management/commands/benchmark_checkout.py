@@ -0,0 +1,263 @@
+"""
+checkout/management/commands/benchmark_checkout.py: drives concurrent
+shoppers through the checkout over HTTP against a fake Stripe, reporting
+orders per second, checkout latency and duplicate orders.
+
+Each shopper adds a product to their bag, loads the checkout, caches the
+checkout data, confirms the PaymentIntent and posts the order form. The
+fake Stripe delivers the signed payment_intent.succeeded event to
+/checkout/wh/ as soon as the intent is confirmed, so the webhook races
+the form post just as it does in production.
+
+By default the site is served from this process. To benchmark a server
+run separately, start it with STRIPE_API_BASE=http://127.0.0.1:<port>
+and a STRIPE_WH_SECRET matching this command's settings, and pass
+--base-url and --stripe-port. It must use the same database.
+
+The orders, events and product it creates are deleted afterwards.
+Deleting the orders takes them back out of the daily sales rollups, and
+the rows they leave empty are removed.
+"""
+
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.cookiejar import CookieJar
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer, WSGIRequestHandler)
+from django.core.wsgi import get_wsgi_application
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.test.utils import override_settings
+
+from checkout.fake_stripe import FakeStripe
+from checkout.models import (
+    DailyProductSales, DailySales, Order, OutboxEmail, StripeEvent)
+from products.models import Product
+
+WH_SECRET = 'whsec_benchmark'
+CLIENT_SECRET = re.compile(
+    r'<script id="id_client_secret" type="application/json">(.*?)</script>')
+SHIPPING = {
+    'name': 'Bench Shopper',
+    'phone': '123456789',
+    'address': {
+        'line1': 'Rabb Street 2', 'city': 'Stockholmsburg',
+        'postal_code': '12345', 'country': 'SE'},
+}
+EMAIL = 'shopper@example.com'
+
+
+def percentile(values, pct):
+    """
+    The nearest-rank percentile of values, or 0 if there are none
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        pass
+
+
+class Shopper:
+    """
+    One customer's cookies, carried through the checkout over HTTP
+    """
+    def __init__(self, base_url, fake):
+        self.base_url = base_url
+        self.fake = fake
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def _csrf_token(self):
+        return next((cookie.value for cookie in self.cookies
+                     if cookie.name == 'csrftoken'), '')
+
+    def _open(self, path, data=None):
+        """
+        GET or POST a page, following redirects. Returns (url, body).
+        """
+        if data is not None:
+            data = urlencode(
+                {**data, 'csrfmiddlewaretoken': self._csrf_token()}).encode()
+        with self.opener.open(
+                Request(self.base_url + path, data=data),
+                timeout=30) as response:
+            return response.geturl(), response.read().decode()
+
+    def buy(self, product_id):
+        """
+        Check out one of the product, returning the PaymentIntent id and
+        the seconds from adding it to the bag to seeing the order
+        """
+        # The product page sets the CSRF cookie
+        self._open(f'/products/{product_id}/')
+        started = time.perf_counter()
+        self._open(f'/bag/api/add/{product_id}/', {'quantity': 1})
+        _, page = self._open('/checkout/')
+        client_secret = json.loads(CLIENT_SECRET.search(page).group(1))
+        pid = client_secret.split('_secret')[0]
+        # As posted by the checkout page's script
+        self._open('/checkout/cache_checkout_data/', {
+            'client_secret': client_secret, 'save_info': 'false'})
+        status, body = self.fake.confirm(
+            pid, shipping=SHIPPING,
+            payment_method_data={'billing_details': {'email': EMAIL}})
+        if status != 200:
+            raise RuntimeError(body['error']['message'])
+        url, _ = self._open('/checkout/', {
+            'full_name': SHIPPING['name'],
+            'email': EMAIL,
+            'phone_number': SHIPPING['phone'],
+            'country': SHIPPING['address']['country'],
+            'postcode': SHIPPING['address']['postal_code'],
+            'town_or_city': SHIPPING['address']['city'],
+            'street_address1': SHIPPING['address']['line1'],
+            'street_address2': '',
+            'client_secret': client_secret,
+        })
+        if '/checkout/checkout_success/' not in url:
+            raise RuntimeError(f'Checkout ended at {url}')
+        return pid, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    """
+    Measure checkout throughput and webhook duplicates
+    """
+    help = ('Run concurrent checkouts against a fake Stripe that delivers '
+            'signed webhooks, and report orders/s, p50/p99 latency and '
+            'duplicate orders.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=50)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--duplicates', type=int, default=0,
+            help='Extra concurrent deliveries of each webhook event.')
+        parser.add_argument(
+            '--base-url',
+            help='A server to benchmark instead of serving the site here.')
+        parser.add_argument(
+            '--stripe-port', type=int, default=0,
+            help='Port for the fake Stripe; needed with --base-url.')
+
+    @contextmanager
+    def _site(self, options):
+        """
+        Yield the site's base URL and a running fake Stripe
+        """
+        if options['base_url']:
+            if not options['stripe_port'] or not settings.STRIPE_WH_SECRET:
+                raise CommandError(
+                    '--base-url needs --stripe-port and STRIPE_WH_SECRET.')
+            base_url = options['base_url'].rstrip('/')
+            with FakeStripe(
+                    port=options['stripe_port'],
+                    webhook_url=f'{base_url}/checkout/wh/',
+                    webhook_secret=settings.STRIPE_WH_SECRET,
+                    duplicates=options['duplicates']) as fake:
+                yield base_url, fake
+            return
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), _QuietHandler)
+        server.set_app(get_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        # localhost is in ALLOWED_HOSTS
+        base_url = f'http://localhost:{server.server_address[1]}'
+        try:
+            with FakeStripe(
+                    port=options['stripe_port'],
+                    webhook_url=f'{base_url}/checkout/wh/',
+                    webhook_secret=WH_SECRET,
+                    duplicates=options['duplicates']) as fake, \
+                    fake.use(), override_settings(
+                        STRIPE_SECRET_KEY='sk_test_fake',
+                        STRIPE_WH_SECRET=WH_SECRET):
+                yield base_url, fake
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def handle(self, *args, **options):
+        product = Product.objects.create(
+            name='Benchmark product', price='10.00',
+            description='Created by benchmark_checkout')
+        pids, event_ids = [], []
+        try:
+            with self._site(options) as (base_url, fake):
+                try:
+                    self._run(base_url, fake, product, options)
+                finally:
+                    pids = list(fake.intents)
+                    event_ids = [event['id'] for event in fake.events]
+        finally:
+            orders = Order.objects.filter(stripe_pid__in=pids)
+            days = set(orders.annotate(day=TruncDate('date')).values_list(
+                'day', flat=True))
+            OutboxEmail.objects.filter(order__in=orders).delete()
+            orders.delete()
+            DailyProductSales.objects.filter(product=product).delete()
+            DailySales.objects.filter(date__in=days, orders=0).delete()
+            StripeEvent.objects.filter(event_id__in=event_ids).delete()
+            product.delete()
+
+    def _run(self, base_url, fake, product, options):
+        errors = Counter()
+        pids, latencies = [], []
+
+        def checkout(_):
+            try:
+                pid, seconds = Shopper(base_url, fake).buy(product.id)
+            except Exception as e:  # pylint: disable=broad-except
+                errors[f'{type(e).__name__}: {e}'] += 1
+                return
+            pids.append(pid)
+            latencies.append(seconds)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(checkout, range(options['orders'])))
+        elapsed = time.perf_counter() - started
+        fake.wait_for_deliveries()
+
+        counts = Order.objects.filter(stripe_pid__in=pids).values(
+            'stripe_pid').annotate(orders=Count('id'))
+        duplicates = sum(row['orders'] - 1 for row in counts)
+        missing = len(pids) - len(counts)
+        statuses = Counter(status for _, status, _ in fake.deliveries)
+        statuses = ', '.join(
+            f'{status}: {count}' for status, count in statuses.items())
+        webhook_times = [seconds for _, _, seconds in fake.deliveries]
+
+        self.stdout.write(
+            f'{len(pids)} orders in {elapsed:.2f}s with '
+            f'{options["concurrency"]} shoppers: '
+            f'{len(pids) / elapsed:.1f} orders/s')
+        self.stdout.write(
+            f'Checkout latency: p50 {percentile(latencies, 50) * 1000:.0f}ms'
+            f', p99 {percentile(latencies, 99) * 1000:.0f}ms')
+        self.stdout.write(
+            f'Webhooks: {len(fake.deliveries)} delivered '
+            f'({statuses}), '
+            f'p50 {percentile(webhook_times, 50) * 1000:.0f}ms, '
+            f'p99 {percentile(webhook_times, 99) * 1000:.0f}ms')
+        self.stdout.write(
+            f'Duplicate orders: {duplicates}, missing orders: {missing}, '
+            f'failed checkouts: {sum(errors.values())}')
+        for error, count in errors.most_common(5):
+            self.stdout.write(f'  {count} x {error}')
@@ -0,0 +1,50 @@
+"""
+checkout/management/commands/process_webhooks.py: handles the Stripe
+events the webhook listener queued in STRIPE_WH_QUEUE mode.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from checkout.webhook_queue import (
+    BATCH_SIZE, MAX_ATTEMPTS, POOLS, process_queue)
+
+
+class Command(BaseCommand):
+    """
+    Work through the queued webhook events
+    """
+    help = ('Handle queued Stripe events on a thread or process pool, '
+            'keeping each PaymentIntent\'s events in order. Use --loop to '
+            'keep polling. Run one of these at a time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--pool', choices=sorted(POOLS), default='thread')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running, checking for events every --interval.')
+        parser.add_argument(
+            '--interval', type=float, default=1,
+            help='Seconds between checks with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            metrics = process_queue(
+                workers=options['workers'], pool=options['pool'],
+                batch_size=options['batch_size'],
+                max_attempts=options['max_attempts'])
+            handled = metrics.processed + metrics.retried + metrics.failed
+            if handled or not options['loop']:
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{metrics} in {elapsed:.2f}s.')
+            if not options['loop']:
+                break
+            # Wait between passes that only retried failures
+            if not metrics.processed:
+                time.sleep(options['interval'])
@@ -0,0 +1,37 @@
+"""
+checkout/management/commands/prune_stripe_events.py: deletes old entries
+from the ledger of handled Stripe webhook events.
+"""
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from checkout.models import StripeEvent
+
+# Stripe stops redelivering an event after three days
+MIN_DAYS = 3
+
+
+class Command(BaseCommand):
+    """
+    Prune the Stripe event ledger by age
+    """
+    help = ('Delete handled Stripe events received over --days ago. Keep at '
+            f'least {MIN_DAYS} days, the window Stripe redelivers in.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+
+    def handle(self, *args, **options):
+        if options['days'] < MIN_DAYS:
+            raise CommandError(
+                f'--days must be at least {MIN_DAYS}, or redelivered '
+                'events would be handled twice.')
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = StripeEvent.objects.filter(received__lt=cutoff).exclude(
+            status=StripeEvent.QUEUED).delete()
+        self.stdout.write(
+            f'Deleted {deleted} Stripe events received before '
+            f'{cutoff:%Y-%m-%d}.')
@@ -0,0 +1,76 @@
+"""
+checkout/management/commands/rebuild_sales_rollups.py: recomputes the
+daily sales rollups from the order history, a chunk of orders at a time.
+
+The rollups are emptied and the highest order id noted in one
+transaction. Orders up to that id are then summed in id order, each
+chunk in its own transaction. Orders placed while it runs have higher
+ids and are added by place_order as usual. Its progress is kept in a
+SalesRollupRebuild row, which each chunk advances: deleting an order
+the rebuild has summed takes it out of the rollups as usual, while one
+it has yet to reach is simply not summed. So no order is counted
+twice, or taken out without having been counted.
+
+A rebuild that stops part way leaves its row behind, and deletes keep
+leaving the orders it didn't reach alone until the next rebuild.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+
+from checkout.models import (
+    DailyProductSales, DailySales, Order, SalesRollupRebuild)
+from checkout.sales import add_to_rollups, sales_of
+
+CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the daily sales rollups
+    """
+    help = ('Recompute the daily sales rollups from every order, '
+            '--chunk-size orders at a time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+
+        with transaction.atomic():
+            DailyProductSales.objects.all().delete()
+            DailySales.objects.all().delete()
+            last_id = Order.objects.aggregate(last=Max('id'))['last'] or 0
+            SalesRollupRebuild.objects.all().delete()
+            rebuild = SalesRollupRebuild.objects.create(
+                next_id=1, last_id=last_id)
+
+        orders = chunks = 0
+        first_id = 1
+        while first_id <= last_id:
+            ids = list(Order.objects.filter(
+                id__gte=first_id, id__lte=last_id).order_by('id').values_list(
+                    'id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                # Locks the row, holding back deletes of the chunk's
+                # orders until it is summed
+                if not SalesRollupRebuild.objects.filter(
+                        pk=rebuild.pk).update(next_id=ids[-1] + 1):
+                    raise CommandError(
+                        'Another rebuild of the sales rollups started.')
+                add_to_rollups(*sales_of(Order.objects.filter(
+                    id__gte=ids[0], id__lte=ids[-1])))
+            orders += len(ids)
+            chunks += 1
+            first_id = ids[-1] + 1
+        rebuild.delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt the sales rollups from {orders} order(s) in '
+            f'{chunks} chunk(s), {DailySales.objects.count()} day(s).'))
@@ -0,0 +1,53 @@
+"""
+checkout/management/commands/send_outbox_emails.py: sends the queued
+order emails, once or as a long-running worker.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from checkout.emails import BATCH_SIZE, MAX_ATTEMPTS, drain_outbox
+
+
+class Command(BaseCommand):
+    """
+    Drain the email outbox
+    """
+    help = ('Send the due emails in the outbox over one mail connection, '
+            'retrying failures with backoff. Use --loop to keep polling.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS)
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running, checking for due emails every --interval.')
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Seconds between checks with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            if not options['loop']:
+                self.stdout.write(str(self._drain(options)))
+                break
+            try:
+                metrics = self._drain(options)
+            except Exception as error:  # pylint: disable=broad-except
+                # The mail server or database is down: keep the worker
+                # alive and try again after the interval
+                self.stderr.write(
+                    f'Could not send the outbox: '
+                    f'{type(error).__name__}: {error}')
+                close_old_connections()
+            else:
+                if metrics.batches:
+                    self.stdout.write(str(metrics))
+            time.sleep(options['interval'])
+
+    def _drain(self, options):
+        return drain_outbox(
+            batch_size=options['batch_size'],
+            max_attempts=options['max_attempts'])
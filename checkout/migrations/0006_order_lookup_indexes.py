@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0005_order_user_profile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(editable=False, max_length=32, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='stripe_pid',
+            field=models.CharField(db_index=True, default='', max_length=254),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0006_order_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(_negated=True, stripe_pid=''), fields=('stripe_pid',), name='unique_order_stripe_pid'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0009_stripeevent'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='stripeevent',
+            old_name='processed',
+            new_name='received',
+        ),
+        migrations.AddField(
+            model_name='stripeevent',
+            name='attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='stripeevent',
+            name='last_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='stripeevent',
+            name='payload',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='stripeevent',
+            name='payment_intent',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='stripeevent',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('processed', 'Processed'), ('failed', 'Failed')], default='processed', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='stripeevent',
+            index=models.Index(fields=['status', 'id'], name='stripe_event_queue_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2 on 2026-10-18 12:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 500
+
+
+def snapshot_products(apps, schema_editor):
+    """
+    Copy each line item's product onto it. The unit price is the price
+    paid, taken from the line total, rather than today's price.
+    """
+    OrderLineItem = apps.get_model('checkout', 'OrderLineItem')
+    lineitems = OrderLineItem.objects.filter(
+        product__isnull=False).select_related('product').order_by('id')
+    last_id = 0
+    while True:
+        batch = list(lineitems.filter(id__gt=last_id)[:BATCH_SIZE])
+        if not batch:
+            break
+        for lineitem in batch:
+            product = lineitem.product
+            lineitem.product_name = product.name
+            lineitem.product_sku = product.sku
+            lineitem.product_image = product.image.name or product.image_url
+            lineitem.unit_price = (
+                lineitem.lineitem_total / lineitem.quantity
+                if lineitem.quantity else product.price)
+        OrderLineItem.objects.bulk_update(batch, [
+            'product_name', 'product_sku', 'product_image', 'unit_price'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_version'),
+        ('checkout', '0010_stripeevent_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderlineitem',
+            name='product_image',
+            field=models.CharField(blank=True, max_length=1024, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderlineitem',
+            name='product_name',
+            field=models.CharField(blank=True, default='', max_length=254),
+        ),
+        migrations.AddField(
+            model_name='orderlineitem',
+            name='product_sku',
+            field=models.CharField(blank=True, max_length=254, null=True),
+        ),
+        migrations.AddField(
+            model_name='orderlineitem',
+            name='unit_price',
+            field=models.DecimalField(
+                decimal_places=2, default=0, max_digits=6),
+        ),
+        migrations.AlterField(
+            model_name='orderlineitem',
+            name='product',
+            field=models.ForeignKey(
+                blank=True, null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                to='products.product'),
+        ),
+        migrations.RunPython(snapshot_products, migrations.RunPython.noop),
+    ]
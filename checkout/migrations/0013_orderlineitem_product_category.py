@@ -0,0 +1,37 @@
+# Generated by Django 3.2 on 2026-10-18 14:10
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+def snapshot_categories(apps, schema_editor):
+    """
+    Copy each line item's product category onto it. Earlier categories
+    weren't kept, so existing line items get their product's current one.
+    """
+    OrderLineItem = apps.get_model('checkout', 'OrderLineItem')
+    Product = apps.get_model('products', 'Product')
+    OrderLineItem.objects.filter(product__isnull=False).update(
+        product_category=Subquery(Product.objects.filter(
+            pk=OuterRef('product_id')).values('category_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_product_version'),
+        ('checkout', '0012_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderlineitem',
+            name='product_category',
+            field=models.ForeignKey(
+                blank=True, null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='+', to='products.category'),
+        ),
+        migrations.RunPython(snapshot_categories, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-18 15:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0013_orderlineitem_product_category'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stripeevent',
+            name='retry_after',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
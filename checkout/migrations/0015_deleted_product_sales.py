@@ -0,0 +1,38 @@
+# Generated by Django 3.2 on 2026-10-18 11:43
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def merge_deleted_product_sales(apps, schema_editor):
+    """
+    Merge the rows each deleted product kept into one row a day
+    """
+    DailyProductSales = apps.get_model('checkout', 'DailyProductSales')
+    deleted = DailyProductSales.objects.filter(product__isnull=True)
+    days = deleted.values('date').annotate(
+        rows=Count('id'), units_sum=Sum('units'),
+        revenue_sum=Sum('revenue')).filter(rows__gt=1)
+    for day in days:
+        rows = deleted.filter(date=day['date']).order_by('id')
+        kept = rows.first()
+        rows.exclude(pk=kept.pk).delete()
+        DailyProductSales.objects.filter(pk=kept.pk).update(
+            units=day['units_sum'], revenue=day['revenue_sum'])
+    deleted.update(product_name='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0014_stripeevent_retry_after'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_deleted_product_sales, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='dailyproductsales',
+            constraint=models.UniqueConstraint(condition=models.Q(product__isnull=True), fields=('date',), name='unique_daily_deleted_product_sales'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0015_deleted_product_sales'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalesRollupRebuild',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_id', models.BigIntegerField()),
+                ('last_id', models.BigIntegerField()),
+            ],
+        ),
+    ]
@@ -7,9 +7,10 @@ import uuid
 
 from django.db import models
 from django.db.models import Sum
+from django.utils import timezone
 from django.conf import settings
 from django_countries.fields import CountryField
-from products.models import Product
+from products.models import Category, Product
 from profiles.models import UserProfile
 
 
@@ -17,7 +18,8 @@ class Order(models.Model):
     """
     Model to save a purchase instance with user info and the items purchased.
     """
-    order_number = models.CharField(max_length=32, null=False, editable=False)
+    order_number = models.CharField(
+        max_length=32, null=False, editable=False, unique=True)
     user_profile = models.ForeignKey(
         UserProfile, on_delete=models.SET_NULL,
         null=True, blank=True, related_name='orders')
@@ -39,7 +41,16 @@ class Order(models.Model):
     original_bag = models.TextField(
         null=False, blank=False, default='')
     stripe_pid = models.CharField(
-        max_length=254, null=False, blank=False, default='')
+        max_length=254, null=False, blank=False, default='', db_index=True)
+
+    class Meta:
+        constraints = [
+            # One order per PaymentIntent, so the checkout view and the
+            # webhook cannot both create it
+            models.UniqueConstraint(
+                fields=['stripe_pid'], condition=~models.Q(stripe_pid=''),
+                name='unique_order_stripe_pid'),
+        ]
 
     def _generate_order_number(self):
         """
@@ -47,20 +58,24 @@ class Order(models.Model):
         """
         return uuid.uuid4().hex.upper()
 
-    def update_total(self):
+    def update_total(self, order_total=None):
         """
         Update grand total each time a line item is added,
-        accounting for delivery costs.
+        accounting for delivery costs. Callers that already know the
+        sum of the line items can pass it in to skip the aggregate.
         """
-        self.order_total = self.lineitems.aggregate(
-            Sum('lineitem_total'))['lineitem_total__sum'] or 0
+        if order_total is None:
+            order_total = self.lineitems.aggregate(
+                Sum('lineitem_total'))['lineitem_total__sum'] or 0
+        self.order_total = order_total
         if self.order_total < settings.FREE_DELIVERY_THRESHOLD:
             self.delivery_cost = (
                 self.order_total * settings.STANDARD_DELIVERY_PERCENTAGE / 100)
         else:
             self.delivery_cost = 0
         self.grand_total = self.order_total + self.delivery_cost
-        self.save()
+        self.save(update_fields=[
+            'order_total', 'delivery_cost', 'grand_total'])
 
     def save(self, *args, **kwargs):
         """
@@ -76,26 +91,203 @@ class Order(models.Model):
 
 
 class OrderLineItem(models.Model):
+    """
+    A product bought on an order. The product's details are copied onto
+    the line item when it is bought, so the order reads the same after
+    the product is edited or deleted, and shows without loading it.
+    """
     order = models.ForeignKey(
         Order, null=False, blank=False,
         on_delete=models.CASCADE, related_name='lineitems')
     product = models.ForeignKey(
-        Product, null=False, blank=False, on_delete=models.CASCADE)
+        Product, null=True, blank=True, on_delete=models.SET_NULL)
+    product_name = models.CharField(
+        max_length=254, null=False, blank=True, default='')
+    product_sku = models.CharField(max_length=254, null=True, blank=True)
+    # The image's storage path, or the URL of an externally hosted image
+    product_image = models.CharField(max_length=1024, null=True, blank=True)
+    product_category = models.ForeignKey(
+        Category, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='+')
+    unit_price = models.DecimalField(
+        max_digits=6, decimal_places=2, null=False, default=0)
     quantity = models.IntegerField(
         null=False, blank=False, default=0)
     lineitem_total = models.DecimalField(
         max_digits=6, decimal_places=2,
         null=False, blank=False, editable=False)
 
+    def snapshot_product(self, product):
+        """
+        Set the product and copy its details onto the line item
+        """
+        self.product = product
+        self.product_name = product.name
+        self.product_sku = product.sku
+        self.product_image = product.image.name or product.image_url
+        self.product_category_id = product.category_id
+        self.unit_price = product.price
+
     def save(self, *args, **kwargs):
         """
-        Override the original save method to set the lineitem total
-        and update the order total.
+        Override the original save method to snapshot the product on new
+        line items and set the lineitem total.
         """
-        # pylint: disable=maybe-no-member
-        self.lineitem_total = self.product.price * self.quantity
+        if self._state.adding and self.product_id and not self.product_name:
+            self.snapshot_product(self.product)
+        self.lineitem_total = self.unit_price * self.quantity
         super().save(*args, **kwargs)
 
     def __str__(self):
         # pylint: disable=maybe-no-member
-        return f'SKU {self.product.sku} on order {self.order.order_number}'
+        return f'SKU {self.product_sku} on order {self.order.order_number}'
+
+
+class OutboxEmail(models.Model):
+    """
+    An email waiting to be sent by the send_outbox_emails command.
+    Written in the same transaction as the order it is about, so an
+    order never commits without its confirmation, or the other way round.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    order = models.ForeignKey(
+        Order, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='emails')
+    to_email = models.EmailField(max_length=254)
+    from_email = models.EmailField(max_length=254, blank=True, default='')
+    subject = models.CharField(max_length=254)
+    body = models.TextField()
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    created = models.DateTimeField(auto_now_add=True)
+    send_after = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            # The worker's queue: pending emails that are due
+            models.Index(fields=['status', 'send_after'],
+                         name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.subject} to {self.to_email} ({self.status})'
+
+
+class StripeEvent(models.Model):
+    """
+    A Stripe webhook event that has been received, so redeliveries of it
+    can be answered without handling it again. Events accepted in queue
+    mode wait here, with their payload, for the process_webhooks worker.
+    """
+    QUEUED = 'queued'
+    PROCESSED = 'processed'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (PROCESSED, 'Processed'),
+        (FAILED, 'Failed'),
+    )
+
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    received = models.DateTimeField(default=timezone.now, db_index=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PROCESSED)
+    # The PaymentIntent the event is about, so the worker can keep each
+    # intent's events in order
+    payment_intent = models.CharField(max_length=255, blank=True, default='')
+    payload = models.TextField(blank=True, default='')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    # A failed queued event waits until then before it is tried again
+    retry_after = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'id'], name='stripe_event_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.event_type} {self.event_id}'
+
+
+class DailySales(models.Model):
+    """
+    One day's order totals, added to as each order is placed, so sales
+    reports read a row per day instead of every order. Kept by
+    checkout/sales.py and recomputed by rebuild_sales_rollups.
+    """
+    date = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    delivery = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily sales'
+
+    def __str__(self):
+        return f'Sales on {self.date}'
+
+
+class DailyProductSales(models.Model):
+    """
+    One day's sales of one product, with the product's name and category
+    as its line items recorded them when it sold
+    """
+    date = models.DateField()
+    product = models.ForeignKey(
+        Product, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='+')
+    product_name = models.CharField(max_length=254, blank=True, default='')
+    category = models.ForeignKey(
+        Category, null=True, blank=True, on_delete=models.SET_NULL,
+        related_name='+')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily product sales'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'product'],
+                condition=models.Q(product__isnull=False),
+                name='unique_daily_product_sales'),
+            # Sales of deleted products share one row a day, under no
+            # product (see fold_deleted_product)
+            models.UniqueConstraint(
+                fields=['date'], condition=models.Q(product__isnull=True),
+                name='unique_daily_deleted_product_sales'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='daily_product_sales_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_name} on {self.date}'
+
+
+class SalesRollupRebuild(models.Model):
+    """
+    A rebuild_sales_rollups run in progress. Orders from next_id to
+    last_id have not been summed into the rollups yet, so deleting one
+    of them leaves the rollups alone.
+    """
+    next_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+
+    def __str__(self):
+        return f'Rebuilding orders {self.next_id} to {self.last_id}'
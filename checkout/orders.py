@@ -0,0 +1,127 @@
+"""
+checkout/orders.py: builds an order and its line items from a bag.
+
+Used by both the checkout view and the Stripe webhook. The products are
+loaded with one query, the line items inserted with one bulk insert and
+the order totals written once, all in one transaction. bulk_create skips
+the line item post_save signal, so the totals are not recomputed per line.
+Each line item keeps a copy of its product's name, SKU, price and image.
+The confirmation email is queued in the same transaction.
+
+Orders are unique per Stripe PaymentIntent, so whichever of the view and
+the webhook gets there second picks up the order the other created.
+
+A profile's order count and lifetime spend are kept up to date here as
+orders are placed for it or attached to it, and each order is added to
+the daily sales rollups in its transaction.
+"""
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from products.models import Product
+from profiles.models import UserProfile
+from .emails import queue_confirmation_email
+from .models import Order, OrderLineItem
+from .sales import add_to_rollups, order_sales
+
+
+def _bag_lines(bag):
+    """
+    (item id, quantity) pairs for a bag, including the older sized
+    lines that map sizes to quantities
+    """
+    for item_id, item_data in bag.items():
+        if isinstance(item_data, int):
+            yield item_id, item_data
+        else:
+            for quantity in item_data.values():
+                yield item_id, quantity
+
+
+def place_order(order, bag):
+    """
+    Save the unsaved order with a line item per bag line, its totals
+    and its confirmation email. Raises Product.DoesNotExist, saving
+    nothing, if a product in the bag no longer exists.
+    """
+    lines = list(_bag_lines(bag))
+    with transaction.atomic():
+        order.save()
+        products = Product.objects.only(
+            'id', 'name', 'sku', 'price', 'image', 'image_url',
+            'category').in_bulk(
+                {int(item_id) for item_id, _ in lines})
+
+        lineitems = []
+        order_total = 0
+        for item_id, quantity in lines:
+            product = products.get(int(item_id))
+            if product is None:
+                raise Product.DoesNotExist(
+                    f'Product {item_id} in the bag does not exist.')
+            lineitem = OrderLineItem(
+                order=order, quantity=quantity,
+                lineitem_total=product.price * quantity)
+            lineitem.snapshot_product(product)
+            order_total += lineitem.lineitem_total
+            lineitems.append(lineitem)
+
+        OrderLineItem.objects.bulk_create(lineitems)
+        order.update_total(order_total)
+        if order.user_profile_id is not None:
+            add_to_order_summary(order.user_profile_id, 1, order.grand_total)
+        add_to_rollups(*order_sales(order, lineitems))
+        queue_confirmation_email(order)
+    return order
+
+
+def add_to_order_summary(profile_id, orders, spend):
+    """
+    Add to, or with negative numbers take from, a profile's order
+    count and lifetime spend. Neither goes below zero, so orders the
+    summary missed, such as bulk inserts, can still be deleted;
+    rebuild_order_summaries puts such drift right.
+    """
+    UserProfile.objects.filter(pk=profile_id).update(
+        order_count=Greatest(F('order_count') + orders, 0),
+        lifetime_spend=Greatest(F('lifetime_spend') + spend, 0))
+
+
+def attach_order(order, profile):
+    """
+    Link a placed order to a profile, moving its total into the profile's
+    summary. Returns whether it moved: nothing happens if it already
+    belongs to the profile, or a concurrent request moved it first.
+    """
+    previous = order.user_profile_id
+    if previous == profile.id:
+        return False
+    # Nothing here needs a partial rollback, so join any outer
+    # transaction rather than setting a savepoint
+    with transaction.atomic(savepoint=False):
+        moved = Order.objects.filter(
+            pk=order.pk, user_profile_id=previous).update(user_profile=profile)
+        if not moved:
+            return False
+        if previous is not None:
+            add_to_order_summary(previous, -1, -order.grand_total)
+        add_to_order_summary(profile.id, 1, order.grand_total)
+    order.user_profile = profile
+    return True
+
+
+def get_or_place_order(order, bag):
+    """
+    The order already placed for order.stripe_pid, or the given order
+    placed now, with whether it was created. Safe to call concurrently:
+    the unique stripe_pid constraint lets only one caller create it.
+    """
+    existing = Order.objects.filter(stripe_pid=order.stripe_pid).first()
+    if existing is not None:
+        return existing, False
+    try:
+        return place_order(order, bag), True
+    except IntegrityError:
+        return Order.objects.get(stripe_pid=order.stripe_pid), False
@@ -0,0 +1,112 @@
+"""
+checkout/payments.py: one Stripe PaymentIntent per checkout session.
+
+The intent's id and client secret are kept in the session with a hash of
+the bag and the amount charged. Reloading the checkout page with the same
+bag reuses the intent without calling Stripe; a changed bag only calls
+Stripe if the amount changed, and then modifies the intent in place
+rather than leaving it orphaned.
+
+Once the page has started confirming the intent, the next visit asks
+Stripe for its status, and replaces it if it has succeeded or been
+canceled. Placing the order forgets it.
+"""
+
+import hashlib
+import json
+
+import stripe
+from django.conf import settings
+
+INTENT_SESSION_KEY = 'checkout_intent'
+# Statuses after which an intent can no longer take a payment
+FINISHED_STATUSES = ('succeeded', 'canceled')
+
+
+def bag_hash(bag):
+    """
+    A stable fingerprint of the bag's lines and quantities
+    """
+    return hashlib.sha256(
+        json.dumps(bag, sort_keys=True).encode()).hexdigest()
+
+
+def _store(request, intent, bag, amount):
+    request.session[INTENT_SESSION_KEY] = {
+        'id': intent.id,
+        'client_secret': intent.client_secret,
+        'bag_hash': bag_hash(bag),
+        'amount': amount,
+    }
+    return intent.client_secret
+
+
+def _check_status(request, stored):
+    """
+    The stored intent if it can still take a payment, or None
+    """
+    intent = stripe.PaymentIntent.retrieve(stored['id'])
+    if intent.status in FINISHED_STATUSES:
+        forget_intent(request)
+        return None
+    if intent.status == 'requires_payment_method':
+        # The payment failed, and the customer can try again with it
+        del stored['confirming']
+        request.session[INTENT_SESSION_KEY] = stored
+    return stored
+
+
+def get_client_secret(request, bag, amount):
+    """
+    The client secret of this session's PaymentIntent for the bag,
+    creating or updating the intent only when needed
+    """
+    stored = request.session.get(INTENT_SESSION_KEY)
+    stripe.api_key = settings.STRIPE_SECRET_KEY
+    if stored and stored.get('confirming'):
+        stored = _check_status(request, stored)
+    if stored:
+        if stored['bag_hash'] == bag_hash(bag) and stored['amount'] == amount:
+            return stored['client_secret']
+        if stored['amount'] == amount:
+            stored['bag_hash'] = bag_hash(bag)
+            request.session[INTENT_SESSION_KEY] = stored
+            return stored['client_secret']
+        try:
+            intent = stripe.PaymentIntent.modify(stored['id'], amount=amount)
+            return _store(request, intent, bag, amount)
+        except stripe.error.InvalidRequestError:
+            # The intent has succeeded or been cancelled since
+            pass
+
+    intent = stripe.PaymentIntent.create(
+        amount=amount,
+        currency=settings.STRIPE_CURRENCY,
+    )
+    return _store(request, intent, bag, amount)
+
+
+def stored_client_secret(request):
+    """
+    The client secret of this session's PaymentIntent, if it has one
+    """
+    stored = request.session.get(INTENT_SESSION_KEY)
+    return stored['client_secret'] if stored else None
+
+
+def mark_confirming(request, pid):
+    """
+    Note that the page is confirming the session's intent, so the next
+    visit checks whether it was paid
+    """
+    stored = request.session.get(INTENT_SESSION_KEY)
+    if stored and stored['id'] == pid:
+        stored['confirming'] = True
+        request.session[INTENT_SESSION_KEY] = stored
+
+
+def forget_intent(request):
+    """
+    Stop reusing the session's PaymentIntent, once it has paid for an order
+    """
+    request.session.pop(INTENT_SESSION_KEY, None)
@@ -0,0 +1,218 @@
+"""
+checkout/sales.py: the daily sales rollups behind the sales dashboard.
+
+place_order adds each order to its day's DailySales row and to a
+DailyProductSales row per product, in the order's own transaction.
+Existing rows are bumped with F() updates, so concurrent orders on the
+same day add up rather than overwrite each other. A row that does not
+exist yet is inserted, and if a concurrent order inserted it first the
+update is retried. Deleting an order takes it back out (see
+checkout/signals.py), and the admin cannot edit line items. Deleting a
+product folds its rows into each day's single row for deleted products,
+where sales_of sums their line items too.
+
+Orders changed any other way, such as by queryset updates or raw SQL,
+leave the rollups behind; rebuild_sales_rollups recomputes them from
+the order history in chunks, summing each chunk in the database with
+sales_of.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+
+from .models import (
+    DailyProductSales, DailySales, OrderLineItem, SalesRollupRebuild)
+
+DAY_FIELDS = ('orders', 'units', 'revenue', 'delivery')
+PRODUCT_FIELDS = ('units', 'revenue')
+
+
+def day_totals():
+    """
+    A day with nothing sold, to add an order's or a chunk's totals to
+    """
+    return {'orders': 0, 'units': 0, 'revenue': Decimal('0.00'),
+            'delivery': Decimal('0.00')}
+
+
+def _product_totals():
+    return {'units': 0, 'revenue': Decimal('0.00'), 'product_name': '',
+            'category_id': None}
+
+
+def order_sales(order, lineitems):
+    """
+    The rollup increments for one placed order: ({date: totals},
+    {(date, product id): totals})
+    """
+    day = timezone.localdate(order.date)
+    days = defaultdict(day_totals)
+    sold = defaultdict(_product_totals)
+    days[day].update(
+        orders=1, revenue=order.order_total, delivery=order.delivery_cost)
+    for lineitem in lineitems:
+        days[day]['units'] += lineitem.quantity
+        totals = sold[(day, lineitem.product_id)]
+        totals['units'] += lineitem.quantity
+        totals['revenue'] += lineitem.lineitem_total
+        totals['product_name'] = lineitem.product_name
+        totals['category_id'] = lineitem.product_category_id
+    return days, sold
+
+
+def sales_of(orders):
+    """
+    The rollup increments for a queryset of placed orders, in the same
+    form as order_sales, summed by the database
+    """
+    days = defaultdict(day_totals)
+    for row in orders.annotate(day=TruncDate('date')).values('day').annotate(
+            orders_count=Count('id'), revenue_sum=Sum('order_total'),
+            delivery_sum=Sum('delivery_cost')):
+        days[row['day']].update(
+            orders=row['orders_count'], revenue=row['revenue_sum'],
+            delivery=row['delivery_sum'])
+
+    sold = {}
+    lineitems = OrderLineItem.objects.filter(order__in=orders)
+    for row in lineitems.annotate(day=TruncDate('order__date')).values(
+            'day', 'product_id').annotate(
+                units_sum=Sum('quantity'), revenue_sum=Sum('lineitem_total'),
+                name=Max('product_name'),
+                category_id=Max('product_category_id')):
+        days[row['day']]['units'] += row['units_sum']
+        sold[(row['day'], row['product_id'])] = {
+            'units': row['units_sum'], 'revenue': row['revenue_sum'],
+            # Deleted products share one row, under no name
+            'product_name': row['name'] if row['product_id'] else '',
+            'category_id': row['category_id']}
+    return days, sold
+
+
+def _add_to_day(day, totals):
+    increments = {
+        field: F(field) + totals[field] for field in DAY_FIELDS}
+    if DailySales.objects.filter(date=day).update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            DailySales.objects.create(date=day, **totals)
+    except IntegrityError:
+        # A concurrent order created the day's row first
+        DailySales.objects.filter(date=day).update(**increments)
+
+
+def _add_to_products(sold):
+    """
+    Add to the product rows that exist with one bulk update, and insert
+    the rest with one bulk insert
+    """
+    dates = {day for day, _ in sold}
+    product_ids = {product_id for _, product_id in sold}
+    match = Q(product_id__in=product_ids - {None})
+    if None in product_ids:
+        match |= Q(product__isnull=True)
+    existing = {
+        (row.date, row.product_id): row
+        for row in DailyProductSales.objects.filter(
+            match, date__in=dates).only('id', 'date', 'product_id')}
+
+    updated = [row for key, row in existing.items() if key in sold]
+    for row in updated:
+        for field in PRODUCT_FIELDS:
+            setattr(row, field,
+                    F(field) + sold[(row.date, row.product_id)][field])
+    if updated:
+        DailyProductSales.objects.bulk_update(updated, PRODUCT_FIELDS)
+
+    new = {key: totals for key, totals in sold.items() if key not in existing}
+    if not new:
+        return
+    try:
+        with transaction.atomic():
+            DailyProductSales.objects.bulk_create([
+                DailyProductSales(date=day, product_id=product_id, **totals)
+                for (day, product_id), totals in new.items()])
+    except IntegrityError:
+        # A concurrent order inserted some of them; they all exist now
+        _add_to_products(new)
+
+
+def add_to_rollups(days, sold):
+    """
+    Add day totals and product totals, as returned by order_sales, to
+    the rollups
+    """
+    for day, totals in days.items():
+        _add_to_day(day, totals)
+    if sold:
+        _add_to_products(sold)
+
+
+def in_rollups(order_id):
+    """
+    Whether an order being deleted has been summed into the rollups, or
+    is still waiting for a running rebuild to reach it. The rebuild's
+    row is locked, as each of its chunks locks it, so the delete happens
+    wholly before or after a chunk: never while the chunk is summing it.
+    """
+    rebuild = SalesRollupRebuild.objects.select_for_update().first()
+    return (rebuild is None
+            or not rebuild.next_id <= order_id <= rebuild.last_id)
+
+
+def remove_from_rollups(days, sold):
+    """
+    Take day and product totals, as returned by sales_of, back out of
+    the rollups. Rows are lowered but never below zero, and missing rows
+    are left missing, so orders placed before the rollups existed can be
+    deleted too.
+    """
+    for day, totals in days.items():
+        DailySales.objects.filter(date=day).update(**{
+            field: Greatest(F(field) - totals[field], 0)
+            for field in DAY_FIELDS})
+    for (day, product_id), totals in sold.items():
+        rows = DailyProductSales.objects.filter(date=day)
+        if product_id is None:
+            rows = rows.filter(product__isnull=True)
+        else:
+            rows = rows.filter(product_id=product_id)
+        rows.update(**{
+            field: Greatest(F(field) - totals[field], 0)
+            for field in PRODUCT_FIELDS})
+
+
+def fold_deleted_product(product_id):
+    """
+    Move a product that is being deleted into each day's row for deleted
+    products: added to the day's row if it has one, or becoming it if
+    not. Left to SET_NULL, every deleted product would keep a row of its
+    own, and an order of one of them could not tell which to come out of.
+    """
+    rows = {
+        row.date: row
+        for row in DailyProductSales.objects.filter(product_id=product_id)}
+    if not rows:
+        return
+    deleted = list(DailyProductSales.objects.filter(
+        product__isnull=True, date__in=rows))
+    for row in deleted:
+        for field in PRODUCT_FIELDS:
+            setattr(row, field, F(field) + getattr(rows[row.date], field))
+    try:
+        with transaction.atomic():
+            if deleted:
+                DailyProductSales.objects.bulk_update(deleted, PRODUCT_FIELDS)
+                DailyProductSales.objects.filter(
+                    pk__in=[rows[row.date].pk for row in deleted]).delete()
+            DailyProductSales.objects.filter(product_id=product_id).update(
+                product=None, product_name='')
+    except IntegrityError:
+        # A concurrent delete gave one of the days its row first
+        fold_deleted_product(product_id)
@@ -1,8 +1,12 @@
 
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 
-from .models import OrderLineItem
+from products.models import Product
+from .models import Order, OrderLineItem
+from .orders import add_to_order_summary
+from .sales import (
+    fold_deleted_product, in_rollups, remove_from_rollups, sales_of)
 
 
 @receiver(post_save, sender=OrderLineItem)
@@ -19,3 +23,34 @@ def update_on_delete(sender, instance, **kwargs):
     Update order total on lineitem delete
     """
     instance.order.update_total()
+
+
+@receiver(post_delete, sender=Order)
+def remove_from_order_summary(sender, instance, **kwargs):
+    """
+    Take a deleted order out of its profile's order summary
+    """
+    if instance.user_profile_id is not None:
+        add_to_order_summary(
+            instance.user_profile_id, -1, -instance.grand_total)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_from_sales_rollups(sender, instance, **kwargs):
+    """
+    Take a deleted order out of the daily sales rollups. This runs
+    before the delete, while its line items are still there to sum, and
+    in the same transaction. An order a running rebuild has yet to sum
+    is not in them to take out.
+    """
+    if in_rollups(instance.pk):
+        remove_from_rollups(*sales_of(Order.objects.filter(pk=instance.pk)))
+
+
+@receiver(pre_delete, sender=Product)
+def fold_into_deleted_products(sender, instance, **kwargs):
+    """
+    Move a deleted product's daily sales into the rows for deleted
+    products, before SET_NULL leaves them under no product
+    """
+    fold_deleted_product(instance.pk)
@@ -0,0 +1,168 @@
+"""
+checkout/test_emails.py: Contains testing of the order email outbox.
+"""
+# pylint: disable=no-member
+
+from io import StringIO
+from unittest import mock
+
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from checkout.emails import drain_outbox, retry_delay
+from checkout.models import OutboxEmail
+from checkout.orders import place_order
+from checkout.testing import new_order
+from products.models import Product
+
+
+class CountingBackend(EmailBackend):
+    """
+    The locmem backend, counting connections and failing for one address
+    """
+    def __init__(self, *args, fail_for=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = 0
+        self.fail_for = fail_for
+
+    def open(self):
+        self.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        for message in messages:
+            if self.fail_for in message.to:
+                raise ConnectionError('Mail server went away')
+        return super().send_messages(messages)
+
+
+class DownBackend(EmailBackend):
+    """
+    The locmem backend, unable to connect while down is set
+    """
+    down = True
+
+    def open(self):
+        if DownBackend.down:
+            raise ConnectionRefusedError('Mail server is down')
+        return super().open()
+
+
+class StopWorker(Exception):
+    pass
+
+
+class TestEmailOutbox(TestCase):
+    """
+    Tests queueing and sending the order confirmation
+    """
+    def setUp(self):
+        """
+        Create a product
+        """
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+
+    def place(self, email='test_email@gmail.com'):
+        return place_order(new_order(email=email), {str(self.mouse.id): 1})
+
+    def test_order_queues_its_confirmation(self):
+        """
+        Placing an order queues the email without sending it
+        """
+        order = self.place()
+        email = OutboxEmail.objects.get(order=order)
+        self.assertEqual(email.status, OutboxEmail.PENDING)
+        self.assertIn(order.order_number, email.subject)
+        self.assertIn('€10.5', email.body)
+        self.assertEqual(mail.outbox, [])
+
+    def test_drain_sends_batches_over_one_connection(self):
+        """
+        Every due email goes out, in several batches, on one connection
+        """
+        for i in range(5):
+            self.place(f'customer{i}@example.com')
+        connection = CountingBackend()
+        metrics = drain_outbox(batch_size=2, connection=connection)
+        self.assertEqual(metrics.sent, 5)
+        self.assertEqual(metrics.batches, 3)
+        self.assertEqual(connection.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertFalse(OutboxEmail.objects.exclude(
+            status=OutboxEmail.SENT).exists())
+
+    def test_failures_back_off_then_give_up(self):
+        """
+        A failed send is rescheduled with backoff, and marked failed
+        after the last attempt
+        """
+        self.place('bounce@example.com')
+        self.place()
+        metrics = drain_outbox(
+            max_attempts=2,
+            connection=CountingBackend(fail_for='bounce@example.com'))
+        self.assertEqual((metrics.sent, metrics.retried), (1, 1))
+        email = OutboxEmail.objects.get(to_email='bounce@example.com')
+        self.assertEqual(email.attempts, 1)
+        self.assertIn('Mail server went away', email.last_error)
+        self.assertGreater(email.send_after, timezone.now())
+        self.assertEqual(retry_delay(2), 2 * retry_delay(1))
+
+        OutboxEmail.objects.filter(pk=email.pk).update(
+            send_after=timezone.now())
+        metrics = drain_outbox(
+            max_attempts=2,
+            connection=CountingBackend(fail_for='bounce@example.com'))
+        self.assertEqual(metrics.failed, 1)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxEmail.FAILED)
+
+    def test_command_reports_metrics(self):
+        """
+        The worker command sends the outbox and reports what it did
+        """
+        self.place()
+        out = StringIO()
+        call_command('send_outbox_emails', stdout=out)
+        self.assertIn('1 sent', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_empty_outbox_opens_no_connection(self):
+        """
+        With nothing due, the mail server is not contacted
+        """
+        connection = CountingBackend()
+        metrics = drain_outbox(connection=connection)
+        self.assertEqual((metrics.batches, connection.opened), (0, 0))
+
+    @override_settings(
+        EMAIL_BACKEND='checkout.test_emails.DownBackend')
+    def test_worker_survives_a_mail_server_outage(self):
+        """
+        The looping worker reports a failed connection, waits and sends
+        the email once the server is back, without using up its attempts
+        """
+        self.place()
+        DownBackend.down = True
+        self.addCleanup(setattr, DownBackend, 'down', True)
+
+        def sleep(seconds):
+            if DownBackend.down:
+                DownBackend.down = False
+            else:
+                raise StopWorker
+
+        err = StringIO()
+        with mock.patch(
+                'checkout.management.commands.send_outbox_emails.time.sleep',
+                side_effect=sleep), self.assertRaises(StopWorker):
+            call_command(
+                'send_outbox_emails', loop=True, stdout=StringIO(),
+                stderr=err)
+        self.assertIn('Mail server is down', err.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(OutboxEmail.objects.get().attempts, 1)
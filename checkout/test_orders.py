@@ -0,0 +1,248 @@
+"""
+checkout/test_orders.py: Contains testing of building orders from a bag.
+"""
+# pylint: disable=no-member
+
+import json
+import threading
+from decimal import Decimal
+from unittest import mock
+
+import stripe
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+
+from checkout import orders
+from checkout.models import Order, OrderLineItem
+from checkout.orders import get_or_place_order, place_order
+from checkout.testing import new_order
+from checkout.webhook_handler import StripeWH_Handler
+from products.models import Product
+
+
+class TestPlaceOrder(TestCase):
+    """
+    Tests place_order
+    """
+    def setUp(self):
+        """
+        Create two products
+        """
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        self.chair = Product.objects.create(
+            name='Chair', price='100.00', description='Test Description')
+
+    def test_lines_and_totals(self):
+        """
+        Each line is priced and the totals include delivery
+        """
+        order = place_order(new_order(), {
+            str(self.mouse.id): 3, str(self.chair.id): {'m': 1, 'l': 2}})
+        self.assertEqual(order.lineitems.count(), 3)
+        self.assertEqual(
+            sorted(order.lineitems.values_list('lineitem_total', flat=True)),
+            [Decimal('30.00'), Decimal('100.00'), Decimal('200.00')])
+        order.refresh_from_db()
+        self.assertEqual(order.order_total, Decimal('330.00'))
+        self.assertEqual(order.delivery_cost, 0)
+        self.assertEqual(order.grand_total, Decimal('330.00'))
+
+    def test_lines_keep_a_copy_of_the_product(self):
+        """
+        Editing or deleting the product leaves the line item unchanged
+        """
+        self.mouse.sku = 'ms001'
+        self.mouse.image_url = 'https://example.com/mouse.jpg'
+        self.mouse.save()
+        order = place_order(new_order(), {str(self.mouse.id): 3})
+        self.mouse.name = 'Renamed Mouse'
+        self.mouse.price = '12.00'
+        self.mouse.save()
+        self.mouse.delete()
+
+        lineitem = OrderLineItem.objects.get(order=order)
+        self.assertIsNone(lineitem.product_id)
+        self.assertEqual(lineitem.product_name, 'Mouse')
+        self.assertEqual(lineitem.product_sku, 'ms001')
+        self.assertEqual(
+            lineitem.product_image, 'https://example.com/mouse.jpg')
+        self.assertEqual(lineitem.unit_price, Decimal('10.00'))
+        self.assertEqual(lineitem.lineitem_total, Decimal('30.00'))
+        self.assertEqual(str(lineitem), f'SKU ms001 on order {order}')
+
+    def test_delivery_below_threshold(self):
+        """
+        Orders under the free delivery threshold pay delivery
+        """
+        order = place_order(new_order(), {str(self.mouse.id): 2})
+        order.refresh_from_db()
+        self.assertEqual(order.delivery_cost, Decimal('1.00'))
+        self.assertEqual(order.grand_total, Decimal('21.00'))
+
+    def test_query_count_does_not_grow_with_lines(self):
+        """
+        One product query, one bulk insert and one total update,
+        however many lines the bag has
+        """
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', price='9.99',
+                    description='Test Description')
+            for i in range(50)])
+        bag = {str(pk): 1 for pk in Product.objects.values_list(
+            'id', flat=True)}
+        # The day's first order creates its sales rollups
+        place_order(new_order(), bag)
+        # Savepoint, order insert, products, line items, totals, email,
+        # day rollup, product rollups read and updated, release
+        with self.assertNumQueries(10):
+            place_order(new_order(), bag)
+
+    def test_missing_product_saves_nothing(self):
+        """
+        A bag line for a deleted product rolls the whole order back
+        """
+        with self.assertRaises(Product.DoesNotExist):
+            place_order(
+                new_order(), {str(self.mouse.id): 1, '999': 1})
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderLineItem.objects.exists())
+
+
+def succeeded_payload(pid, bag, event_id='evt_test'):
+    """
+    A payment_intent.succeeded event as Stripe sends it
+    """
+    address = {
+        'country': 'SE', 'postal_code': '12345', 'city': 'Stockholmsburg',
+        'line1': 'Rabb Street 2', 'line2': '', 'state': ''}
+    return {
+        'id': event_id,
+        'object': 'event',
+        'type': 'payment_intent.succeeded',
+        'data': {'object': {
+            'id': pid,
+            'object': 'payment_intent',
+            'metadata': {
+                'bag': json.dumps(bag), 'save_info': '',
+                'username': 'AnonymousUser'},
+            'charges': {'data': [{
+                'amount': 3150,
+                'billing_details': {'email': 'test_email@gmail.com'},
+            }]},
+            'shipping': {
+                'name': 'Test User', 'phone': '123456789',
+                'address': address},
+        }},
+    }
+
+
+def succeeded_event(pid, bag):
+    """
+    A payment_intent.succeeded event as the Stripe library parses it
+    """
+    return stripe.util.convert_to_stripe_object(succeeded_payload(pid, bag))
+
+
+class TestOrderReconciliation(TestCase):
+    """
+    Tests that the webhook finds orders by PaymentIntent id
+    """
+    def setUp(self):
+        """
+        Create a product and a checkout order for pi_test
+        """
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        self.bag = {str(self.mouse.id): 3}
+        place_order(new_order(
+            stripe_pid='pi_test', original_bag=json.dumps(self.bag)),
+            self.bag)
+
+    def test_webhook_finds_existing_order_in_one_query(self):
+        """
+        The webhook does one lookup for an order the view created,
+        without waiting
+        """
+        handler = StripeWH_Handler(None)
+        with self.assertNumQueries(1):
+            response = handler.handle_payment_intent_succeeded(
+                succeeded_event('pi_test', self.bag))
+        self.assertContains(response, 'Verified order already in database')
+        self.assertEqual(Order.objects.filter(stripe_pid='pi_test').count(), 1)
+
+    def test_webhook_creates_missing_order(self):
+        """
+        A webhook for an unknown PaymentIntent creates its order
+        """
+        response = StripeWH_Handler(None).handle_payment_intent_succeeded(
+            succeeded_event('pi_new', self.bag))
+        self.assertContains(response, 'Created order in webhook')
+        order = Order.objects.get(stripe_pid='pi_new')
+        self.assertEqual(order.grand_total, Decimal('31.50'))
+
+
+class TestCheckoutWebhookRace(TransactionTestCase):
+    """
+    Tests the checkout view and the webhook placing the same order at once
+    """
+    def setUp(self):
+        """
+        Create a product
+        """
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        self.bag = {str(self.mouse.id): 3}
+
+    def test_concurrent_view_and_webhook_create_one_order(self):
+        """
+        Both sides miss each other's order, race to insert, and both
+        end up with the single order for the PaymentIntent
+        """
+        # Hold both threads after their lookup so both try to insert.
+        # The in-memory test database fails concurrent writers at once
+        # rather than waiting for the lock, so the lock stands in for
+        # the database serializing the two transactions.
+        barrier = threading.Barrier(2, timeout=10)
+        write_lock = threading.Lock()
+        real_place_order = orders.place_order
+
+        def place_after_barrier(order, bag):
+            barrier.wait()
+            with write_lock:
+                return real_place_order(order, bag)
+
+        results = {}
+
+        def checkout_view():
+            try:
+                results['view'] = get_or_place_order(new_order(
+                    stripe_pid='pi_race', original_bag=json.dumps(self.bag)),
+                    self.bag)
+            finally:
+                connection.close()
+
+        def webhook():
+            try:
+                results['webhook'] = StripeWH_Handler(
+                    None).handle_payment_intent_succeeded(
+                        succeeded_event('pi_race', self.bag))
+            finally:
+                connection.close()
+
+        with mock.patch('checkout.orders.place_order', place_after_barrier):
+            threads = [threading.Thread(target=checkout_view),
+                       threading.Thread(target=webhook)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(results['webhook'].status_code, 200)
+        webhook_created = b'Created order' in results['webhook'].content
+        self.assertNotEqual(results['view'][1], webhook_created)
+        order = Order.objects.get(stripe_pid='pi_race')
+        self.assertEqual(results['view'][0].pk, order.pk)
+        self.assertEqual(order.lineitems.count(), 1)
+        self.assertEqual(order.grand_total, Decimal('31.50'))
+        self.assertEqual(order.emails.count(), 1)
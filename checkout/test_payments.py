@@ -0,0 +1,235 @@
+"""
+checkout/test_payments.py: Contains testing of reusing the session's
+PaymentIntent, counting the calls made to a local fake Stripe, and of
+the webhooks the fake Stripe delivers.
+"""
+# pylint: disable=no-member
+
+import json
+
+import stripe
+from django.core.cache import cache
+from django.test import LiveServerTestCase, TestCase, override_settings
+
+from checkout.fake_stripe import FakeStripe
+from checkout.models import Order, StripeEvent
+from checkout.payments import INTENT_SESSION_KEY
+from products.models import Product
+
+INTENTS = '/v1/payment_intents'
+
+
+@override_settings(STRIPE_SECRET_KEY='sk_test_fake')
+class TestPaymentIntentReuse(TestCase):
+    """
+    Tests the Stripe calls made by the checkout page
+    """
+    def setUp(self):
+        """
+        Create two products of the same price and start the fake Stripe
+        """
+        cache.clear()
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        self.pad = Product.objects.create(
+            name='Mouse Pad', price='10.00', description='Test Description')
+        self.fake = FakeStripe().start()
+        self.addCleanup(self.fake.stop)
+        use = self.fake.use()
+        use.__enter__()
+        self.addCleanup(use.__exit__, None, None, None)
+
+    def set_bag(self, bag):
+        session = self.client.session
+        session['bag'] = bag
+        session.save()
+
+    def checkout(self):
+        """
+        Load the checkout page, returning its client secret
+        """
+        return self.client.get('/checkout/').context['client_secret']
+
+    def intent(self):
+        return self.fake.intents[
+            self.client.session[INTENT_SESSION_KEY]['id']]
+
+    def test_reload_reuses_the_intent(self):
+        """
+        Only the first visit calls Stripe
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        secret = self.checkout()
+        self.assertEqual(self.fake.count('POST', INTENTS), 1)
+        for _ in range(3):
+            self.assertEqual(self.checkout(), secret)
+        self.assertEqual(len(self.fake.calls), 1)
+        self.assertEqual(self.intent()['amount'], 1050)
+
+    def test_new_amount_modifies_the_intent(self):
+        """
+        A bag with a new total updates the same intent
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        secret = self.checkout()
+        self.set_bag({str(self.mouse.id): 2})
+        self.assertEqual(self.checkout(), secret)
+        pid = self.client.session[INTENT_SESSION_KEY]['id']
+        self.assertEqual(self.fake.count('POST', f'{INTENTS}/{pid}'), 1)
+        self.assertEqual(len(self.fake.calls), 2)
+        self.assertEqual(self.intent()['amount'], 2100)
+
+    def test_same_amount_makes_no_call(self):
+        """
+        A different bag with the same total needs nothing from Stripe
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        self.checkout()
+        self.set_bag({str(self.pad.id): 1})
+        self.checkout()
+        self.assertEqual(len(self.fake.calls), 1)
+
+    def test_amount_uses_the_database_prices(self):
+        """
+        A price change the bag's snapshots have not seen, as when another
+        process made it, is still charged
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        self.checkout()
+        # update() sends no signal, so the catalog version stays the same
+        Product.objects.filter(pk=self.mouse.pk).update(price='20.00')
+        self.checkout()
+        self.assertEqual(self.intent()['amount'], 2100)
+
+    def start_payment(self, secret):
+        """
+        Post the checkout data, as the page does before confirming
+        """
+        response = self.client.post(
+            '/checkout/cache_checkout_data/',
+            {'client_secret': secret, 'save_info': 'false'})
+        self.assertEqual(response.status_code, 200)
+        return secret.split('_secret')[0]
+
+    def test_paid_intent_is_not_reused(self):
+        """
+        After a payment the next visit checks the intent with Stripe,
+        and a succeeded one is replaced even though the bag is the same
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        secret = self.checkout()
+        pid = self.start_payment(secret)
+        self.fake.confirm(pid)
+        self.assertNotEqual(self.checkout(), secret)
+        self.assertEqual(self.fake.count('GET', f'{INTENTS}/{pid}'), 1)
+        self.assertEqual(self.fake.count('POST', INTENTS), 2)
+
+    def test_canceled_intent_is_not_reused(self):
+        """
+        An intent canceled after the page started confirming it is
+        replaced
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        secret = self.checkout()
+        self.start_payment(secret)
+        self.intent()['status'] = 'canceled'
+        self.assertNotEqual(self.checkout(), secret)
+
+    def test_failed_payment_keeps_the_intent(self):
+        """
+        An intent still waiting for a payment is kept, and only checked
+        once
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        secret = self.checkout()
+        self.start_payment(secret)
+        calls = len(self.fake.calls)
+        self.assertEqual(self.checkout(), secret)
+        self.assertEqual(self.checkout(), secret)
+        self.assertEqual(len(self.fake.calls), calls + 1)
+
+    def test_invalid_order_form_keeps_a_client_secret(self):
+        """
+        A rejected order form is shown again with the session's intent,
+        or a new one if the session has none
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        response = self.client.post('/checkout/', {
+            'full_name': '', 'email': '', 'phone_number': '',
+            'country': '', 'postcode': '', 'town_or_city': '',
+            'street_address1': '', 'street_address2': ''})
+        secret = response.context['client_secret']
+        self.assertTrue(secret)
+        self.assertEqual(self.checkout(), secret)
+
+    def test_finished_intent_is_replaced(self):
+        """
+        An intent Stripe will no longer modify is replaced with a new one
+        """
+        self.set_bag({str(self.mouse.id): 1})
+        secret = self.checkout()
+        self.intent()['status'] = 'succeeded'
+        self.set_bag({str(self.mouse.id): 3})
+        self.assertNotEqual(self.checkout(), secret)
+        self.assertEqual(self.fake.count('POST', INTENTS), 2)
+        self.assertEqual(len(self.fake.calls), 3)
+        self.assertEqual(self.intent()['amount'], 3150)
+
+
+@override_settings(STRIPE_SECRET_KEY='sk_test_fake',
+                   STRIPE_WH_SECRET='whsec_fake')
+class TestFakeStripeWebhooks(LiveServerTestCase):
+    """
+    Tests that confirming an intent delivers a webhook the site accepts
+    """
+    def setUp(self):
+        """
+        Create a product and an intent whose metadata holds a bag of it
+        """
+        mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        self.fake = FakeStripe(
+            webhook_url=f'{self.live_server_url}/checkout/wh/',
+            webhook_secret='whsec_fake').start()
+        self.addCleanup(self.fake.stop)
+        use = self.fake.use()
+        use.__enter__()
+        self.addCleanup(use.__exit__, None, None, None)
+        self.intent = stripe.PaymentIntent.create(
+            amount=3150, currency='usd', metadata={
+                'bag': json.dumps({str(mouse.id): 3}), 'save_info': '',
+                'username': 'AnonymousUser'})
+
+    def confirm(self):
+        return stripe.PaymentIntent.confirm(
+            self.intent.id,
+            shipping={'name': 'Test User', 'phone': '123456789', 'address': {
+                'line1': 'Rabb Street 2', 'city': 'Stockholmsburg',
+                'postal_code': '12345', 'country': 'SE'}},
+            payment_method_data={
+                'billing_details': {'email': 'test_email@gmail.com'}})
+
+    def test_confirm_delivers_a_signed_event(self):
+        """
+        The event passes signature checks and the webhook places the order
+        """
+        intent = self.confirm()
+        self.assertEqual(intent.status, 'succeeded')
+        self.fake.wait_for_deliveries()
+        event_id = self.fake.events[0]['id']
+        self.assertEqual(self.fake.deliveries[0][:2], (event_id, 200))
+        order = Order.objects.get(stripe_pid=self.intent.id)
+        self.assertEqual(order.email, 'test_email@gmail.com')
+        self.assertEqual(order.street_address1, 'Rabb Street 2')
+        self.assertEqual(order.lineitems.get().quantity, 3)
+        self.assertTrue(StripeEvent.objects.filter(event_id=event_id).exists())
+
+    def test_succeeded_intent_cannot_be_confirmed_again(self):
+        """
+        A second confirmation is refused and sends no second event
+        """
+        self.confirm()
+        with self.assertRaises(stripe.error.InvalidRequestError):
+            self.confirm()
+        self.fake.wait_for_deliveries()
+        self.assertEqual(len(self.fake.events), 1)
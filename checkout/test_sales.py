@@ -0,0 +1,266 @@
+"""
+checkout/test_sales.py: Contains testing of the daily sales rollups, the
+command that rebuilds them and the sales dashboard.
+"""
+# pylint: disable=no-member
+
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from checkout.management.commands import rebuild_sales_rollups
+from checkout.models import (
+    DailyProductSales, DailySales, Order, SalesRollupRebuild)
+from checkout.orders import place_order
+from checkout.testing import new_order
+from gamesrus.query_budget import QueryRecorder
+from products.models import Category, Product
+
+
+def rollups():
+    """
+    Every rollup row as comparable tuples
+    """
+    return (
+        list(DailySales.objects.order_by('date').values_list(
+            'date', 'orders', 'units', 'revenue', 'delivery')),
+        list(DailyProductSales.objects.order_by('date', 'product').values_list(
+            'date', 'product', 'product_name', 'category', 'units',
+            'revenue')))
+
+
+class TestSalesRollups(TestCase):
+    """
+    Tests that placing orders keeps the rollups up to date
+    """
+    def setUp(self):
+        """
+        Create a product in a category and one without
+        """
+        self.mice = Category.objects.create(name='mice', friendly_name='Mice')
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description',
+            category=self.mice)
+        self.chair = Product.objects.create(
+            name='Chair', price='100.00', description='Test Description')
+
+    def test_orders_on_the_same_day_add_up(self):
+        """
+        Two orders make one day row and one row per product
+        """
+        place_order(new_order(), {str(self.mouse.id): 3})
+        place_order(new_order(), {
+            str(self.mouse.id): 1, str(self.chair.id): 1})
+        today = timezone.localdate()
+        self.assertEqual(rollups(), (
+            [(today, 2, 5, Decimal('140.00'), Decimal('1.50'))],
+            [(today, self.mouse.id, 'Mouse', self.mice.id, 4,
+              Decimal('40.00')),
+             (today, self.chair.id, 'Chair', None, 1, Decimal('100.00'))]))
+
+    def test_rollups_do_not_grow_the_order_queries(self):
+        """
+        Adding to existing rollups takes the same queries however many
+        products the order has
+        """
+        place_order(new_order(), {
+            str(self.mouse.id): 1, str(self.chair.id): 1})
+        with QueryRecorder() as small:
+            place_order(new_order(), {str(self.mouse.id): 1})
+        with QueryRecorder() as large:
+            place_order(new_order(), {
+                str(self.mouse.id): 1, str(self.chair.id): 1})
+        self.assertEqual(len(small), len(large))
+
+    def test_rebuild_matches_the_incremental_rollups(self):
+        """
+        Rebuilding in small chunks reproduces what the orders added,
+        across several days
+        """
+        for days_ago in (0, 0, 1, 3, 3):
+            order = place_order(new_order(), {
+                str(self.mouse.id): days_ago + 1, str(self.chair.id): 1})
+            Order.objects.filter(pk=order.pk).update(
+                date=order.date - timedelta(days=days_ago))
+        # Move the rollups to the orders' new dates
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        expected = rollups()
+        self.assertEqual(len(expected[0]), 3)
+
+        DailySales.objects.update(orders=0)
+        out = StringIO()
+        call_command('rebuild_sales_rollups', chunk_size=2, stdout=out)
+        self.assertIn('5 order(s) in 3 chunk(s), 3 day(s)', out.getvalue())
+        self.assertEqual(rollups(), expected)
+
+    def test_rebuild_keeps_sales_of_deleted_products(self):
+        """
+        Deleted products' sales are rebuilt under no product
+        """
+        place_order(new_order(), {
+            str(self.mouse.id): 2, str(self.chair.id): 1})
+        self.chair.delete()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        deleted = DailyProductSales.objects.get(product__isnull=True)
+        self.assertEqual((deleted.product_name, deleted.units), ('', 1))
+        self.assertEqual(DailySales.objects.get().units, 3)
+
+    def test_deleting_an_order_takes_it_out(self):
+        """
+        A deleted order leaves the rollups a rebuild would make
+        """
+        place_order(new_order(), {str(self.mouse.id): 2})
+        order = place_order(new_order(), {
+            str(self.mouse.id): 1, str(self.chair.id): 1})
+        order.delete()
+        self.assertEqual(
+            DailyProductSales.objects.get(product=self.mouse).units, 2)
+        self.assertEqual(
+            DailyProductSales.objects.get(product=self.chair).units, 0)
+        incremental = rollups()[0]
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(rollups()[0], incremental)
+
+    def test_deleting_an_order_missing_from_the_rollups(self):
+        """
+        An order placed before the rollups existed can still be deleted
+        """
+        order = place_order(new_order(), {str(self.mouse.id): 1})
+        DailySales.objects.all().delete()
+        DailyProductSales.objects.all().delete()
+        order.delete()
+        self.assertEqual(rollups(), ([], []))
+
+    def test_deleted_products_share_a_row(self):
+        """
+        Products deleted after selling on the same day fold into one
+        row, and deleting an order of one takes out only its own sales
+        """
+        place_order(new_order(), {str(self.mouse.id): 1})
+        order = place_order(new_order(), {str(self.chair.id): 1})
+        self.mouse.delete()
+        self.chair.delete()
+        row = DailyProductSales.objects.get()
+        self.assertEqual(
+            (row.product_id, row.product_name, row.units, row.revenue),
+            (None, '', 2, Decimal('110.00')))
+
+        order.delete()
+        row.refresh_from_db()
+        self.assertEqual((row.units, row.revenue), (1, Decimal('10.00')))
+        incremental = DailyProductSales.objects.values_list(
+            'date', 'product', 'units', 'revenue')
+        expected = list(incremental)
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(list(incremental), expected)
+
+    def test_deleting_orders_during_a_rebuild(self):
+        """
+        An order deleted after the rebuild summed it is taken out, and
+        one it has yet to reach is neither taken out nor summed
+        """
+        orders = [
+            place_order(new_order(), {str(self.mouse.id): units})
+            for units in (4, 2, 1, 8)]
+        real_add = rebuild_sales_rollups.add_to_rollups
+
+        def add_then_delete(days, sold):
+            real_add(days, sold)
+            if SalesRollupRebuild.objects.get().next_id == orders[2].id:
+                orders[0].delete()
+                orders[2].delete()
+
+        with mock.patch.object(
+                rebuild_sales_rollups, 'add_to_rollups', add_then_delete):
+            call_command(
+                'rebuild_sales_rollups', chunk_size=1, stdout=StringIO())
+        self.assertEqual(DailySales.objects.get().units, 10)
+        self.assertEqual(
+            DailyProductSales.objects.get(product=self.mouse).units, 10)
+        self.assertFalse(SalesRollupRebuild.objects.exists())
+
+    def test_rebuild_keeps_the_category_at_sale_time(self):
+        """
+        Moving a product to another category doesn't move its past sales
+        """
+        place_order(new_order(), {str(self.mouse.id): 1})
+        self.mouse.category = Category.objects.create(name='other')
+        self.mouse.save()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(
+            DailyProductSales.objects.get(product=self.mouse).category_id,
+            self.mice.id)
+
+
+class TestSalesDashboard(TestCase):
+    """
+    Tests the sales dashboard in the admin
+    """
+    def setUp(self):
+        """
+        Log in an admin and sell a product today and 40 days ago
+        """
+        User.objects.create_superuser(
+            username='admin', password='test_password')
+        self.client.login(username='admin', password='test_password')
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        place_order(new_order(), {str(self.mouse.id): 3})
+        today = timezone.localdate()
+        DailySales.objects.create(
+            date=today - timedelta(days=40), orders=5, units=5,
+            revenue='50.00', delivery='2.50')
+
+    def test_dashboard_totals_the_period(self):
+        """
+        The default period leaves out older days; a longer one adds them
+        """
+        url = '/admin/checkout/dailysales/'
+        response = self.client.get(url)
+        self.assertEqual(response.context['totals']['orders'], 1)
+        self.assertEqual(response.context['totals']['revenue'],
+                         Decimal('30.00'))
+        self.assertContains(response, 'Mouse')
+        response = self.client.get(url, {'days': 90})
+        self.assertEqual(response.context['totals']['orders'], 6)
+
+    def test_dashboard_reads_only_the_rollups(self):
+        """
+        No order or line item is read, and more orders add no queries
+        """
+        url = '/admin/checkout/dailysales/'
+        with QueryRecorder() as before:
+            self.client.get(url)
+        for _ in range(5):
+            place_order(new_order(), {str(self.mouse.id): 1})
+        with QueryRecorder() as after:
+            self.client.get(url)
+        self.assertEqual(len(before), len(after))
+        self.assertFalse(any(
+            'checkout_order' in sql for sql in after.queries))
+
+    def test_order_line_items_are_read_only(self):
+        """
+        The order page shows its line items without a field to change
+        """
+        order = Order.objects.get()
+        response = self.client.get(
+            f'/admin/checkout/order/{order.id}/change/')
+        self.assertContains(response, 'Mouse')
+        self.assertNotContains(response, 'name="lineitems-0-quantity"')
+        self.assertNotContains(response, 'name="lineitems-0-DELETE"')
+
+    def test_dashboard_needs_staff(self):
+        """
+        Customers are sent to the admin login
+        """
+        User.objects.create_user(username='customer', password='pw')
+        self.client.login(username='customer', password='pw')
+        response = self.client.get('/admin/checkout/dailysales/')
+        self.assertEqual(response.status_code, 302)
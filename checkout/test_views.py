@@ -9,7 +9,11 @@ from django.contrib.messages import get_messages
 from django.contrib.auth.models import User
 
 
-from checkout.models import Order
+from checkout.fake_stripe import FakeStripe
+from checkout.models import Order, OrderLineItem
+from checkout.testing import new_order
+from gamesrus.query_budget import BUDGET_SIZES, QueryBudgetTestMixin
+from products.models import Product
 from profiles.models import UserProfile
 
 
@@ -30,16 +34,8 @@ class TestCheckoutViews(TestCase):
         test_user_superuser.save()
         test_user = UserProfile.objects.get(user=test_user)
 
-        Order.objects.create(
-            full_name='Test User',
-            email='test_email@gmail.com',
-            phone_number='123456789',
-            country='SE',
-            town_or_city='Stockholmsburg',
-            street_address1='Rabb Street 2',
-            street_address2='Stockholms County',
-            user_profile=test_user
-        )
+        new_order(street_address2='Stockholms County',
+                  user_profile=test_user).save()
 
     def tearDown(self):
         """
@@ -57,3 +53,69 @@ class TestCheckoutViews(TestCase):
         messages = list(get_messages(response.wsgi_request))
         self.assertEqual(
             str(messages[0]), "There's nothing in your bag at the moment")
+
+
+class TestCheckoutQueryBudgets(QueryBudgetTestMixin, TestCase):
+    """
+    Tests that the checkout pages stay within their query budgets
+    however large the bag or order
+    """
+    def setUp(self):
+        """
+        Create and log in a test user
+        """
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password')
+        self.client.login(username='test_user', password='test_password')
+
+    def seed_products(self, size):
+        """
+        Replace the catalog with size products
+        """
+        Product.objects.all().delete()
+        Product.objects.bulk_create([
+            Product(name=f'Product {i}', price='9.99',
+                    description='Test Description')
+            for i in range(size)])
+        return Product.objects.all()
+
+    def test_checkout_budget(self):
+        """
+        A checkout reload runs a fixed number of queries once the
+        bag is snapshotted and its PaymentIntent created
+        """
+        for size in BUDGET_SIZES:
+            with self.subTest(size=size), FakeStripe() as fake, fake.use():
+                session = self.client.session
+                session['bag'] = {
+                    str(product.id): 1
+                    for product in self.seed_products(size)}
+                session.save()
+                # Snapshot the bag and create its intent, as the first
+                # visit to the checkout would
+                self.client.get('/bag/')
+                self.client.get('/checkout/')
+                with self.assertQueryBudget('checkout'):
+                    response = self.client.get('/checkout/')
+                self.assertEqual(response.status_code, 200)
+
+    def test_checkout_success_budget(self):
+        """
+        The order confirmation runs a fixed number of queries
+        """
+        for size in BUDGET_SIZES:
+            with self.subTest(size=size):
+                products = self.seed_products(size)
+                order = new_order()
+                order.save()
+                OrderLineItem.objects.bulk_create([
+                    OrderLineItem(order=order, product=product, quantity=1,
+                                  lineitem_total=product.price)
+                    for product in products])
+                session = self.client.session
+                session['bag'] = {}
+                session.save()
+                with self.assertQueryBudget('checkout_success'):
+                    response = self.client.get(
+                        f'/checkout/checkout_success/{order.order_number}')
+                self.assertEqual(response.status_code, 200)
@@ -0,0 +1,223 @@
+"""
+checkout/test_webhooks.py: Contains testing of the Stripe webhook view.
+"""
+# pylint: disable=no-member
+
+import hashlib
+import hmac
+import json
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from checkout.models import Order, OutboxEmail, StripeEvent
+from checkout.webhook_queue import process_queue
+from checkout.test_orders import succeeded_payload
+from products.models import Product
+
+WH_SECRET = 'whsec_test'
+
+
+def signature(payload, secret=WH_SECRET):
+    """
+    A Stripe-Signature header for the payload
+    """
+    timestamp = int(time.time())
+    digest = hmac.new(
+        secret.encode(), f'{timestamp}.{payload}'.encode(),
+        hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={digest}'
+
+
+@override_settings(STRIPE_WH_SECRET=WH_SECRET)
+class TestWebhookLedger(TestCase):
+    """
+    Tests that handled events are answered from the ledger
+    """
+    def setUp(self):
+        """
+        Create a product and a succeeded event for it
+        """
+        mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+        self.payload = json.dumps(succeeded_payload(
+            'pi_test', {str(mouse.id): 3}, event_id='evt_1'))
+
+    def deliver(self, payload=None, secret=WH_SECRET):
+        payload = payload or self.payload
+        return self.client.post(
+            '/checkout/wh/', payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature(payload, secret))
+
+    def test_redelivery_is_answered_from_the_ledger(self):
+        """
+        The second delivery is one lookup, and no second order or email
+        """
+        self.assertContains(self.deliver(), 'Created order in webhook')
+        self.assertTrue(StripeEvent.objects.filter(event_id='evt_1').exists())
+        with self.assertNumQueries(1):
+            response = self.deliver()
+        self.assertContains(response, 'Already received')
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    def test_bad_signature_is_not_recorded(self):
+        """
+        Unverified events are rejected and stay out of the ledger
+        """
+        self.assertEqual(self.deliver(secret='whsec_wrong').status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+    def test_failed_events_are_retried(self):
+        """
+        An event whose handling fails is handled again on redelivery
+        """
+        payload = json.dumps(succeeded_payload(
+            'pi_missing', {'999': 1}, event_id='evt_2'))
+        self.assertEqual(self.deliver(payload).status_code, 500)
+        self.assertFalse(StripeEvent.objects.exists())
+        self.assertEqual(self.deliver(payload).status_code, 500)
+
+    def test_prune_by_age(self):
+        """
+        The prune command deletes only events older than --days
+        """
+        StripeEvent.objects.create(
+            event_id='evt_old', event_type='charge.succeeded',
+            received=timezone.now() - timedelta(days=31))
+        StripeEvent.objects.create(
+            event_id='evt_new', event_type='charge.succeeded')
+        out = StringIO()
+        call_command('prune_stripe_events', days=30, stdout=out)
+        self.assertIn('Deleted 1', out.getvalue())
+        self.assertEqual(
+            list(StripeEvent.objects.values_list('event_id', flat=True)),
+            ['evt_new'])
+        with self.assertRaises(CommandError):
+            call_command('prune_stripe_events', days=1)
+
+
+@override_settings(STRIPE_WH_SECRET=WH_SECRET, STRIPE_WH_QUEUE=True)
+class TestWebhookQueue(TestCase):
+    """
+    Tests accepting events into the queue and the process_webhooks worker
+    """
+    def setUp(self):
+        """
+        Create a product
+        """
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+
+    def deliver(self, pid, bag, event_id):
+        payload = json.dumps(succeeded_payload(pid, bag, event_id=event_id))
+        return self.client.post(
+            '/checkout/wh/', payload, content_type='application/json',
+            HTTP_STRIPE_SIGNATURE=signature(payload))
+
+    def test_events_are_queued_then_processed(self):
+        """
+        The listener only stores the event; the worker creates the order
+        """
+        response = self.deliver('pi_test', {str(self.mouse.id): 1}, 'evt_1')
+        self.assertContains(response, 'Queued')
+        self.assertFalse(Order.objects.exists())
+        event = StripeEvent.objects.get(event_id='evt_1')
+        self.assertEqual(event.status, StripeEvent.QUEUED)
+        self.assertEqual(event.payment_intent, 'pi_test')
+
+        out = StringIO()
+        call_command('process_webhooks', workers=1, stdout=out)
+        self.assertIn('1 processed', out.getvalue())
+        self.assertTrue(Order.objects.filter(stripe_pid='pi_test').exists())
+        event.refresh_from_db()
+        self.assertEqual(event.status, StripeEvent.PROCESSED)
+
+    def test_failures_are_retried_then_given_up(self):
+        """
+        A failing event stays queued, backing off between attempts,
+        until its last attempt
+        """
+        self.deliver('pi_missing', {'999': 1}, 'evt_2')
+        self.assertEqual(process_queue(workers=1, max_attempts=3).retried, 1)
+        event = StripeEvent.objects.get(event_id='evt_2')
+        self.assertEqual(
+            (event.status, event.attempts), (StripeEvent.QUEUED, 1))
+        first_wait = event.retry_after - timezone.now()
+        self.assertGreater(first_wait, timedelta(seconds=20))
+        # Not due yet
+        self.assertEqual(process_queue(workers=1, max_attempts=3).retried, 0)
+
+        StripeEvent.objects.update(retry_after=timezone.now())
+        self.assertEqual(process_queue(workers=1, max_attempts=3).retried, 1)
+        event.refresh_from_db()
+        self.assertGreater(
+            event.retry_after - timezone.now(), first_wait * 1.5)
+
+        StripeEvent.objects.update(retry_after=timezone.now())
+        self.assertEqual(process_queue(workers=1, max_attempts=3).failed, 1)
+        event.refresh_from_db()
+        self.assertEqual(event.status, StripeEvent.FAILED)
+        self.assertIn('ERROR', event.last_error)
+
+
+class TestWebhookQueueOrdering(TransactionTestCase):
+    """
+    Tests that a thread pool keeps each PaymentIntent's events in order
+    """
+    def queue(self, pid, seq):
+        StripeEvent.objects.create(
+            event_id=f'evt_{pid}_{seq}',
+            event_type='payment_intent.processing',
+            status=StripeEvent.QUEUED, payment_intent=pid,
+            payload=json.dumps({
+                'id': f'evt_{pid}_{seq}', 'object': 'event',
+                'type': 'payment_intent.processing',
+                'data': {'object': {'id': pid, 'object': 'payment_intent'}},
+            }))
+
+    def test_intents_run_concurrently_and_in_order(self):
+        """
+        Intents are handled on several threads, each intent's events in
+        arrival order, and a failure holds back the rest of its intent
+        """
+        for seq in range(3):
+            for pid in ('pi_a', 'pi_b', 'pi_c'):
+                self.queue(pid, seq)
+        handled = []
+        threads = set()
+        lock = threading.Lock()
+
+        def dispatch(event, request=None):
+            time.sleep(0.01)
+            with lock:
+                handled.append(event['id'])
+                threads.add(threading.get_ident())
+            if event['id'] == 'evt_pi_b_1' and handled.count(event['id']) == 1:
+                return HttpResponse(status=500)
+            return HttpResponse(status=200)
+
+        with mock.patch('checkout.webhook_queue.dispatch_event', dispatch):
+            first = process_queue(workers=3)
+            self.assertEqual(
+                (first.processed, first.retried, first.deferred), (7, 1, 1))
+            self.assertNotIn('evt_pi_b_2', handled)
+            # pi_b's later event waits while its failure backs off
+            self.assertEqual(process_queue(workers=3).processed, 0)
+            StripeEvent.objects.update(retry_after=timezone.now())
+            second = process_queue(workers=3)
+            self.assertEqual(second.processed, 2)
+
+        self.assertGreater(len(threads), 1)
+        for pid in ('pi_a', 'pi_b', 'pi_c'):
+            own = [event_id for event_id in handled if pid in event_id]
+            self.assertEqual(own, sorted(own))
+        self.assertFalse(StripeEvent.objects.exclude(
+            status=StripeEvent.PROCESSED).exists())
@@ -0,0 +1,21 @@
+"""
+checkout/testing.py: order fixtures shared by the test modules.
+"""
+
+from checkout.models import Order
+
+CUSTOMER_DETAILS = {
+    'full_name': 'Test User',
+    'email': 'test_email@gmail.com',
+    'phone_number': '123456789',
+    'country': 'SE',
+    'town_or_city': 'Stockholmsburg',
+    'street_address1': 'Rabb Street 2',
+}
+
+
+def new_order(**fields):
+    """
+    An unsaved Order with valid customer details, overridden by fields
+    """
+    return Order(**{**CUSTOMER_DETAILS, **fields})
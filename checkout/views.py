@@ -13,12 +13,16 @@ from django.contrib import messages
 from django.conf import settings
 from django.views.decorators.http import require_POST
 
-from bag.contexts import bag_contents
+from bag.contexts import get_bag
+from bag.storage import get_storage
 from products.models import Product
 from profiles.forms import UserProfileForm
 from profiles.models import UserProfile
 from .forms import OrderForm
-from .models import OrderLineItem, Order
+from .models import Order
+from .orders import attach_order, get_or_place_order
+from .payments import (
+    forget_intent, get_client_secret, mark_confirming, stored_client_secret)
 
 
 # pylint: disable=broad-except, invalid-name
@@ -35,10 +39,11 @@ def cache_checkout_data(request):
         pid = request.POST.get('client_secret').split('_secret')[0]
         stripe.api_key = settings.STRIPE_SECRET_KEY
         stripe.PaymentIntent.modify(pid, metadata={
-            'bag': json.dumps(request.session.get('bag', {})),
+            'bag': json.dumps(get_storage(request).load()),
             'save_info': request.POST.get('save_info'),
             'username': request.user,
         })
+        mark_confirming(request, pid)
         return HttpResponse(status=200)
     except Exception as e:
         messages.error(request, 'Your payment cannot be proccessed right now, \
@@ -46,16 +51,25 @@ def cache_checkout_data(request):
         return HttpResponse(content=e, status=400)
 
 
+def _client_secret(request, bag):
+    """
+    The client secret of a PaymentIntent for the bag's grand total
+    """
+    # Price the intent from the database, not the bag's snapshots, so
+    # it charges what place_order will write to the order
+    total = get_bag(request, fresh=True)['grand_total']
+    return get_client_secret(request, bag, round(total * 100))
+
+
 def checkout(request):
     """
     This function processes the checkout: the bag contents, user info and
     the payment, validating it in the process.
     """
     stripe_public_key = settings.STRIPE_PUBLIC_KEY
-    stripe_secret_key = settings.STRIPE_SECRET_KEY
 
     if request.method == 'POST':
-        bag = request.session.get('bag', {})
+        bag = get_storage(request).load()
 
         form_data = {
             'full_name': request.POST['full_name'],
@@ -73,44 +87,32 @@ def checkout(request):
             pid = request.POST.get('client_secret').split('_secret')[0]
             order.stripe_pid = pid
             order.original_bag = json.dumps(bag)
-            order.save()
-
-            for item_id, item_data in bag.items():
-                try:
-                    product = Product.objects.get(id=item_id)
-                    if isinstance(item_data, int):
-                        order_line_item = OrderLineItem(
-                            order=order,
-                            product=product,
-                            quantity=item_data,
-                        )
-                        order_line_item.save()
-                except Product.DoesNotExist:
-                    messages.error(request, (
-                        'One of the products in your bag doesent exist.')
-                    )
-                    order.delete()
-                    return redirect(reverse('view.bag'))
+            try:
+                # The webhook may have created the order already
+                order, _ = get_or_place_order(order, bag)
+            except Product.DoesNotExist:
+                messages.error(request, (
+                    'One of the products in your bag doesent exist.')
+                )
+                return redirect(reverse('view_bag'))
             request.session['save_info'] = 'save_info' in request.POST
+            # The intent has paid for the order
+            forget_intent(request)
             return redirect(reverse(
                 'checkout_success', args=[order.order_number]))
         else:
             messages.error(
                 request, 'error in your form, double check and try again.')
+            # Keep the intent the page may already have confirmed
+            client_secret = (
+                stored_client_secret(request) or _client_secret(request, bag))
     else:
-        bag = request.session.get('bag', {})
+        bag = get_storage(request).load()
         if not bag:
             messages.error(request, "There's nothing in your bag")
             return redirect(reverse('products'))
 
-        current_bag = bag_contents(request)
-        total = current_bag['grand_total']
-        stripe_total = round(total * 100)
-        stripe.api_key = stripe_secret_key
-        intent = stripe.PaymentIntent.create(
-            amount=stripe_total,
-            currency=settings.STRIPE_CURRENCY,
-        )
+        client_secret = _client_secret(request, bag)
 
         if request.user.is_authenticated:
             try:
@@ -138,7 +140,7 @@ def checkout(request):
     context = {
         'order_form': order_form,
         'stripe_public_key': stripe_public_key,
-        'client_secret': intent.client_secret,
+        'client_secret': client_secret,
     }
 
     return render(request, template, context)
@@ -149,13 +151,14 @@ def checkout_success(request, order_number):
     Handles success checkouts
     """
     save_info = request.session.get('save_info')
-    order = get_object_or_404(Order, order_number=order_number)
+    order = get_object_or_404(
+        Order.objects.prefetch_related('lineitems'),
+        order_number=order_number)
 
     if request.user.is_authenticated:
         profile = UserProfile.objects.get(user=request.user)
         # attatch the order to the specific userprofile
-        order.user_profile = profile
-        order.save()
+        attach_order(order, profile)
 
     # saves users information
     if save_info:
@@ -176,12 +179,12 @@ def checkout_success(request, order_number):
         Your order number is {order_number}. A confirmation \
         email will be sent to {order.email}.')
 
-    if 'bag' in request.session:
-        del request.session['bag']
+    get_storage(request).clear()
+    forget_intent(request)
 
-        template = 'checkout/checkout_success.html'
-        context = {
-            'order': order,
-        }
+    template = 'checkout/checkout_success.html'
+    context = {
+        'order': order,
+    }
 
-        return render(request, template, context)
+    return render(request, template, context)
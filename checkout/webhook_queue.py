@@ -0,0 +1,176 @@
+"""
+checkout/webhook_queue.py: handles the Stripe events queued by the
+webhook listener in STRIPE_WH_QUEUE mode.
+
+Queued events are grouped by PaymentIntent. Groups run concurrently on a
+thread or process pool, and the events within a group run one after
+another in the order they arrived. If an event fails, the rest of its
+group waits for the next pass, so an intent's events are never handled
+out of order. A failed event is retried with exponential backoff, and
+its group's later events wait with it. The pool only handles events;
+their outcomes are saved by the calling thread.
+"""
+
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import timedelta
+
+import stripe
+from django.conf import settings
+from django.db import connections
+from django.db.models import F, Min
+from django.utils import timezone
+
+from .models import StripeEvent
+from .webhooks import dispatch_event
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubling with each failed attempt
+RETRY_BASE = 30
+RETRY_MAX = 60 * 60
+POOLS = {
+    'thread': ThreadPoolExecutor,
+    'process': ProcessPoolExecutor,
+}
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait after the given number of failed attempts
+    """
+    return min(RETRY_BASE * 2 ** (attempts - 1), RETRY_MAX)
+
+
+class WebhookMetrics:
+    """
+    Counts from processing the queue
+    """
+    def __init__(self):
+        self.processed = 0
+        self.retried = 0
+        self.failed = 0
+        self.deferred = 0
+
+    def __str__(self):
+        return (
+            f'{self.processed} processed, {self.retried} to retry, '
+            f'{self.failed} failed, {self.deferred} deferred')
+
+
+def _handle_group(events):
+    """
+    Handle one PaymentIntent's (id, payload) pairs in order, stopping at
+    the first failure. Returns (id, error) for each event attempted,
+    with error None on success.
+    """
+    outcomes = []
+    for event_id, payload in events:
+        try:
+            event = stripe.Event.construct_from(
+                json.loads(payload), settings.STRIPE_SECRET_KEY)
+            response = dispatch_event(event)
+            error = (
+                None if 200 <= response.status_code < 300
+                else response.content.decode('utf-8', 'replace'))
+        except Exception as e:  # pylint: disable=broad-except
+            error = f'{type(e).__name__}: {e}'
+        outcomes.append((event_id, error))
+        if error is not None:
+            break
+    return outcomes
+
+
+def _handle_group_in_pool(events):
+    """
+    _handle_group, closing the pool worker's connections afterwards
+    """
+    try:
+        return _handle_group(events)
+    finally:
+        connections.close_all()
+
+
+def _groups(events):
+    """
+    Queued events keyed by PaymentIntent, oldest first. Events without
+    an intent each get a group of their own.
+    """
+    groups = OrderedDict()
+    for event in events:
+        key = event.payment_intent or f'event:{event.id}'
+        groups.setdefault(key, []).append((event.id, event.payload))
+    return list(groups.values())
+
+
+def _due(batch_size):
+    """
+    Up to batch_size queued events that are due, in id order, leaving
+    out those queued after an event of the same intent that is waiting
+    to be retried
+    """
+    now = timezone.now()
+    queued = StripeEvent.objects.filter(status=StripeEvent.QUEUED)
+    events = list(queued.filter(
+        retry_after__lte=now).order_by('id')[:batch_size])
+    intents = {event.payment_intent for event in events} - {''}
+    if not intents:
+        return events
+    waiting = dict(queued.filter(
+        retry_after__gt=now, payment_intent__in=intents).values_list(
+            'payment_intent').annotate(first=Min('id')))
+    return [
+        event for event in events
+        if event.payment_intent not in waiting
+        or event.id < waiting[event.payment_intent]]
+
+
+def _save_outcomes(outcomes, attempts, max_attempts, metrics):
+    done = [event_id for event_id, error in outcomes if error is None]
+    StripeEvent.objects.filter(id__in=done).update(
+        status=StripeEvent.PROCESSED, attempts=F('attempts') + 1,
+        last_error='')
+    metrics.processed += len(done)
+    for event_id, error in outcomes:
+        if error is None:
+            continue
+        tries = attempts[event_id] + 1
+        gave_up = tries >= max_attempts
+        StripeEvent.objects.filter(id=event_id).update(
+            status=StripeEvent.FAILED if gave_up else StripeEvent.QUEUED,
+            attempts=F('attempts') + 1, last_error=error,
+            retry_after=timezone.now() + timedelta(
+                seconds=retry_delay(tries)))
+        if gave_up:
+            metrics.failed += 1
+        else:
+            metrics.retried += 1
+
+
+def process_queue(workers=4, pool='thread', batch_size=BATCH_SIZE,
+                  max_attempts=MAX_ATTEMPTS):
+    """
+    Handle one batch of queued events. With one worker the events are
+    handled in this thread.
+    """
+    metrics = WebhookMetrics()
+    events = _due(batch_size)
+    if not events:
+        return metrics
+    attempts = {event.id: event.attempts for event in events}
+    groups = _groups(events)
+
+    if workers <= 1:
+        results = [_handle_group(group) for group in groups]
+    else:
+        if pool == 'process':
+            # Forked processes must not share the parent's connections
+            connections.close_all()
+        with POOLS[pool](max_workers=workers) as executor:
+            results = list(executor.map(_handle_group_in_pool, groups))
+
+    for group, outcomes in zip(groups, results):
+        metrics.deferred += len(group) - len(outcomes)
+        _save_outcomes(outcomes, attempts, max_attempts, metrics)
+    return metrics
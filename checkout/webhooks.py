@@ -1,18 +1,84 @@
 """
 checkout/webhooks.py: Contains webhook listener for stripe payment
 Credit: Code Institute, Boutique Ado project, Stripe
+
+With STRIPE_WH_QUEUE set, the listener only verifies and stores each
+event, and the process_webhooks command handles it.
 """
 
+import json
+
 from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.http import HttpResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 
 import stripe
 
+from checkout.models import StripeEvent
 from checkout.webhook_handler import StripeWH_Handler
 
 
+def _event_id(payload):
+    """
+    The event id from an unverified payload, or None
+    """
+    try:
+        return json.loads(payload).get('id')
+    except (ValueError, AttributeError):
+        return None
+
+
+def _payment_intent(event):
+    """
+    The id of the PaymentIntent an event is about, or ''
+    """
+    obj = event['data']['object']
+    if obj.get('object') == 'payment_intent':
+        return obj['id']
+    return obj.get('payment_intent') or ''
+
+
+def _record_event(event, **fields):
+    """
+    Add an event to the ledger. Returns False if it was already there.
+    """
+    try:
+        with transaction.atomic():
+            StripeEvent.objects.create(
+                event_id=event['id'], event_type=event['type'], **fields)
+    except IntegrityError:
+        # A concurrent delivery of the same event got there first
+        return False
+    return True
+
+
+def dispatch_event(event, request=None):
+    """
+    Handle a verified event, returning the handler's response
+    """
+    # Set up a webhook handler
+    handler = StripeWH_Handler(request)
+
+    # Map webhook events to relevant handler functions
+    event_map = {
+        'payment_intent.succeeded': handler.handle_payment_intent_succeeded,
+        'payment_intent.payment_failed': (
+            handler.handle_payment_intent_payment_failed),
+    }
+
+    # Get the webhook type from Stripe
+    event_type = event['type']
+
+    # If there's a handler for it, get it from the event map
+    # Use the generic one by default
+    event_handler = event_map.get(event_type, handler.handle_event)
+
+    # Call the event handler with the event
+    return event_handler(event)
+
+
 @require_POST
 @csrf_exempt
 def webhook(request):
@@ -28,6 +94,14 @@ def webhook(request):
     sig_header = request.META['HTTP_STRIPE_SIGNATURE']
     event = None
 
+    # Answer redeliveries from the ledger. Nothing is acted on here, so
+    # the signature can wait until the event is new.
+    event_id = _event_id(payload)
+    if event_id and StripeEvent.objects.filter(event_id=event_id).exists():
+        return HttpResponse(
+            content=f'Webhook received: {event_id} | Already received',
+            status=200)
+
     try:
         event = stripe.Webhook.construct_event(
             payload, sig_header, wh_secret
@@ -41,23 +115,18 @@ def webhook(request):
     except Exception as e:
         return HttpResponse(content=e, status=400)
 
-    # Set up a webhook handler
-    handler = StripeWH_Handler(request)
+    if settings.STRIPE_WH_QUEUE:
+        _record_event(
+            event, status=StripeEvent.QUEUED,
+            payment_intent=_payment_intent(event),
+            payload=payload.decode('utf-8'))
+        return HttpResponse(
+            content=f'Webhook received: {event["type"]} | Queued',
+            status=200)
 
-    # Map webhook events to relevant handler functions
-    event_map = {
-        'payment_intent.succeeded': handler.handle_payment_intent_succeeded,
-        'payment_intent.payment_failed': (
-            handler.handle_payment_intent_payment_failed,)
-    }
-
-    # Get the webhook type from Stripe
-    event_type = event['type']
-
-    # If there's a handler for it, get it from the event map
-    # Use the generic one by default
-    event_handler = event_map.get(event_type, handler.handle_event)
-
-    # Call the event handler with the event
-    response = event_handler(event)
+    response = dispatch_event(event, request)
+    # Failed events stay out of the ledger, so Stripe's retries get
+    # handled again
+    if 200 <= response.status_code < 300:
+        _record_event(event)
     return response
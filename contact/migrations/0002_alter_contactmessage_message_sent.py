@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contact', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contactmessage',
+            name='message_sent',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+    ]
@@ -13,5 +13,6 @@ class ContactMessage(models.Model):
     message_subject = models.CharField(max_length=200, null=False, blank=False)
     message_text = models.TextField(null=False, blank=False)
     message_sent = models.DateTimeField(
-        auto_now_add=True, null=False, blank=False, editable=False
+        auto_now_add=True, null=False, blank=False, editable=False,
+        db_index=True
     )
@@ -0,0 +1,133 @@
+"""
+gamesrus/query_budget.py: records the SQL run by a block of code or a
+request, so tests and development servers can catch N+1 regressions.
+
+Budgets are declared per URL name in settings.QUERY_BUDGETS. Tests check
+them with QueryBudgetTestMixin.assertQueryBudget. The optional
+QueryBudgetMiddleware reports every request against the same budgets.
+"""
+
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+logger = logging.getLogger(__name__)
+
+# Catalog, bag and order sizes the budget tests seed
+BUDGET_SIZES = (1, 10, 1000)
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'IN \((?:\?, )*\?\)')
+
+
+def normalize_sql(sql):
+    """
+    Strip literal values from a query so that repeats of the same
+    statement with different parameters count as duplicates
+    """
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryRecorder(CaptureQueriesContext):
+    """
+    Captures the queries run on the default database
+    """
+    def __init__(self):
+        super().__init__(connection)
+
+    @property
+    def queries(self):
+        return [query['sql'] for query in self.captured_queries]
+
+    def duplicates(self):
+        """
+        Normalized statements that ran more than once, with their counts
+        """
+        counts = Counter(normalize_sql(sql) for sql in self.queries)
+        return {sql: count for sql, count in counts.items() if count > 1}
+
+    def report(self):
+        lines = [f'{len(self)} queries']
+        for sql, count in self.duplicates().items():
+            lines.append(f'  {count}x {sql}')
+        lines += [
+            f'  {index}. {sql}'
+            for index, sql in enumerate(self.queries, start=1)]
+        return '\n'.join(lines)
+
+
+def get_budget(url_name):
+    """
+    The declared query budget for a URL name, or None
+    """
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin adding assertQueryBudget
+    """
+    @contextmanager
+    def assertQueryBudget(self, budget, max_duplicates=None):
+        """
+        Fail if the block runs more than budget queries, or more than
+        max_duplicates repeated statements. A URL name looks the budget
+        up in settings.QUERY_BUDGETS.
+        """
+        if isinstance(budget, str):
+            url_name, budget = budget, get_budget(budget)
+            if budget is None:
+                self.fail(f'No query budget for {url_name!r} in '
+                          'settings.QUERY_BUDGETS')
+        with QueryRecorder() as recorder:
+            yield recorder
+        if len(recorder) > budget:
+            self.fail(
+                f'Query budget of {budget} exceeded:\n{recorder.report()}')
+        if max_duplicates is not None:
+            repeats = sum(
+                count - 1 for count in recorder.duplicates().values())
+            if repeats > max_duplicates:
+                self.fail(
+                    f'{repeats} duplicate queries, allowed '
+                    f'{max_duplicates}:\n{recorder.report()}')
+
+
+class QueryBudgetMiddleware:
+    """
+    Development middleware that counts each request's queries, adds them
+    as X-Query-Count and X-Query-Duplicates headers and logs a warning with
+    the full SQL when a view goes over its budget. Enable it by setting
+    the QUERY_BUDGET environment variable.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        duplicates = recorder.duplicates()
+        response['X-Query-Count'] = len(recorder)
+        response['X-Query-Duplicates'] = sum(
+            count - 1 for count in duplicates.values())
+
+        match = request.resolver_match
+        budget = get_budget(match.url_name) if match else None
+        if budget is not None and len(recorder) > budget:
+            logger.warning(
+                '%s %s went over its query budget of %s: %s',
+                request.method, request.path, budget, recorder.report())
+        elif duplicates:
+            logger.info(
+                '%s %s repeated queries: %s',
+                request.method, request.path, recorder.report())
+        return response
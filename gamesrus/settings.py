@@ -67,10 +67,19 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',  # Dont remove
     'django.contrib.messages.middleware.MessageMiddleware',
+    'bag.middleware.BagMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Development aid: report query counts per request against QUERY_BUDGETS
+if 'QUERY_BUDGET' in os.environ:
+    MIDDLEWARE.insert(0, 'gamesrus.query_budget.QueryBudgetMiddleware')
+
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
+# Where shopping bags are kept; see bag/storage/ for the alternatives.
+# bag.storage.cache.CacheBagStorage needs a CACHES backend shared by every
+# process, not the local-memory default (see Cache below).
+BAG_STORAGE = 'bag.storage.session.SessionBagStorage'
 AUTHENTICATION_BACKENDS = [
     # Needed to login by username in Django admin, regardless of `allauth`
     'django.contrib.auth.backends.ModelBackend',
@@ -138,6 +147,35 @@ else:
         }
     }
 
+# Cache
+# The product listing cache and its catalog version
+# (products/listing_cache.py) must be shared by every worker process:
+# with a per-process cache, a price change only invalidates the listings
+# of the process that saved it. Set MEMCACHED_LOCATION (host:port, comma
+# separated for several servers) to use memcached, which serves listing
+# cache hits without touching the database. Failing that, production
+# keeps the cache in the database, in a table created by the Procfile's
+# release command (python manage.py createcachetable). It is shared but
+# not free: a listing cache hit still costs a query each for the catalog
+# version, the facets and the listing. Development runs one process, so
+# the default local-memory cache is enough there.
+
+if 'MEMCACHED_LOCATION' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND':
+                'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': os.environ['MEMCACHED_LOCATION'].split(','),
+        }
+    }
+elif 'DATABASE_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'gamesrus_cache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -220,6 +258,24 @@ mimetypes.add_type("text/html", ".html", True)
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Maximum SQL queries per request for each URL name, whatever the size
+# of the catalog, bag or order history. Enforced by the budget tests.
+# Bag pages are measured with the bag's product snapshots already in the
+# session, as they are after the first page of a visit, and the checkout
+# with its PaymentIntent already created. The checkout still reads the
+# bag's products once, since it charges the database's prices.
+QUERY_BUDGETS = {
+    'products': 2,
+    'product_detail': 4,
+    'product_reviews': 1,
+    'view_bag': 1,
+    'checkout': 5,
+    'checkout_success': 10,
+    'profile': 5,
+    'order_history': 4,
+    'news': 1,
+}
+
 # Stripe
 
 FREE_DELIVERY_THRESHOLD = 100
@@ -228,6 +284,10 @@ STRIPE_CURRENCY = 'usd'
 STRIPE_PUBLIC_KEY = os.getenv('STRIPE_PUBLIC_KEY', '')
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_WH_SECRET = os.getenv('STRIPE_WH_SECRET', '')
+# Send API calls elsewhere, e.g. to the fake Stripe benchmark_checkout runs
+STRIPE_API_BASE = os.getenv('STRIPE_API_BASE', '')
+# Accept webhooks into a queue for the process_webhooks worker
+STRIPE_WH_QUEUE = 'STRIPE_WH_QUEUE' in os.environ
 DEFAULT_FROM_EMAIL = 'gamesrus@example.com'
 
 if 'DEVELOPMENT' in os.environ:
@@ -1,3 +1,33 @@
+"""
+news/tests.py: Contains testing of the news app.
+"""
+# pylint: disable=no-member
+
+from django.contrib.auth.models import User
 from django.test import TestCase
 
-# Create your tests here.
+from gamesrus.query_budget import BUDGET_SIZES, QueryBudgetTestMixin
+from .models import News
+
+
+class TestQueryBudgets(QueryBudgetTestMixin, TestCase):
+    """
+    Tests that the news list stays within its query budget
+    """
+    def test_news_list_budget(self):
+        """
+        The news list runs a fixed number of queries for any number
+        of published articles
+        """
+        author = User.objects.create_user(
+            username='test_user', password='test_password')
+        for size in BUDGET_SIZES:
+            with self.subTest(size=size):
+                News.objects.all().delete()
+                News.objects.bulk_create([
+                    News(title=f'News {i}', slug=f'news-{i}', author=author,
+                         content='Test Content', status=1)
+                    for i in range(size)])
+                with self.assertQueryBudget('news'):
+                    response = self.client.get('/news/')
+                self.assertEqual(response.status_code, 200)
@@ -6,7 +6,8 @@ class NewsList(generic.ListView):
     """
     View for displaying all news articles
     """
-    queryset = News.objects.filter(status=1).order_by('-created_on')
+    queryset = News.objects.filter(status=1).select_related(
+        'author').order_by('-created_on')
     template_name = 'news.html'
 
 
@@ -1,7 +1,23 @@
 from django.contrib import admin
+from django.http import StreamingHttpResponse
+
+from .export import EXPORT_FORMATS, export_lines, export_rows
 from .models import Product, Category, ProductReview
 
 
+def _export_response(queryset, export_format):
+    """
+    Stream the selected products to the browser as a download
+    """
+    content_type, extension = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        export_lines(export_format, export_rows(queryset)),
+        content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="catalog.{extension}"')
+    return response
+
+
 class ProductAdmin(admin.ModelAdmin):
     """
     The Admin product class
@@ -14,6 +30,15 @@ class ProductAdmin(admin.ModelAdmin):
         'rating',
         'image',
     )
+    actions = ['export_csv', 'export_ndjson']
+
+    @admin.action(description='Export selected products as CSV')
+    def export_csv(self, request, queryset):
+        return _export_response(queryset, 'csv')
+
+    @admin.action(description='Export selected products as NDJSON')
+    def export_ndjson(self, request, queryset):
+        return _export_response(queryset, 'ndjson')
 
 
 ordering = ('sku')
@@ -0,0 +1,90 @@
+"""
+products/export.py: streams the catalog out as CSV or NDJSON.
+
+Rows are read with QuerySet.iterator() and written one at a time, so
+memory use stays flat however large the catalog is. Each row is a product
+with its category and review aggregates.
+"""
+
+import csv
+import json
+from decimal import Decimal
+
+from .models import Product
+
+EXPORT_FIELDS = (
+    'id',
+    'sku',
+    'name',
+    'description',
+    'price',
+    'rating',
+    'category__name',
+    'category__friendly_name',
+    'review_count',
+    'rating_sum',
+    'image',
+)
+# Column names, with the related fields flattened
+EXPORT_COLUMNS = tuple(
+    field.replace('__', '_') for field in EXPORT_FIELDS) + ('average_rating',)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+CHUNK_SIZE = 2000
+
+
+def export_rows(queryset=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield one dict per product, ordered by id
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    rows = queryset.order_by('id').values_list(*EXPORT_FIELDS).iterator(
+        chunk_size=chunk_size)
+    for values in rows:
+        row = dict(zip(EXPORT_COLUMNS, values))
+        row['average_rating'] = (
+            round(row['rating_sum'] / row['review_count'], 2)
+            if row['review_count'] else None)
+        yield row
+
+
+class _Echo:
+    """
+    A file-like object that hands back what csv.writer writes to it
+    """
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            '' if row[column] is None else row[column]
+            for column in EXPORT_COLUMNS])
+
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(row, default=_json_default) + '\n'
+
+
+def export_lines(export_format, rows):
+    """
+    Encode rows from export_rows() as lines of the given format
+    """
+    if export_format == 'csv':
+        return _csv_lines(rows)
+    if export_format == 'ndjson':
+        return _ndjson_lines(rows)
+    raise ValueError(f'Unknown export format {export_format!r}')
@@ -0,0 +1,96 @@
+"""
+products/facets.py: category and price band counts for the product listing.
+
+Both facets come from one grouped query over (category, price band) on the
+products matching the search term. Each facet is then summed in Python
+under the other facet's filter, so a category's count reflects the chosen
+price band and vice versa, and the total for the current filters falls out
+of the same rows.
+"""
+
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = (
+    ('under-25', 'Under $25', None, 25),
+    ('25-50', '$25 to $50', 25, 50),
+    ('50-100', '$50 to $100', 50, 100),
+    ('100-250', '$100 to $250', 100, 250),
+    ('250-plus', '$250 and over', 250, None),
+)
+BAND_KEYS = tuple(key for key, _, _, _ in PRICE_BANDS)
+
+
+def price_band_filter(key):
+    """
+    Q selecting the products in one price band
+    """
+    for band, _, low, high in PRICE_BANDS:
+        if band == key:
+            condition = Q()
+            if low is not None:
+                condition &= Q(price__gte=low)
+            if high is not None:
+                condition &= Q(price__lt=high)
+            return condition
+    raise ValueError(f'Unknown price band {key!r}')
+
+
+def _price_band_case():
+    return Case(
+        *[When(price__lt=high, then=Value(key))
+          for key, _, _, high in PRICE_BANDS if high is not None],
+        default=Value(PRICE_BANDS[-1][0]),
+        output_field=CharField(),
+    )
+
+
+def count_facets(products, categories=None, price_band=None):
+    """
+    Facet counts for products, a queryset already narrowed by the search
+    term but not by category or price. categories is the list of selected
+    category names or None, price_band a key from PRICE_BANDS or None.
+    """
+    rows = (
+        products.order_by()
+        .annotate(price_band=_price_band_case())
+        .values('category__name', 'category__friendly_name', 'price_band')
+        .annotate(count=Count('id'))
+    )
+
+    selected = set(categories) if categories is not None else None
+    category_counts = {}
+    band_counts = dict.fromkeys(BAND_KEYS, 0)
+    total = 0
+    for row in rows:
+        name = row['category__name']
+        in_categories = selected is None or name in selected
+        in_band = price_band is None or row['price_band'] == price_band
+        if name is not None and in_band:
+            entry = category_counts.setdefault(name, {
+                'name': name,
+                'friendly_name': row['category__friendly_name'] or name,
+                'count': 0,
+            })
+            entry['count'] += row['count']
+        if in_categories:
+            band_counts[row['price_band']] += row['count']
+            if in_band:
+                total += row['count']
+
+    for name in selected or ():
+        category_counts.setdefault(
+            name, {'name': name, 'friendly_name': name, 'count': 0})
+    category_facets = sorted(
+        category_counts.values(), key=lambda entry: entry['friendly_name'])
+    for entry in category_facets:
+        entry['selected'] = selected is not None and entry['name'] in selected
+
+    return {
+        'total': total,
+        'categories': category_facets,
+        'price_bands': [
+            {'key': key, 'label': label, 'count': band_counts[key],
+             'selected': key == price_band}
+            for key, label, _, _ in PRICE_BANDS],
+    }
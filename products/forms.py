@@ -1,4 +1,7 @@
 from django import forms
+from django.db import transaction
+
+from .images import delete_derivatives, schedule_derivatives
 from .models import Product, Category
 
 
@@ -21,3 +24,22 @@ class ProductForm(forms.ModelForm):
         self.fields['category'].choices = friendly_names
         for field_name, field in self.fields.items():
             field.widget.attrs['class'] = 'border-black rounded-2'
+
+    def save(self, commit=True):
+        """
+        Drop the derivatives of a replaced or cleared image and build new
+        ones in the background once the product is saved
+        """
+        image_changed = 'image' in self.changed_data
+        old_variants = self.instance.image_variants
+        if image_changed:
+            self.instance.image_variants = {}
+        product = super().save(commit)
+        if commit and image_changed:
+            storage = product.image.storage
+            if old_variants:
+                transaction.on_commit(
+                    lambda: delete_derivatives(storage, old_variants))
+            if product.image:
+                schedule_derivatives(product.pk)
+        return product
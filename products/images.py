@@ -0,0 +1,176 @@
+"""
+products/images.py: responsive derivatives of product images.
+
+When a product image is uploaded, WebP and JPEG copies are generated at a
+few fixed widths and saved through the image field's storage (S3 in
+production, MEDIA_ROOT locally). Their names and sizes are recorded on
+Product.image_variants, so templates can emit srcset with width and
+height without ever opening the files.
+"""
+
+import hashlib
+import logging
+import posixpath
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from PIL import Image
+
+from . import listing_cache
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_WIDTHS = (320, 640, 960)
+DERIVATIVE_DIR = 'derivatives'
+# (key in image_variants, Pillow format, save options)
+DERIVATIVE_FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+
+
+def derivative_name(product_id, image_name, width, extension):
+    """
+    Storage name of one derivative, e.g.
+    derivatives/7/mouse-1a2b3c4d-320w.webp. The product id and a hash of
+    the image's full storage name keep images that share a file name,
+    such as mouse.png and mouse.jpg, from overwriting each other's.
+    """
+    stem = posixpath.splitext(posixpath.basename(image_name))[0]
+    digest = hashlib.sha256(image_name.encode()).hexdigest()[:8]
+    return (f'{DERIVATIVE_DIR}/{product_id}/'
+            f'{stem}-{digest}-{width}w.{extension}')
+
+
+def _target_widths(original_width):
+    """
+    The fixed widths, never upscaling past the original
+    """
+    return sorted({min(width, original_width) for width in DERIVATIVE_WIDTHS})
+
+
+def _flatten(image):
+    """
+    JPEG has no alpha channel, so composite transparent images onto white
+    """
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _encode(image, pil_format, options):
+    if pil_format == 'JPEG':
+        image = _flatten(image)
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def _save(storage, name, content):
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, content)
+
+
+def generate_derivatives(product):
+    """
+    Write the derivatives of product.image and return the image_variants
+    metadata describing them
+    """
+    field = product.image
+    storage = field.storage
+    with storage.open(field.name, 'rb') as source:
+        original = Image.open(source)
+        original.load()
+    width, height = original.size
+
+    sizes = []
+    for target in _target_widths(width):
+        target_height = max(1, round(height * target / width))
+        resized = original.resize((target, target_height), Image.LANCZOS)
+        size = {'width': target, 'height': target_height}
+        for key, pil_format, options in DERIVATIVE_FORMATS:
+            size[key] = _save(
+                storage,
+                derivative_name(product.pk, field.name, target, key),
+                _encode(resized, pil_format, options))
+        sizes.append(size)
+    return {
+        'source': field.name, 'width': width, 'height': height,
+        'sizes': sizes}
+
+
+def delete_derivatives(storage, variants, keep=()):
+    """
+    Remove the files listed in an image_variants dict, except keep
+    """
+    for size in variants.get('sizes', []):
+        for key, _, _ in DERIVATIVE_FORMATS:
+            name = size.get(key)
+            if name and name not in keep and storage.exists(name):
+                storage.delete(name)
+
+
+def build_derivatives(product_id):
+    """
+    Regenerate the derivatives of one product and record them.
+    Returns the new image_variants, or None if there is no image.
+    """
+    product = Product.objects.filter(pk=product_id).first()
+    if product is None or not product.image:
+        return None
+    old = product.image_variants or {}
+    variants = generate_derivatives(product)
+    keep = {
+        size[key] for size in variants['sizes']
+        for key, _, _ in DERIVATIVE_FORMATS}
+    # A save signal would reindex the product, so update the column alone
+    # and invalidate the cached listing pages by hand
+    with transaction.atomic():
+        updated = Product.objects.filter(
+            pk=product_id, image=variants['source']).update(
+                image_variants=variants)
+        if updated:
+            listing_cache.bump_version()
+    if not updated:
+        # The image was replaced while this one was being processed
+        delete_derivatives(product.image.storage, variants)
+        return None
+    delete_derivatives(product.image.storage, old, keep)
+    return variants
+
+
+def _build_in_background(product_id):
+    close_old_connections()
+    try:
+        build_derivatives(product_id)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception(
+            'Could not build image derivatives for product %s', product_id)
+    finally:
+        connection.close()
+
+
+def schedule_derivatives(product_id):
+    """
+    Build the derivatives on a background thread once the current
+    transaction commits, keeping resizing off the request path. Set
+    PRODUCT_IMAGE_DERIVATIVES_SYNC to build them inline instead.
+    """
+    def start():
+        if getattr(settings, 'PRODUCT_IMAGE_DERIVATIVES_SYNC', False):
+            build_derivatives(product_id)
+        else:
+            threading.Thread(
+                target=_build_in_background, args=(product_id,),
+                daemon=True).start()
+    transaction.on_commit(start)
@@ -0,0 +1,71 @@
+"""
+products/listing_cache.py: versioned cache for the product listing.
+
+Each entry is stored under the current catalog version, so bumping the
+version from the Product, Category and ProductReview signals orphans every
+cached page at once. Orphaned entries simply expire.
+
+The version is only seen by the processes sharing the cache, so with
+more than one worker the cache must be shared too; see CACHES in
+settings.
+"""
+
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'products:listing:version'
+CACHE_TIMEOUT = 60 * 60
+CSRF_PLACEHOLDER = '__products_listing_csrf_token__'
+
+
+def _new_version():
+    """
+    Versions start from the clock so an evicted version key can't bring
+    back entries cached under an earlier version
+    """
+    return int(time.time() * 1000)
+
+
+def get_version():
+    """
+    Return the current catalog version
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, _new_version(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """
+    Invalidate every cached listing once the current transaction commits,
+    so no request can cache rows that are about to change
+    """
+    def bump():
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, _new_version(), None)
+    transaction.on_commit(bump)
+
+
+def make_key(params):
+    """
+    Cache key for a dict of normalized listing parameters
+    """
+    digest = hashlib.sha256(
+        json.dumps(params, sort_keys=True).encode()).hexdigest()
+    return f'products:listing:{get_version()}:{digest}'
+
+
+def get_listing(key):
+    return cache.get(key)
+
+
+def set_listing(key, listing):
+    cache.set(key, listing, CACHE_TIMEOUT)
@@ -0,0 +1,93 @@
+"""
+products/management/commands/benchmark_search.py: seeds a large synthetic
+catalog inside a transaction, times product searches against it with the
+full-text backend and the icontains fallback, then rolls everything back.
+"""
+
+import itertools
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products.models import Product
+from products.search import LikeSearchBackend, get_search_backend
+
+WORDS = (
+    'gaming', 'mouse', 'keyboard', 'headset', 'wireless', 'mechanical',
+    'rgb', 'monitor', 'controller', 'chair', 'desk', 'webcam', 'microphone',
+    'speaker', 'ergonomic', 'optical', 'switch', 'cable', 'usb', 'bluetooth',
+    'silent', 'pro', 'ultra', 'compact', 'curved', 'surround', 'latency',
+    'battery', 'aluminium', 'backlit', 'programmable', 'pad', 'stand',
+)
+SYLLABLES = ('ka', 'lo', 'mi', 'ran', 'te', 'vo', 'zu', 'pel', 'dri', 'sto')
+TERMS = ('mouse', 'wireless keyboard', 'curved monitor', 'ergo', 'zzzz')
+
+
+class Command(BaseCommand):
+    """
+    Benchmark product search latency
+    """
+    help = ('Time product searches against a synthetic catalog. '
+            'All seeded rows are rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000)
+        parser.add_argument('--runs', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=24)
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        with transaction.atomic():
+            self._seed(options['products'])
+            backend.rebuild()
+            for name, engine in (
+                    (backend.__class__.__name__, backend),
+                    ('LikeSearchBackend', LikeSearchBackend())):
+                for term in TERMS:
+                    self._report(name, engine, term, options)
+            transaction.set_rollback(True)
+
+    def _seed(self, count):
+        # Descriptions draw from a Zipf-like vocabulary so that, as in real
+        # text, a few words are common and most are rare
+        vocabulary = list(WORDS) + [
+            ''.join(parts) for parts in itertools.product(SYLLABLES, repeat=3)]
+        rng = random.Random(0)
+        rng.shuffle(vocabulary)
+        cum_weights = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(vocabulary) + 1)))
+        started = time.perf_counter()
+        batch = []
+        for i in range(count):
+            batch.append(Product(
+                name=' '.join(rng.choices(WORDS, k=3)).title(),
+                description=' '.join(rng.choices(
+                    vocabulary, cum_weights=cum_weights, k=40)),
+                price=rng.randint(100, 50000) / 100,
+                sku=f'bench-{i}',
+            ))
+            if len(batch) == 1000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+        self.stdout.write(
+            f'Seeded {count} products in '
+            f'{time.perf_counter() - started:.1f}s')
+
+    def _report(self, name, engine, term, options):
+        timings = []
+        for _ in range(options['runs']):
+            started = time.perf_counter()
+            results = engine.search(Product.objects.all(), term).order_by(
+                '-search_rank', 'id')
+            list(results.values_list('id', flat=True)[:options['limit']])
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        matches = engine.search(Product.objects.all(), term).count()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f'{name:<22} {term!r:<20} {matches:>7} matches  '
+            f'p50 {statistics.median(timings):8.2f}ms  p95 {p95:8.2f}ms')
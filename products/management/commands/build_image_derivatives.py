@@ -0,0 +1,44 @@
+"""
+products/management/commands/build_image_derivatives.py: generates the
+responsive WebP and JPEG derivatives for products uploaded before they
+existed, or for every product with --force.
+"""
+
+from django.core.management.base import BaseCommand
+
+from products.images import build_derivatives
+from products.models import Product
+
+
+class Command(BaseCommand):
+    """
+    Backfill Product.image_variants
+    """
+    help = ('Generate responsive image derivatives for products that are '
+            'missing them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild derivatives that already exist.')
+
+    def handle(self, *args, **options):
+        products = Product.objects.exclude(image='').exclude(image=None)
+        if not options['force']:
+            products = products.filter(image_variants={})
+
+        built = failed = 0
+        for product_id in products.values_list('id', flat=True).iterator():
+            try:
+                build_derivatives(product_id)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f'Product {product_id}: {error}')
+            else:
+                built += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Built image derivatives for {built} product(s).'))
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'{failed} product(s) could not be processed.'))
@@ -0,0 +1,116 @@
+"""
+products/management/commands/check_query_plans.py: runs EXPLAIN on the
+site's hot lookups and reports whether each one is served by an index,
+so that plan regressions are caught before they reach production.
+"""
+
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Lower
+
+from checkout.models import Order
+from contact.models import ContactMessage
+from products.models import Product, ProductReview
+
+SQLITE_INDEX_RE = re.compile(
+    r'USING (COVERING )?INDEX|USING (INTEGER )?PRIMARY KEY')
+SQLITE_SORT_RE = re.compile(r'USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+POSTGRES_INDEX_RE = re.compile(r'(Bitmap )?Index( Only)? Scan')
+POSTGRES_SORT_RE = re.compile(r'^\s*(->\s*)?(Incremental )?Sort\b', re.M)
+
+PAGE = 25
+
+
+def canonical_queries():
+    """
+    (label, queryset, ordered) for each access path the site relies on.
+    Ordered queries must also be returned in index order, without a sort.
+    """
+    products = Product.objects.all()
+    named = products.annotate(lower_name=Lower('name'))
+    in_category = products.filter(category_id=1)
+    return [
+        ('order by order_number',
+         Order.objects.filter(order_number='0' * 32), False),
+        ('order by stripe_pid',
+         Order.objects.filter(stripe_pid='pi_0'), False),
+        ('products by name',
+         named.order_by('lower_name', 'id')[:PAGE], True),
+        ('products by name desc',
+         named.order_by('-lower_name', '-id')[:PAGE], True),
+        ('products by price',
+         products.order_by('price', 'id')[:PAGE], True),
+        ('products by price desc',
+         products.order_by('-price', '-id')[:PAGE], True),
+        ('products by rating',
+         products.order_by(
+             F('rating').asc(nulls_first=True), 'id')[:PAGE], True),
+        ('products by rating desc',
+         products.order_by(
+             F('rating').desc(nulls_last=True), '-id')[:PAGE], True),
+        ('category products by name',
+         in_category.annotate(lower_name=Lower('name')).order_by(
+             'lower_name', 'id')[:PAGE], True),
+        ('category products by price',
+         in_category.order_by('price', 'id')[:PAGE], True),
+        ('category products by rating',
+         in_category.order_by(
+             F('rating').asc(nulls_first=True), 'id')[:PAGE], True),
+        ('reviews for a product',
+         ProductReview.objects.filter(product_id=1).order_by(
+             '-date_added', '-id')[:PAGE], True),
+        ('latest contact messages',
+         ContactMessage.objects.order_by('-message_sent')[:PAGE], True),
+    ]
+
+
+def check_plan(plan, ordered):
+    """
+    Return a list of problems with an EXPLAIN plan
+    """
+    if connection.vendor == 'postgresql':
+        index_re, sort_re = POSTGRES_INDEX_RE, POSTGRES_SORT_RE
+    else:
+        index_re, sort_re = SQLITE_INDEX_RE, SQLITE_SORT_RE
+    problems = []
+    if not index_re.search(plan):
+        problems.append('no index used')
+    if ordered and sort_re.search(plan):
+        problems.append('sorts instead of reading an index in order')
+    return problems
+
+
+class Command(BaseCommand):
+    """
+    EXPLAIN the canonical queries and flag any that miss their index
+    """
+    help = ('Run EXPLAIN on the hot lookups and fail if any of them is '
+            'not served by an index.')
+
+    def handle(self, *args, **options):
+        failures = 0
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Small tables make sequential scans look cheaper, so
+                # ask whether an index can serve the query at all
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for label, queryset, ordered in canonical_queries():
+                plan = queryset.explain()
+                problems = check_plan(plan, ordered)
+                if problems:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(
+                        f'FAIL  {label}: {", ".join(problems)}'))
+                else:
+                    self.stdout.write(f'ok    {label}')
+                if problems or options['verbosity'] > 1:
+                    self.stdout.write(f'      {plan}'.replace(
+                        '\n', '\n      '))
+
+        if failures:
+            raise CommandError(f'{failures} query plan(s) missed an index.')
+        self.stdout.write(self.style.SUCCESS('All query plans use indexes.'))
@@ -0,0 +1,42 @@
+"""
+products/management/commands/rebuild_review_aggregates.py: recomputes the
+review_count and rating_sum columns on every product from its reviews.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from products import listing_cache
+from products.models import Product, ProductReview
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the denormalized review aggregates on Product
+    """
+    help = 'Recompute review_count and rating_sum for all products.'
+
+    def handle(self, *args, **options):
+        totals = {
+            row['product']: row
+            for row in ProductReview.objects.values('product').annotate(
+                count=Count('id'), stars=Sum('stars'))
+        }
+
+        updated = []
+        with transaction.atomic():
+            for product in Product.objects.select_for_update().only(
+                    'id', 'review_count', 'rating_sum'):
+                row = totals.get(product.id, {'count': 0, 'stars': 0})
+                if (product.review_count != row['count']
+                        or product.rating_sum != row['stars']):
+                    product.review_count = row['count']
+                    product.rating_sum = row['stars']
+                    updated.append(product)
+            Product.objects.bulk_update(
+                updated, ['review_count', 'rating_sum'], batch_size=500)
+
+        listing_cache.bump_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt review aggregates for {len(updated)} product(s).'))
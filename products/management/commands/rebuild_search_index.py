@@ -0,0 +1,26 @@
+"""
+products/management/commands/rebuild_search_index.py: reindexes every
+product in the full-text search backend.
+"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products import listing_cache
+from products.search import get_search_backend
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the product search index
+    """
+    help = 'Reindex all products for full-text search.'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        with transaction.atomic():
+            count = backend.rebuild()
+        listing_cache.bump_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Reindexed {count} product(s) with '
+            f'{backend.__class__.__name__}.'))
@@ -0,0 +1,35 @@
+# Generated by Django 3.2 on 2026-10-18 10:02
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_review_aggregates(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductReview = apps.get_model('products', 'ProductReview')
+    for row in ProductReview.objects.values('product').annotate(
+            count=Count('id'), stars=Sum('stars')):
+        Product.objects.filter(pk=row['product']).update(
+            review_count=row['count'], rating_sum=row['stars'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_alter_productreview_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(
+            backfill_review_aggregates, migrations.RunPython.noop),
+    ]
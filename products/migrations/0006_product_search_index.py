@@ -0,0 +1,58 @@
+# Generated by Django 3.2 on 2026-10-18 10:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE products_product ADD COLUMN search_vector tsvector')
+        schema_editor.execute(
+            "UPDATE products_product SET search_vector = "
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), "
+            "'B')")
+        schema_editor.execute(
+            'CREATE INDEX products_product_search_vector_gin '
+            'ON products_product USING gin (search_vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE products_product_fts USING fts5('
+            "name, description, tokenize = 'porter unicode61')")
+        schema_editor.execute(
+            'INSERT INTO products_product_fts (rowid, name, description) '
+            'SELECT id, name, description FROM products_product')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE products_product DROP COLUMN search_vector')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE products_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_review_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.CreateModel(
+            name='ProductSearchEntry',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='products.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+            ],
+            options={
+                'db_table': 'products_product_fts',
+                'managed': False,
+            },
+        ),
+    ]
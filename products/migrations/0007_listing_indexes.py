@@ -0,0 +1,56 @@
+# Generated by Django 3.2 on 2026-10-18 10:26
+
+from django.db import migrations, models
+import django.db.models.expressions
+import django.db.models.functions.text
+
+
+def create_rating_indexes(apps, schema_editor):
+    # The listing sorts NULL ratings lowest, which Postgres only serves
+    # from an index declared NULLS FIRST. SQLite already sorts NULLs
+    # first and rejects the modifier.
+    nulls = (
+        ' NULLS FIRST'
+        if schema_editor.connection.vendor == 'postgresql' else '')
+    schema_editor.execute(
+        f'CREATE INDEX product_rating_idx ON products_product '
+        f'(rating{nulls}, id)')
+    schema_editor.execute(
+        f'CREATE INDEX product_cat_rating_idx ON products_product '
+        f'(category_id, rating{nulls}, id)')
+
+
+def drop_rating_indexes(apps, schema_editor):
+    schema_editor.execute('DROP INDEX product_rating_idx')
+    schema_editor.execute('DROP INDEX product_cat_rating_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rating_indexes, drop_rating_indexes),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Lower('name'), django.db.models.expressions.F('id'), name='product_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.expressions.F('category'), django.db.models.functions.text.Lower('name'), django.db.models.expressions.F('id'), name='product_cat_lower_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'id'], name='product_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productreview',
+            index=models.Index(fields=['product', '-date_added', '-id'], name='review_product_date_idx'),
+        ),
+    ]
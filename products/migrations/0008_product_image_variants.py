@@ -0,0 +1,55 @@
+# Generated by Django 3.2 on 2026-10-18 10:31
+
+from django.db import migrations, models
+
+
+def image_variants_field():
+    field = models.JSONField(blank=True, default=dict, editable=False)
+    field.set_attributes_from_name('image_variants')
+    return field
+
+
+def add_image_variants(apps, schema_editor):
+    # Django's SQLite backend adds a column by rebuilding the table, which
+    # fails on the expression indexes and would drop the raw rating
+    # indexes from 0007, so add it in place there.
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            "ALTER TABLE products_product ADD COLUMN image_variants text "
+            "NOT NULL DEFAULT '{}' CHECK (JSON_VALID(image_variants))")
+    else:
+        schema_editor.add_field(
+            apps.get_model('products', 'Product'), image_variants_field())
+
+
+def remove_image_variants(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'ALTER TABLE products_product DROP COLUMN image_variants')
+    else:
+        schema_editor.remove_field(
+            apps.get_model('products', 'Product'), image_variants_field())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(
+                    add_image_variants, remove_image_variants),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='product',
+                    name='image_variants',
+                    field=models.JSONField(
+                        blank=True, default=dict, editable=False),
+                ),
+            ],
+        ),
+    ]
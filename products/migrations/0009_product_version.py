@@ -0,0 +1,52 @@
+# Generated by Django 3.2 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+def version_field():
+    field = models.PositiveIntegerField(default=1, editable=False)
+    field.set_attributes_from_name('version')
+    return field
+
+
+def add_version(apps, schema_editor):
+    # Added in place on SQLite for the same reason as in 0008
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'ALTER TABLE products_product ADD COLUMN version integer '
+            'unsigned NOT NULL DEFAULT 1 CHECK (version >= 0)')
+    else:
+        schema_editor.add_field(
+            apps.get_model('products', 'Product'), version_field())
+
+
+def remove_version(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(
+            'ALTER TABLE products_product DROP COLUMN version')
+    else:
+        schema_editor.remove_field(
+            apps.get_model('products', 'Product'), version_field())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunPython(add_version, remove_version),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='product',
+                    name='version',
+                    field=models.PositiveIntegerField(
+                        default=1, editable=False),
+                ),
+            ],
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 
 
@@ -25,6 +27,24 @@ class Product(models.Model):
     """
     The Product model class, used to generate an instance of a product
     """
+    class Meta:
+        """
+        Indexes for the listing sorts, alone and within a category, each
+        ending in the pk tie-breaker used by the keyset pagination. The
+        rating sorts need NULLS FIRST on Postgres, so migration 0007
+        creates those per database.
+        """
+        indexes = [
+            models.Index(
+                Lower('name'), F('id'), name='product_lower_name_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(
+                F('category'), Lower('name'), F('id'),
+                name='product_cat_lower_name_idx'),
+            models.Index(
+                fields=['category', 'price', 'id'],
+                name='product_cat_price_idx'),
+        ]
     category = models.ForeignKey(
         'Category', null=True, blank=True, on_delete=models.SET_NULL)
     sku = models.CharField(
@@ -36,15 +56,53 @@ class Product(models.Model):
         max_digits=6, decimal_places=2, null=True, blank=True)
     image_url = models.URLField(max_length=1024, null=True, blank=True)
     image = models.ImageField(null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
-    def get_rating(self):
-        total = sum(int(review['stars']) for review in self.reviews.values())
+    def _image_srcset(self, key):
+        storage = self.image.storage
+        return ', '.join(
+            f"{storage.url(size[key])} {size['width']}w"
+            for size in self.image_variants.get('sizes', []))
+
+    @property
+    def image_webp_srcset(self):
+        """
+        srcset of the WebP derivatives built by products/images.py
+        """
+        return self._image_srcset('webp')
 
-        if self.reviews.count() > 0:
-            return total / self.reviews.count()
+    @property
+    def image_jpeg_srcset(self):
+        """
+        srcset of the JPEG derivatives built by products/images.py
+        """
+        return self._image_srcset('jpeg')
+
+    @property
+    def image_fallback(self):
+        """
+        The largest JPEG derivative, for browsers without srcset
+        """
+        sizes = self.image_variants.get('sizes')
+        if not sizes:
+            return None
+        largest = sizes[-1]
+        return {
+            'url': self.image.storage.url(largest['jpeg']),
+            'width': largest['width'], 'height': largest['height']}
+
+    def get_rating(self):
+        """
+        Average user rating, read from the denormalized review
+        aggregates kept up to date by products/signals.py
+        """
+        if self.review_count > 0:
+            return self.rating_sum / self.review_count
         else:
             return 0
 
@@ -53,6 +111,15 @@ class ProductReview(models.Model):
     """
     Model for user to make reviews on products
     """
+    class Meta:
+        """
+        Index for a product's reviews, newest first
+        """
+        indexes = [
+            models.Index(
+                fields=['product', '-date_added', '-id'],
+                name='review_product_date_idx'),
+        ]
     product = models.ForeignKey(
         Product, related_name='reviews', on_delete=models.CASCADE)
     user = models.ForeignKey(
@@ -60,3 +127,21 @@ class ProductReview(models.Model):
     content = models.TextField(blank=True, null=True)
     stars = models.IntegerField()
     date_added = models.DateTimeField(auto_now_add=True)
+
+
+class ProductSearchEntry(models.Model):
+    """
+    A row of the SQLite FTS5 search table created by migration 0006,
+    keyed by the product id. Only used to join products to the index.
+    """
+    class Meta:
+        """
+        The table is a virtual table that Django must not manage.
+        """
+        managed = False
+        db_table = 'products_product_fts'
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column='rowid',
+        related_name='search_entry', on_delete=models.DO_NOTHING)
+    name = models.TextField()
+    description = models.TextField()
@@ -0,0 +1,217 @@
+"""
+products/pagination.py: keyset (cursor) pagination for the product listing.
+
+Pages are fetched with a WHERE predicate on the sort key values of the
+last row seen instead of an OFFSET, so every page costs the same as the
+first. NULLs always sort as the lowest value, on every database.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+
+from django.core import signing
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+
+CURSOR_SALT = 'products.pagination'
+
+
+class KeysetPage:
+    """
+    One page of results with opaque cursors for its neighbours
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _is_nullable(model, name):
+    """
+    Whether a field path like category__name can hold NULL.
+    Annotations are assumed not to.
+    """
+    opts = model._meta
+    for part in name.split('__'):
+        try:
+            field = opts.get_field(part)
+        except FieldDoesNotExist:
+            return False
+        if field.null:
+            return True
+        if field.is_relation:
+            opts = field.related_model._meta
+    return False
+
+
+def _parse_ordering(model, ordering):
+    """
+    Turn ['-price', 'id'] into [(name, descending, nullable), ...]
+    """
+    keys = []
+    for item in ordering:
+        descending = item.startswith('-')
+        name = item.lstrip('-')
+        keys.append((name, descending, _is_nullable(model, name)))
+    return keys
+
+
+def _order_by(keys, reverse):
+    """
+    order_by() expressions for the keys, optionally walking backwards
+    """
+    expressions = []
+    for name, descending, nullable in keys:
+        if descending != reverse:
+            expressions.append(F(name).desc(nulls_last=nullable))
+        else:
+            expressions.append(F(name).asc(nulls_first=nullable))
+    return expressions
+
+
+def _after(name, descending, nullable, value):
+    """
+    Q for rows strictly after value on one key, with NULL lowest
+    """
+    if value is None:
+        if descending:
+            return Q(pk__in=[])
+        return Q(**{f'{name}__isnull': False})
+    if descending:
+        after = Q(**{f'{name}__lt': value})
+        if nullable:
+            after |= Q(**{f'{name}__isnull': True})
+        return after
+    return Q(**{f'{name}__gt': value})
+
+
+def _equal(name, value):
+    if value is None:
+        return Q(**{f'{name}__isnull': True})
+    return Q(**{name: value})
+
+
+def _keyset_filter(keys, values, reverse):
+    """
+    (k1 after v1) OR (k1 = v1 AND k2 after v2) OR ...
+    """
+    predicate = Q(pk__in=[])
+    prefix = Q()
+    for (name, descending, nullable), value in zip(keys, values):
+        step = _after(name, descending != reverse, nullable, value)
+        predicate |= prefix & step
+        prefix &= _equal(name, value)
+    return predicate
+
+
+def _encode(value):
+    if isinstance(value, Decimal):
+        return {'d': str(value)}
+    if isinstance(value, datetime):
+        return {'t': value.isoformat()}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if 't' in value:
+            return datetime.fromisoformat(value['t'])
+        return Decimal(value['d'])
+    return value
+
+
+def _make_cursor(signature, obj, keys, reverse):
+    values = [_encode(getattr(obj, name)) for name, _, _ in keys]
+    return signing.dumps(
+        {'s': signature, 'v': values, 'r': reverse}, salt=CURSOR_SALT,
+        compress=True)
+
+
+def _read_cursor(cursor, signature):
+    """
+    Return (values, reverse), or (None, False) for a missing, tampered
+    or stale cursor, which restarts from the first page
+    """
+    if not cursor:
+        return None, False
+    try:
+        data = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        return None, False
+    if data.get('s') != signature:
+        return None, False
+    return [_decode(value) for value in data['v']], bool(data['r'])
+
+
+def paginate(queryset, ordering, cursor=None, page_size=24):
+    """
+    Return the KeysetPage of queryset, ordered by ordering, that cursor
+    points at. The ordering must be unique, so end it with the pk.
+
+    Related field paths such as category__name are annotated onto the
+    rows so the cursor values can be read without extra queries.
+    """
+    keys = _parse_ordering(queryset.model, ordering)
+    signature = list(ordering)
+    values, reverse = _read_cursor(cursor, signature)
+
+    related = {
+        name: F(name) for name, _, _ in keys
+        if '__' in name and name not in queryset.query.annotations}
+    if related:
+        queryset = queryset.annotate(**{
+            f'cursor_key_{index}': expression
+            for index, expression in enumerate(related.values())})
+        renamed = {
+            name: f'cursor_key_{index}' for index, name in enumerate(related)}
+        keys = [
+            (renamed.get(name, name), descending, nullable)
+            for name, descending, nullable in keys]
+
+    queryset = queryset.order_by(*_order_by(keys, reverse))
+    if values is not None:
+        queryset = queryset.filter(_keyset_filter(keys, values, reverse))
+
+    rows = list(queryset[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    if reverse:
+        rows.reverse()
+        next_cursor = (
+            _make_cursor(signature, rows[-1], keys, False) if rows else None)
+        previous_cursor = (
+            _make_cursor(signature, rows[0], keys, True)
+            if has_more else None)
+    else:
+        next_cursor = (
+            _make_cursor(signature, rows[-1], keys, False)
+            if has_more else None)
+        previous_cursor = (
+            _make_cursor(signature, rows[0], keys, True)
+            if values is not None and rows else None)
+
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def page_url(request, cursor):
+    """
+    The current page's URL pointed at the page cursor points at
+    """
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'{request.path}?{params.urlencode()}'
@@ -0,0 +1,164 @@
+"""
+products/search.py: full-text product search.
+
+The backend is picked from the database vendor: Postgres uses a weighted
+tsvector column with a GIN index, SQLite uses an FTS5 virtual table and
+anything else falls back to the original icontains lookup. Every backend
+annotates matching products with ``search_rank``, where higher is a
+better match.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class BaseSearchBackend:
+    """
+    Interface shared by the search backends
+    """
+    def search(self, queryset, query):
+        """
+        Filter a Product queryset down to matches for query,
+        annotated with search_rank
+        """
+        raise NotImplementedError
+
+    def index_product(self, product):
+        """
+        Bring the index entry for a saved product up to date
+        """
+
+    def remove_product(self, product_id):
+        """
+        Drop the index entry for a deleted product
+        """
+
+    def rebuild(self):
+        """
+        Reindex every product, returns the number indexed
+        """
+        return 0
+
+
+class LikeSearchBackend(BaseSearchBackend):
+    """
+    Unindexed fallback for databases without a full-text engine
+    """
+    def search(self, queryset, query):
+        queries = Q(name__icontains=query) | Q(description__icontains=query)
+        return queryset.filter(queries).annotate(
+            search_rank=Value(0.0, output_field=FloatField()))
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Searches the GIN indexed search_vector column on products_product
+    """
+    vector_sql = (
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    )
+
+    def search(self, queryset, query):
+        tsquery = "plainto_tsquery('english', %s)"
+        match = RawSQL(
+            f'"products_product"."search_vector" @@ {tsquery}', (query,),
+            output_field=BooleanField())
+        # Cast so cursors built from the rank compare equal on the way back
+        rank = RawSQL(
+            f'ts_rank("products_product"."search_vector", {tsquery})'
+            f'::float8', (query,), output_field=FloatField())
+        return queryset.filter(match).annotate(search_rank=rank)
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE products_product SET search_vector = '
+                f'{self.vector_sql} WHERE id = %s', [product.pk])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE products_product SET search_vector = '
+                f'{self.vector_sql}')
+            return cursor.rowcount
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """
+    Searches the products_product_fts FTS5 table, whose rowid is the
+    product id. Names weigh ten times as much as descriptions in bm25.
+    """
+    def _match_expression(self, query):
+        """
+        Quote every word so user input can't inject FTS5 query syntax,
+        the last word also matches as a prefix
+        """
+        tokens = [f'"{token}"' for token in TOKEN_RE.findall(query)]
+        if tokens:
+            tokens[-1] += '*'
+        return ' '.join(tokens)
+
+    def search(self, queryset, query):
+        match = self._match_expression(query)
+        if not match:
+            return queryset.none()
+        # Join the FTS table so SQLite drives the query from the MATCH,
+        # bm25() is lower for better matches, so flip its sign
+        match_sql = RawSQL(
+            '"products_product_fts" MATCH %s', (match,),
+            output_field=BooleanField())
+        rank = RawSQL(
+            '-bm25("products_product_fts", 10.0, 1.0)', (),
+            output_field=FloatField())
+        return queryset.filter(search_entry__isnull=False).filter(
+            match_sql).annotate(search_rank=rank)
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM products_product_fts WHERE rowid = %s',
+                [product.pk])
+            cursor.execute(
+                'INSERT INTO products_product_fts (rowid, name, description) '
+                'VALUES (%s, %s, %s)',
+                [product.pk, product.name, product.description])
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'DELETE FROM products_product_fts WHERE rowid = %s',
+                [product_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM products_product_fts')
+            cursor.execute(
+                'INSERT INTO products_product_fts (rowid, name, description) '
+                'SELECT id, name, description FROM products_product')
+            return cursor.rowcount
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend():
+    """
+    Return the search backend for the default database
+    """
+    return BACKENDS.get(connection.vendor, LikeSearchBackend)()
+
+
+def search_products(queryset, query):
+    """
+    Filter a Product queryset by a search term, annotated with search_rank
+    """
+    return get_search_backend().search(queryset, query)
@@ -0,0 +1,64 @@
+"""
+products/signals.py: keeps the review aggregates, the search index and
+the listing cache in step with products, categories and reviews.
+"""
+
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import listing_cache
+from .models import Category, Product, ProductReview
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=ProductReview)
+def update_review_aggregates_on_save(sender, instance, created, **kwargs):
+    """
+    Add a new review to its product's review count and rating sum
+    """
+    if created:
+        Product.objects.filter(pk=instance.product_id).update(
+            review_count=F('review_count') + 1,
+            rating_sum=F('rating_sum') + int(instance.stars),
+        )
+
+
+@receiver(post_delete, sender=ProductReview)
+def update_review_aggregates_on_delete(sender, instance, **kwargs):
+    """
+    Remove a deleted review from its product's review count and rating sum
+    """
+    Product.objects.filter(pk=instance.product_id).update(
+        review_count=F('review_count') - 1,
+        rating_sum=F('rating_sum') - int(instance.stars),
+    )
+
+
+@receiver(post_save, sender=Product)
+def update_search_index_on_save(sender, instance, **kwargs):
+    """
+    Reindex a product whenever it is saved
+    """
+    get_search_backend().index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def update_search_index_on_delete(sender, instance, **kwargs):
+    """
+    Drop a deleted product from the search index
+    """
+    get_search_backend().remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=ProductReview)
+@receiver(post_delete, sender=ProductReview)
+def invalidate_listing_cache(sender, **kwargs):
+    """
+    Any catalog change invalidates every cached product listing
+    """
+    listing_cache.bump_version()
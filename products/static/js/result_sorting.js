@@ -19,6 +19,8 @@ $('#sort-selector, #sort-selector-brand').change(function () {
     let currentUrl = new URL(window.location);
 
     let selectedVal = selector.val();
+    // A new sort order starts again from the first page
+    currentUrl.searchParams.delete("cursor");
     if (selectedVal != "reset") {
         let sort = selectedVal.split("_")[0];
         var direction = selectedVal.split("_")[1];
@@ -0,0 +1,54 @@
+/**
+ * review_feed.js: loads further pages of reviews on the product
+ * detail page as the reader scrolls to the end of the list.
+ */
+
+/*jshint esversion: 6 */
+/*globals $:false */
+
+$(function () {
+    let more = $('#review-feed-more');
+    if (!more.length) {
+        return;
+    }
+    let loading = false;
+
+    function loadNextPage() {
+        let nextUrl = more.data('next-url');
+        if (loading || !nextUrl) {
+            return;
+        }
+        loading = true;
+        $.getJSON(nextUrl).done(function (data) {
+            $('#review-list').append(data.html);
+            if (data.next_url) {
+                more.data('next-url', data.next_url);
+                if (observer) {
+                    // Re-observing reports the button again if the new
+                    // reviews were too short to push it out of view
+                    observer.unobserve(more[0]);
+                    observer.observe(more[0]);
+                }
+            } else {
+                more.remove();
+                if (observer) {
+                    observer.disconnect();
+                }
+            }
+        }).always(function () {
+            loading = false;
+        });
+    }
+
+    more.find('button').click(loadNextPage);
+
+    let observer = null;
+    if ('IntersectionObserver' in window) {
+        observer = new IntersectionObserver(function (entries) {
+            if (entries.some(entry => entry.isIntersecting)) {
+                loadNextPage();
+            }
+        }, {rootMargin: '200px'});
+        observer.observe(more[0]);
+    }
+});
@@ -1,3 +1,724 @@
-from django.test import TestCase
+"""
+products/tests.py: Contains testing of the products app.
+"""
+# pylint: disable=no-member
 
-# Create your tests here.
+import csv
+import json
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from gamesrus.query_budget import BUDGET_SIZES, QueryBudgetTestMixin
+
+from .forms import ProductForm
+from .management.commands.check_query_plans import check_plan
+from .models import Category, Product, ProductReview
+from .pagination import paginate
+from .search import search_products
+
+
+class TestReviewAggregates(TestCase):
+    """
+    Tests the denormalized review aggregates on Product
+    """
+    def setUp(self):
+        """
+        Create a test user and product
+        """
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password')
+        self.product = Product.objects.create(
+            name='Test Name',
+            price='99.99',
+            description='Test Description',
+        )
+
+    def test_reviews_update_aggregates(self):
+        """
+        Creating and deleting reviews keeps the count and sum current
+        """
+        ProductReview.objects.create(
+            product=self.product, user=self.user, stars=4)
+        review = ProductReview.objects.create(
+            product=self.product, user=self.user, stars=1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 2)
+        self.assertEqual(self.product.rating_sum, 5)
+        self.assertEqual(self.product.get_rating(), 2.5)
+
+        review.delete()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 1)
+        self.assertEqual(self.product.get_rating(), 4)
+
+    def test_get_rating_runs_no_queries(self):
+        """
+        Reading the rating does not touch the reviews table
+        """
+        ProductReview.objects.create(
+            product=self.product, user=self.user, stars=3)
+        product = Product.objects.get(pk=self.product.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(product.get_rating(), 3)
+
+    def test_rebuild_command_repairs_drift(self):
+        """
+        The rebuild command recomputes aggregates from the reviews
+        """
+        ProductReview.objects.create(
+            product=self.product, user=self.user, stars=5)
+        Product.objects.filter(pk=self.product.pk).update(
+            review_count=7, rating_sum=1)
+        call_command('rebuild_review_aggregates', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.review_count, 1)
+        self.assertEqual(self.product.rating_sum, 5)
+
+
+class TestProductSearch(TestCase):
+    """
+    Tests the full-text product search
+    """
+    def setUp(self):
+        """
+        Create products that match a search term in different fields
+        """
+        cache.clear()
+        self.in_description = Product.objects.create(
+            name='Gaming Headset',
+            price='49.99',
+            description='Pairs well with any wireless mouse.',
+        )
+        self.in_name = Product.objects.create(
+            name='Wireless Mouse',
+            price='29.99',
+            description='A light optical mouse.',
+        )
+        Product.objects.create(
+            name='Desk Mat',
+            price='9.99',
+            description='Large cloth pad.',
+        )
+
+    def test_search_ranks_name_matches_first(self):
+        """
+        Name matches outrank description matches
+        """
+        results = search_products(
+            Product.objects.all(), 'wireless mouse').order_by('-search_rank')
+        self.assertEqual(
+            list(results), [self.in_name, self.in_description])
+
+    def test_index_follows_saves_and_deletes(self):
+        """
+        Saved changes are searchable and deleted products disappear
+        """
+        self.in_name.name = 'Trackball'
+        self.in_name.description = 'Thumb operated.'
+        self.in_name.save()
+        self.assertEqual(
+            list(search_products(Product.objects.all(), 'trackball')),
+            [self.in_name])
+
+        self.in_name.delete()
+        self.assertFalse(
+            search_products(Product.objects.all(), 'trackball').exists())
+
+    def test_search_input_is_not_query_syntax(self):
+        """
+        Search operators typed by users are treated as plain words
+        """
+        results = search_products(Product.objects.all(), 'mouse" OR (pad')
+        self.assertFalse(results.exists())
+
+    def test_products_view_search(self):
+        """
+        The products page lists search results by relevance
+        """
+        response = self.client.get('/products/', {'q': 'mouse'})
+        self.assertEqual(
+            list(response.context['products']),
+            [self.in_name, self.in_description])
+
+
+class TestKeysetPagination(TestCase):
+    """
+    Tests cursor pagination over every listing sort key
+    """
+    def setUp(self):
+        """
+        Create products with duplicate and missing sort key values
+        """
+        cache.clear()
+        consoles = Category.objects.create(name='consoles')
+        mice = Category.objects.create(name='mice')
+        rows = [
+            ('b', '10.00', '4.50', consoles),
+            ('A', '10.00', None, mice),
+            ('c', '5.00', '4.50', None),
+            ('e', '20.00', '1.00', mice),
+            ('D', '5.00', None, consoles),
+            ('f', '15.00', '3.00', None),
+            ('g', '10.00', '4.50', mice),
+        ]
+        for name, price, rating, category in rows:
+            Product.objects.create(
+                name=name, price=price, rating=rating, category=category,
+                description='Test Description')
+
+    def walk(self, ordering, reverse=False):
+        """
+        Collect every page forwards, then walk back from the last page
+        """
+        pages = []
+        page = paginate(Product.objects.all(), ordering, page_size=3)
+        pages.append([p.name for p in page])
+        while page.has_next:
+            page = paginate(
+                Product.objects.all(), ordering, page.next_cursor, 3)
+            pages.append([p.name for p in page])
+        backwards = [[p.name for p in page]]
+        while page.has_previous:
+            page = paginate(
+                Product.objects.all(), ordering, page.previous_cursor, 3)
+            backwards.insert(0, [p.name for p in page])
+        self.assertEqual(backwards, pages)
+        return [name for names in pages for name in names]
+
+    def expected(self, key, descending):
+        """
+        Sort in Python with NULL as the lowest value and the pk breaking ties
+        """
+        def sort_key(product):
+            value = key(product)
+            return (value is not None, value or 0, product.pk)
+        products = sorted(
+            Product.objects.all(), key=sort_key, reverse=descending)
+        return [product.name for product in products]
+
+    def test_every_sort_key_and_direction(self):
+        """
+        Pages cover each product exactly once, in order, both ways
+        """
+        keys = {
+            'price': lambda p: p.price,
+            'rating': lambda p: p.rating,
+            'category__name': lambda p: p.category and p.category.name,
+        }
+        for field, key in keys.items():
+            for descending in (False, True):
+                sign = '-' if descending else ''
+                with self.subTest(field=field, descending=descending):
+                    self.assertEqual(
+                        self.walk([f'{sign}{field}', f'{sign}id']),
+                        self.expected(key, descending))
+
+    def test_tampered_cursor_restarts(self):
+        """
+        An unreadable cursor falls back to the first page
+        """
+        page = paginate(Product.objects.all(), ['id'], 'nonsense', 3)
+        self.assertEqual([p.name for p in page], ['b', 'A', 'c'])
+        self.assertFalse(page.has_previous)
+
+    def test_products_view_pages(self):
+        """
+        The listing pages by name within a category filter
+        """
+        response = self.client.get(
+            '/products/', {'sort': 'name', 'direction': 'asc',
+                           'category': 'mice,consoles'})
+        self.assertEqual(response.context['product_count'], 5)
+        self.assertEqual(
+            [p.name for p in response.context['products']],
+            ['A', 'b', 'D', 'e', 'g'])
+        self.assertIsNone(response.context['next_page_url'])
+
+    @mock.patch('products.views.PRODUCTS_PER_PAGE', 2)
+    def test_products_view_next_links(self):
+        """
+        Following the next links walks the whole name sort
+        """
+        names = []
+        url = '/products/?sort=name&direction=desc'
+        while url:
+            response = self.client.get(url)
+            names += [p.name for p in response.context['products']]
+            url = response.context['next_page_url']
+        self.assertEqual(names, ['g', 'f', 'e', 'D', 'c', 'b', 'A'])
+
+
+class TestListingCache(TestCase):
+    """
+    Tests the versioned product listing cache
+    """
+    def setUp(self):
+        """
+        Start from an empty cache with one product
+        """
+        cache.clear()
+        self.product = Product.objects.create(
+            name='Test Name',
+            price='99.99',
+            description='Test Description',
+        )
+
+    def test_cache_hit_skips_database(self):
+        """
+        A repeated listing, even with reordered categories, runs no queries
+        """
+        self.product.category = Category.objects.create(name='mice')
+        self.product.save()
+        Category.objects.create(name='consoles')
+        self.client.get('/products/', {'category': 'mice,consoles'})
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/products/', {'category': 'consoles,mice'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'listing_csrf')
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+
+    def test_edits_invalidate_listing(self):
+        """
+        Saving a product shows up on the next listing
+        """
+        self.client.get('/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = 'Renamed Product'
+            self.product.save()
+        self.assertContains(self.client.get('/products/'), 'Renamed Product')
+
+    def test_superusers_bypass_cache(self):
+        """
+        Superusers always get a fresh grid with edit links
+        """
+        User.objects.create_superuser(
+            username='test_superuser', password='test_password')
+        self.client.get('/products/')
+        self.client.login(username='test_superuser', password='test_password')
+        self.assertContains(
+            self.client.get('/products/'),
+            f'/products/edit/{self.product.id}/')
+
+
+class TestFacets(TestCase):
+    """
+    Tests the category and price band counts on the listing
+    """
+    def setUp(self):
+        """
+        Create mice and keyboards at a range of prices
+        """
+        cache.clear()
+        mice = Category.objects.create(name='mice', friendly_name='Mice')
+        keyboards = Category.objects.create(
+            name='keyboards', friendly_name='Keyboards')
+        for name, category, price in (
+                ('Cheap Mouse', mice, '10.00'),
+                ('Wireless Mouse', mice, '45.00'),
+                ('Pro Mouse', mice, '120.00'),
+                ('Wireless Keyboard', keyboards, '60.00'),
+                ('Pro Keyboard', keyboards, '130.00'),
+                ('Mystery Box', None, '5.00')):
+            Product.objects.create(
+                name=name, category=category, price=price,
+                description=name)
+
+    def facets(self, params):
+        response = self.client.get('/products/', params)
+        counts = {
+            facet['name']: facet['count']
+            for facet in response.context['category_facets']}
+        bands = {
+            facet['key']: facet['count']
+            for facet in response.context['price_facets']}
+        return response, counts, bands
+
+    def test_unfiltered_counts(self):
+        """
+        Every category and band is counted, uncategorized products only
+        in the bands and the total
+        """
+        response, counts, bands = self.facets({})
+        self.assertEqual(counts, {'keyboards': 2, 'mice': 3})
+        self.assertEqual(bands, {
+            'under-25': 2, '25-50': 1, '50-100': 1, '100-250': 2,
+            '250-plus': 0})
+        self.assertEqual(response.context['product_count'], 6)
+
+    def test_each_facet_follows_the_other_filter(self):
+        """
+        Category counts apply the price band and band counts the
+        categories, while the total applies both
+        """
+        response, counts, bands = self.facets(
+            {'category': 'mice', 'price': '100-250'})
+        self.assertEqual(counts, {'keyboards': 1, 'mice': 1})
+        self.assertEqual(bands['under-25'], 1)
+        self.assertEqual(bands['100-250'], 1)
+        self.assertEqual(response.context['product_count'], 1)
+        self.assertEqual(
+            [p.name for p in response.context['products']], ['Pro Mouse'])
+
+    def test_counts_follow_search(self):
+        """
+        Only products matching the search term are counted
+        """
+        response, counts, bands = self.facets({'q': 'wireless'})
+        self.assertEqual(counts, {'keyboards': 1, 'mice': 1})
+        self.assertEqual(bands['25-50'], 1)
+        self.assertEqual(bands['50-100'], 1)
+        self.assertEqual(response.context['product_count'], 2)
+
+    def test_facets_in_one_query(self):
+        """
+        Facets and the page take two queries however many categories
+        exist, and paging reuses the cached facets
+        """
+        for index in range(20):
+            Category.objects.create(name=f'extra_{index}')
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                '/products/', {'category': 'mice,keyboards'})
+        self.assertContains(response, 'Mice (3)')
+        with self.assertNumQueries(1):
+            self.client.get(
+                '/products/', {'category': 'mice,keyboards', 'sort': 'price'})
+
+    def test_facet_links_toggle_filters(self):
+        """
+        Category links add or remove the category, restarting paging
+        """
+        response = self.client.get(
+            '/products/', {'category': 'mice', 'cursor': 'stale'})
+        urls = {
+            facet['name']: facet['url']
+            for facet in response.context['category_facets']}
+        self.assertEqual(
+            urls['keyboards'], '/products/?category=keyboards%2Cmice')
+        self.assertEqual(urls['mice'], '/products/')
+
+
+class TestReviewFeed(QueryBudgetTestMixin, TestCase):
+    """
+    Tests the paginated review feed on the detail page
+    """
+    def setUp(self):
+        """
+        Create a product with 25 reviews by two users
+        """
+        users = [
+            User.objects.create_user(username=f'reviewer_{i}')
+            for i in range(2)]
+        self.product = Product.objects.create(
+            name='Test Name', price='99.99', description='Test Description')
+        for i in range(25):
+            ProductReview.objects.create(
+                product=self.product, user=users[i % 2], stars=5,
+                content=f'Review {i}')
+
+    def test_detail_renders_first_page(self):
+        """
+        Only the newest page of reviews is rendered server-side
+        """
+        response = self.client.get(f'/products/{self.product.id}/')
+        contents = [review.content for review in response.context['reviews']]
+        self.assertEqual(
+            contents, [f'Review {i}' for i in range(24, 14, -1)])
+        self.assertContains(response, 'reviewer_0')
+        self.assertNotContains(response, 'Review 14<')
+        self.assertIsNotNone(response.context['next_reviews_url'])
+
+    def test_feed_walks_every_review_once(self):
+        """
+        Following next_url returns the remaining reviews in order,
+        authors included, in one query per page
+        """
+        url = self.client.get(
+            f'/products/{self.product.id}/').context['next_reviews_url']
+        contents = []
+        while url:
+            with self.assertQueryBudget('product_reviews'):
+                data = self.client.get(url).json()
+            contents += [review['content'] for review in data['reviews']]
+            self.assertIn('reviewer_', data['html'])
+            url = data['next_url']
+        self.assertEqual(contents, [f'Review {i}' for i in range(14, -1, -1)])
+
+
+class TestCatalogExport(TestCase):
+    """
+    Tests the streaming catalog export
+    """
+    def setUp(self):
+        """
+        Create a reviewed product in a category and a bare product
+        """
+        user = User.objects.create_user(username='test_user')
+        mice = Category.objects.create(name='mice', friendly_name='Mice')
+        self.mouse = Product.objects.create(
+            name='Mouse, "Pro"', price='49.99', description='Clicks',
+            category=mice, sku='m-1')
+        self.box = Product.objects.create(
+            name='Box', price='5.00', description='Empty')
+        for stars in (4, 5):
+            ProductReview.objects.create(
+                product=self.mouse, user=user, stars=stars)
+
+    def test_csv_export(self):
+        """
+        The command writes a header and one quoted row per product
+        """
+        out, err = StringIO(), StringIO()
+        call_command('export_catalog', stdout=out, stderr=err)
+        rows = list(csv.DictReader(StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]['name'], 'Mouse, "Pro"')
+        self.assertEqual(rows[0]['category_name'], 'mice')
+        self.assertEqual(rows[0]['review_count'], '2')
+        self.assertEqual(rows[0]['average_rating'], '4.5')
+        self.assertEqual(rows[1]['category_name'], '')
+        self.assertIn('Exported 2 products', err.getvalue())
+        self.assertIn('rows/sec', err.getvalue())
+
+    def test_ndjson_export_in_small_chunks(self):
+        """
+        NDJSON rows survive being read a row at a time
+        """
+        out = StringIO()
+        call_command(
+            'export_catalog', format='ndjson', chunk_size=1,
+            stdout=out, stderr=StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['id'] for row in rows],
+                         [self.mouse.id, self.box.id])
+        self.assertEqual(rows[0]['price'], '49.99')
+        self.assertIsNone(rows[1]['average_rating'])
+
+    def test_admin_action_streams(self):
+        """
+        The ProductAdmin action answers with a streaming download
+        """
+        User.objects.create_superuser(
+            username='test_superuser', password='test_password')
+        self.client.login(username='test_superuser', password='test_password')
+        response = self.client.post('/admin/products/product/', {
+            'action': 'export_csv',
+            '_selected_action': [self.box.id],
+        })
+        self.assertTrue(response.streaming)
+        self.assertIn('catalog.csv', response['Content-Disposition'])
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(body.splitlines()), 2)
+        self.assertIn('Box', body)
+
+
+class TestQueryBudgets(QueryBudgetTestMixin, TestCase):
+    """
+    Tests that the product pages stay within their query budgets
+    however large the catalog and review list grow
+    """
+    def setUp(self):
+        """
+        Create a test user and category
+        """
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password')
+        self.category = Category.objects.create(name='mice')
+
+    def test_all_products_budget(self):
+        """
+        The listing runs a fixed number of queries
+        """
+        for size in BUDGET_SIZES:
+            with self.subTest(size=size):
+                Product.objects.all().delete()
+                Product.objects.bulk_create([
+                    Product(name=f'Product {i}', price='9.99',
+                            description='Test Description',
+                            category=self.category)
+                    for i in range(size)])
+                cache.clear()
+                with self.assertQueryBudget('products'):
+                    response = self.client.get(
+                        '/products/',
+                        {'sort': 'category', 'direction': 'desc'})
+                self.assertEqual(response.status_code, 200)
+
+    def test_product_detail_budget(self):
+        """
+        The detail page runs a fixed number of queries for any number
+        of reviews
+        """
+        self.client.login(username='test_user', password='test_password')
+        for size in BUDGET_SIZES:
+            with self.subTest(size=size):
+                product = Product.objects.create(
+                    name='Test Name', price='99.99',
+                    description='Test Description')
+                ProductReview.objects.bulk_create([
+                    ProductReview(product=product, user=self.user, stars=4)
+                    for _ in range(size)])
+                with self.assertQueryBudget('product_detail'):
+                    response = self.client.get(f'/products/{product.id}/')
+                self.assertEqual(response.status_code, 200)
+
+
+class TestQueryPlans(TestCase):
+    """
+    Tests that the hot lookups are served by indexes
+    """
+    def test_canonical_queries_use_indexes(self):
+        """
+        Every canonical query plan reads an index
+        """
+        out = StringIO()
+        call_command('check_query_plans', stdout=out)
+        self.assertNotIn('FAIL', out.getvalue())
+
+    def test_missing_index_is_reported(self):
+        """
+        Table scans and sorts are flagged
+        """
+        self.assertEqual(
+            check_plan('3 0 0 SCAN products_product\n'
+                       '25 0 0 USE TEMP B-TREE FOR ORDER BY', True),
+            ['no index used', 'sorts instead of reading an index in order'])
+        self.assertEqual(
+            check_plan('5 0 0 SCAN products_product '
+                       'USING INDEX product_price_idx', True), [])
+
+
+def make_upload(name, size, mode='RGBA'):
+    """
+    An in-memory PNG upload of the given size
+    """
+    buffer = BytesIO()
+    Image.new(mode, size, (200, 30, 30, 128)[:len(mode)]).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+@override_settings(PRODUCT_IMAGE_DERIVATIVES_SYNC=True)
+class TestImageDerivatives(TestCase):
+    """
+    Tests the responsive image derivatives built on upload
+    """
+    def setUp(self):
+        """
+        Store uploads in a temporary media root
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def save_form(self, image, instance=None):
+        form = ProductForm(
+            {'name': 'Mouse', 'price': '19.99', 'description': 'A mouse'},
+            {'image': image}, instance=instance)
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            return form.save()
+
+    def test_upload_builds_derivatives(self):
+        """
+        Saving the form writes WebP and JPEG copies at each width
+        """
+        product = self.save_form(make_upload('mouse.png', (1200, 600)))
+        product.refresh_from_db()
+        variants = product.image_variants
+        self.assertEqual((variants['width'], variants['height']), (1200, 600))
+        self.assertEqual(
+            [(size['width'], size['height']) for size in variants['sizes']],
+            [(320, 160), (640, 320), (960, 480)])
+        for size in variants['sizes']:
+            with default_storage.open(size['webp']) as webp:
+                self.assertEqual(Image.open(webp).format, 'WEBP')
+            with default_storage.open(size['jpeg']) as jpeg:
+                image = Image.open(jpeg)
+                self.assertEqual(image.format, 'JPEG')
+                self.assertEqual(image.size, (size['width'], size['height']))
+
+    def test_small_images_are_not_upscaled(self):
+        """
+        An image narrower than every width gets one derivative
+        """
+        product = self.save_form(make_upload('tiny.png', (200, 100), 'RGB'))
+        product.refresh_from_db()
+        self.assertEqual(
+            [size['width'] for size in product.image_variants['sizes']],
+            [200])
+
+    def test_replacing_image_removes_old_derivatives(self):
+        """
+        A new upload replaces the old derivatives
+        """
+        product = self.save_form(make_upload('old.png', (700, 700)))
+        product.refresh_from_db()
+        old = product.image_variants['sizes'][0]['webp']
+        product = self.save_form(
+            make_upload('new.png', (700, 700)), instance=product)
+        product.refresh_from_db()
+        self.assertFalse(default_storage.exists(old))
+        self.assertIn('new', product.image_variants['sizes'][0]['webp'])
+
+    def test_shared_file_names_keep_their_own_derivatives(self):
+        """
+        Images named alike, on two products or with two extensions,
+        don't overwrite each other's derivatives, and replacing one
+        leaves the other's in place
+        """
+        first = self.save_form(make_upload('mouse.png', (400, 400)))
+        first.refresh_from_db()
+        second = Product.objects.create(
+            name='Mouse', price='19.99', description='A mouse',
+            image=default_storage.save(
+                'other/mouse.jpg', make_upload('mouse.jpg', (400, 400))))
+        call_command('build_image_derivatives', stdout=StringIO())
+        second.refresh_from_db()
+        names = {
+            first.image_variants['sizes'][0]['webp'],
+            second.image_variants['sizes'][0]['webp']}
+        self.assertEqual(len(names), 2)
+
+        self.save_form(make_upload('new.png', (400, 400)), instance=second)
+        self.assertTrue(all(
+            default_storage.exists(size[key])
+            for size in first.image_variants['sizes']
+            for key in ('webp', 'jpeg')))
+
+    def test_templates_emit_srcset(self):
+        """
+        The detail page offers the derivatives with their dimensions
+        """
+        product = self.save_form(make_upload('mouse.png', (1200, 600)))
+        response = self.client.get(f'/products/{product.id}/')
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '-320w.webp 320w')
+        self.assertContains(response, 'width="960" height="480"')
+
+    def test_backfill_command(self):
+        """
+        build_image_derivatives fills in products without derivatives
+        """
+        product = Product.objects.create(
+            name='Old', price='5.00', description='Uploaded long ago',
+            image=default_storage.save(
+                'old.png', make_upload('old.png', (400, 300))))
+        out = StringIO()
+        call_command('build_image_derivatives', stdout=out)
+        product.refresh_from_db()
+        self.assertEqual(len(product.image_variants['sizes']), 2)
+        self.assertIn('1 product(s)', out.getvalue())
@@ -1,68 +1,232 @@
 from django.shortcuts import render, get_object_or_404, reverse, redirect
 from django.contrib import messages
-from django.db.models import Q
+from django.http import JsonResponse
 from django.db.models.functions import Lower
 from django.contrib.auth.decorators import login_required
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 
-from .models import Product, Category, ProductReview
+from .models import Product, ProductReview
 from .forms import ProductForm
+from . import listing_cache
+from .facets import BAND_KEYS, count_facets, price_band_filter
+from .listing_cache import CSRF_PLACEHOLDER
+from .pagination import page_url, paginate
+from .search import search_products
+
+PRODUCTS_PER_PAGE = 24
+REVIEWS_PER_PAGE = 10
+REVIEW_ORDERING = ['-date_added', '-id']
+SORT_FIELDS = {
+    'name': 'lower_name',
+    'price': 'price',
+    'rating': 'rating',
+    'category': 'category__name',
+}
+
+
+def _listing_params(request):
+    """
+    Normalize the listing query string, so equivalent URLs share
+    a cache entry
+    """
+    sort = request.GET.get('sort')
+    if sort not in SORT_FIELDS:
+        sort = None
+    categories = None
+    if 'category' in request.GET:
+        categories = sorted(set(request.GET['category'].split(',')))
+    query = None
+    if 'q' in request.GET:
+        query = ' '.join(request.GET['q'].split()).lower()
+    price_band = request.GET.get('price')
+    if price_band not in BAND_KEYS:
+        price_band = None
+    return {
+        'sort': sort,
+        'descending': request.GET.get('direction') == 'desc',
+        'categories': categories,
+        'price': price_band,
+        'q': query,
+        'cursor': request.GET.get('cursor') or '',
+    }
+
+
+def _facet_url(request, **changes):
+    """
+    The current listing URL, back on its first page, with some query
+    parameters replaced or, when given None, removed
+    """
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    for name, value in changes.items():
+        if value is None:
+            params.pop(name, None)
+        else:
+            params[name] = value
+    if not params:
+        return request.path
+    return f'{request.path}?{params.urlencode()}'
+
+
+def _searched_products(params):
+    """
+    Products matching the search term, before category and price filters
+    """
+    products = Product.objects.all()
+    if params['q']:
+        products = search_products(products, params['q'])
+    return products
+
+
+def _get_facets(params):
+    """
+    Facet counts for the search term and filters, cached per catalog
+    version independently of the sort and page
+    """
+    facet_params = {
+        'facets': True,
+        'q': params['q'],
+        'categories': params['categories'],
+        'price': params['price'],
+    }
+    key = listing_cache.make_key(facet_params)
+    facets = listing_cache.get_listing(key)
+    if facets is None:
+        facets = count_facets(
+            _searched_products(params), params['categories'],
+            params['price'])
+        listing_cache.set_listing(key, facets)
+    return facets
+
+
+def _build_listing(params, redirect_url, show_admin_links):
+    """
+    Run the listing query for normalized params and render its grid
+    """
+    products = _searched_products(params)
+    ordering = []
+
+    if params['sort']:
+        sortkey = SORT_FIELDS[params['sort']]
+        if sortkey == 'lower_name':
+            products = products.annotate(lower_name=Lower('name'))
+        if params['descending']:
+            sortkey = f'-{sortkey}'
+        ordering = [sortkey]
+
+    if params['categories'] is not None:
+        products = products.filter(category__name__in=params['categories'])
+
+    if params['price']:
+        products = products.filter(price_band_filter(params['price']))
+
+    if params['q'] and not params['sort']:
+        ordering = ['-search_rank']
+
+    # Break ties on the pk, in the same direction as the sort key
+    if ordering and ordering[0].startswith('-'):
+        ordering.append('-id')
+    else:
+        ordering.append('id')
+
+    page = paginate(
+        products, ordering, params['cursor'], PRODUCTS_PER_PAGE)
+
+    grid = render_to_string('products/includes/product_grid.html', {
+        'products': page,
+        'csrf_token': CSRF_PLACEHOLDER,
+        'redirect_url': redirect_url,
+        'show_admin_links': show_admin_links,
+    })
+
+    return {
+        'ids': [product.id for product in page],
+        'grid': grid,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    }
 
 
 def all_products(request):
     """
     A view to show all products,
     including sorting and search
-    """
 
-    products = Product.objects.all()
-    query = None
-    categories = None
-    sort = None
-    direction = None
-
-    if request.GET:
-        if 'sort' in request.GET:
-            sortkey = request.GET['sort']
-            sort = sortkey
-            if sortkey == 'name':
-                sortkey = 'lower_name'
-                products = products.annotate(lower_name=Lower('name'))
-                if sortkey == 'category':
-                    sortkey = 'category__name'
-            if 'direction' in request.GET:
-                direction = request.GET['direction']
-                if direction == 'desc':
-                    sortkey = f'-{sortkey}'
-            products = products.order_by(sortkey)
-
-        if 'category' in request.GET:
-            categories = request.GET['category'].split(',')
-            products = products.filter(category__name__in=categories)
-            # pylint: disable=no-member
-            categories = Category.objects.filter(name__in=categories)
-
-        if 'q' in request.GET:
-            query = request.GET['q']
-            if not query:
-                messages.error(request, "No search criteria")
-                return redirect(reverse('products'))
-
-            queries = Q(
-                name__icontains=query) | Q(description__icontains=query)
-            products = products.filter(queries)
+    Listings are cached per normalized query until the catalog changes.
+    Superusers bypass the cache, since their grid carries edit links.
+    The product count comes from the facet counts.
+    """
 
+    if 'q' in request.GET and not request.GET['q']:
+        messages.error(request, "No search criteria")
+        return redirect(reverse('products'))
+
+    params = _listing_params(request)
+    facets = _get_facets(params)
+    show_admin_links = request.user.is_superuser
+    listing = None
+    if not show_admin_links:
+        key = listing_cache.make_key(params)
+        listing = listing_cache.get_listing(key)
+    if listing is None:
+        listing = _build_listing(params, request.path, show_admin_links)
+        if not show_admin_links:
+            listing_cache.set_listing(key, listing)
+
+    sort = params['sort']
+    direction = request.GET.get('direction') if sort else None
     current_sorting = f'{sort}_{direction}'
 
+    selected = set(params['categories'] or ())
+    for category in facets['categories']:
+        toggled = selected ^ {category['name']}
+        category['url'] = _facet_url(
+            request, category=','.join(sorted(toggled)) or None)
+    for band in facets['price_bands']:
+        band['url'] = _facet_url(
+            request, price=None if band['selected'] else band['key'])
+
     context = {
-        'products': products,
-        'search_term': query,
-        'current_categories': categories,
+        'product_grid': mark_safe(listing['grid'].replace(
+            CSRF_PLACEHOLDER, get_token(request))),
+        'product_count': facets['total'],
+        'next_page_url': (
+            page_url(request, listing['next_cursor'])
+            if listing['next_cursor'] else None),
+        'previous_page_url': (
+            page_url(request, listing['previous_cursor'])
+            if listing['previous_cursor'] else None),
+        'search_term': request.GET.get('q'),
+        'current_categories': [
+            category for category in facets['categories']
+            if category['selected']],
+        'current_price_band': params['price'],
+        'category_facets': facets['categories'],
+        'price_facets': facets['price_bands'],
         'current_sorting': current_sorting,
     }
 
     return render(request, 'products/products.html', context)
 
 
+def _review_page(product_id, cursor=None):
+    """
+    One page of a product's reviews, newest first, with their authors
+    """
+    reviews = ProductReview.objects.filter(
+        product_id=product_id).select_related('user')
+    return paginate(reviews, REVIEW_ORDERING, cursor, REVIEWS_PER_PAGE)
+
+
+def _next_reviews_url(product_id, page):
+    if not page.has_next:
+        return None
+    url = reverse('product_reviews', args=[product_id])
+    return f'{url}?cursor={page.next_cursor}'
+
+
 def product_detail(request, product_id):
     """
     view to show product details
@@ -79,13 +243,40 @@ def product_detail(request, product_id):
             product=product, user=request.user, stars=stars, content=content)
 
         return redirect('product_detail', product_id=product_id)
+    page = _review_page(product.id)
     context = {
         'product': product,
+        'reviews': page,
+        'next_reviews_url': _next_reviews_url(product.id, page),
     }
 
     return render(request, 'products/product_detail.html', context)
 
 
+def product_reviews(request, product_id):
+    """
+    The next page of a product's reviews as JSON, for the review feed
+    on the detail page. The rendered HTML fragment is included along
+    with the review data.
+    """
+    page = _review_page(product_id, request.GET.get('cursor'))
+    html = render_to_string(
+        'products/includes/review_list.html', {'reviews': page}, request)
+    return JsonResponse({
+        'html': html,
+        'next_url': _next_reviews_url(product_id, page),
+        'reviews': [
+            {
+                'id': review.id,
+                'user': str(review.user),
+                'stars': review.stars,
+                'content': review.content,
+                'date_added': review.date_added.isoformat(),
+            }
+            for review in page],
+    })
+
+
 def delete_review(request, review_id):
     """
     Delete a product review
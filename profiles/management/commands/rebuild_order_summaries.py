@@ -0,0 +1,45 @@
+"""
+profiles/management/commands/rebuild_order_summaries.py: recomputes the
+order_count and lifetime_spend columns on every profile from its orders.
+"""
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from checkout.models import Order
+from profiles.models import UserProfile
+
+
+class Command(BaseCommand):
+    """
+    Rebuild the denormalized order summaries on UserProfile
+    """
+    help = 'Recompute order_count and lifetime_spend for all profiles.'
+
+    def handle(self, *args, **options):
+        totals = {
+            row['user_profile']: row
+            for row in Order.objects.filter(
+                user_profile__isnull=False).values('user_profile').annotate(
+                    orders=Count('id'), spend=Sum('grand_total'))
+        }
+
+        updated = []
+        with transaction.atomic():
+            for profile in UserProfile.objects.select_for_update().only(
+                    'id', 'order_count', 'lifetime_spend'):
+                row = totals.get(
+                    profile.id, {'orders': 0, 'spend': Decimal('0.00')})
+                if (profile.order_count != row['orders']
+                        or profile.lifetime_spend != row['spend']):
+                    profile.order_count = row['orders']
+                    profile.lifetime_spend = row['spend']
+                    updated.append(profile)
+            UserProfile.objects.bulk_update(
+                updated, ['order_count', 'lifetime_spend'], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt order summaries for {len(updated)} profile(s).'))
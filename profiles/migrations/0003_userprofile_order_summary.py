@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-18 11:07
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def summarize_orders(apps, schema_editor):
+    """
+    Total up the orders each profile has placed so far
+    """
+    Order = apps.get_model('checkout', 'Order')
+    UserProfile = apps.get_model('profiles', 'UserProfile')
+    profiles = []
+    for row in Order.objects.filter(user_profile__isnull=False).values(
+            'user_profile').annotate(
+                orders=Count('id'), spend=Sum('grand_total')):
+        profiles.append(UserProfile(
+            id=row['user_profile'], order_count=row['orders'],
+            lifetime_spend=row['spend']))
+    UserProfile.objects.bulk_update(
+        profiles, ['order_count', 'lifetime_spend'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('checkout', '0011_orderlineitem_product_snapshot'),
+        ('profiles', '0002_rename_default_user_userprofile_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='lifetime_spend',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(summarize_orders, migrations.RunPython.noop),
+    ]
@@ -7,6 +7,11 @@ from products.models import Product
 from django_countries.fields import CountryField
 
 
+# Running totals of a profile's orders, kept by checkout.orders with
+# F() updates and recomputed by the rebuild_order_summaries command
+SUMMARY_FIELDS = ('order_count', 'lifetime_spend')
+
+
 class UserProfile(models.Model):
     """
     A user profile model for maintaining default
@@ -25,6 +30,21 @@ class UserProfile(models.Model):
         max_length=80, null=True, blank=True)
     default_country = CountryField(
         blank_label='Country', null=True, blank=True)
+    order_count = models.PositiveIntegerField(default=0, editable=False)
+    lifetime_spend = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0, editable=False)
+
+    def save(self, *args, **kwargs):
+        """
+        Leave the order summary out of updates, so saving a profile that
+        was loaded before an order was placed cannot undo its totals
+        """
+        if (not self._state.adding and 'update_fields' not in kwargs
+                and not kwargs.get('force_insert')):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in SUMMARY_FIELDS]
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.user.username
@@ -1,3 +1,208 @@
+"""
+profiles/tests.py: Contains testing of the profiles app.
+"""
+# pylint: disable=no-member
+
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+
+from checkout.models import Order, OrderLineItem
+from checkout.orders import attach_order, place_order
+from checkout.testing import new_order
+from gamesrus.query_budget import BUDGET_SIZES, QueryBudgetTestMixin
+from products.models import Product
+from .models import UserProfile
+from .views import ORDERS_PER_PAGE
+
+
+class TestOrderSummary(TestCase):
+    """
+    Tests the order count and lifetime spend kept on each profile
+    """
+    def setUp(self):
+        """
+        Create a product and a logged in user
+        """
+        self.user = User.objects.create_user(
+            username='test_user', password='test_password')
+        self.client.login(username='test_user', password='test_password')
+        self.mouse = Product.objects.create(
+            name='Mouse', price='10.00', description='Test Description')
+
+    def summary(self):
+        profile = UserProfile.objects.get(user=self.user)
+        return profile.order_count, profile.lifetime_spend
+
+    def test_placed_orders_are_added(self):
+        """
+        An order placed for the profile adds its grand total
+        """
+        place_order(new_order(user_profile=self.user.userprofile),
+                    {str(self.mouse.id): 3})
+        place_order(new_order(user_profile=self.user.userprofile),
+                    {str(self.mouse.id): 1})
+        self.assertEqual(self.summary(), (2, Decimal('42.00')))
+
+    def test_confirmation_page_attaches_once(self):
+        """
+        Reloading the confirmation page counts the order once
+        """
+        order = place_order(new_order(), {str(self.mouse.id): 3})
+        url = f'/checkout/checkout_success/{order.order_number}'
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(self.summary(), (1, Decimal('31.50')))
+        self.assertFalse(attach_order(order, self.user.userprofile))
+
+    def test_attaching_moves_the_order_between_profiles(self):
+        """
+        The previous profile loses the order the new one gains
+        """
+        other = User.objects.create_user(username='other').userprofile
+        order = place_order(
+            new_order(user_profile=other), {str(self.mouse.id): 3})
+        self.assertTrue(attach_order(order, self.user.userprofile))
+        other.refresh_from_db()
+        self.assertEqual((other.order_count, other.lifetime_spend),
+                         (0, Decimal('0.00')))
+        self.assertEqual(self.summary(), (1, Decimal('31.50')))
+
+    def test_deleted_orders_are_taken_out(self):
+        """
+        Deleting an order removes it from the summary
+        """
+        order = place_order(new_order(user_profile=self.user.userprofile),
+                            {str(self.mouse.id): 3})
+        order.delete()
+        self.assertEqual(self.summary(), (0, Decimal('0.00')))
+
+    def test_saving_a_stale_profile_keeps_the_summary(self):
+        """
+        A profile loaded before an order was placed saves without
+        overwriting the order's totals
+        """
+        profile = UserProfile.objects.get(user=self.user)
+        place_order(new_order(user_profile=profile), {str(self.mouse.id): 3})
+        profile.default_town_or_city = 'Stockholmsburg'
+        profile.save()
+        self.assertEqual(self.summary(), (1, Decimal('31.50')))
+
+    def test_rebuild_order_summaries(self):
+        """
+        The command puts drifted summaries right
+        """
+        place_order(new_order(user_profile=self.user.userprofile),
+                    {str(self.mouse.id): 3})
+        UserProfile.objects.update(order_count=7, lifetime_spend=0)
+        out = StringIO()
+        call_command('rebuild_order_summaries', stdout=out)
+        self.assertIn('1 profile(s)', out.getvalue())
+        self.assertEqual(self.summary(), (1, Decimal('31.50')))
+
+
+class TestProfileOrders(TestCase):
+    """
+    Tests the paginated order list on the profile page
+    """
+    def setUp(self):
+        """
+        Create a logged in user with 25 orders a day apart
+        """
+        user = User.objects.create_user(
+            username='test_user', password='test_password')
+        self.client.login(username='test_user', password='test_password')
+        for day in range(25):
+            order = new_order(user_profile=user.userprofile)
+            order.save()
+            OrderLineItem.objects.bulk_create([
+                OrderLineItem(order=order, product_name='Mouse',
+                              unit_price='10.00', quantity=2,
+                              lineitem_total='20.00'),
+                OrderLineItem(order=order, product_name='Pad',
+                              unit_price='5.00', quantity=1,
+                              lineitem_total='5.00')])
+            Order.objects.filter(pk=order.pk).update(
+                date=timezone.now() - timedelta(days=day))
+        self.newest_first = list(
+            Order.objects.order_by('-date').values_list('id', flat=True))
+
+    def test_orders_are_paged_newest_first(self):
+        """
+        Following the next links visits every order once, in date order
+        """
+        seen = []
+        url = '/profile/'
+        while url:
+            response = self.client.get(url)
+            page = response.context['orders']
+            self.assertLessEqual(len(page), ORDERS_PER_PAGE)
+            seen += [order.id for order in page]
+            url = response.context['next_page_url']
+        self.assertEqual(seen, self.newest_first)
+
+    def test_orders_have_their_counts(self):
+        """
+        Each order carries its line and item counts
+        """
+        order = self.client.get('/profile/').context['orders'].object_list[0]
+        self.assertEqual((order.line_count, order.item_count), (2, 3))
+
+
+class TestQueryBudgets(QueryBudgetTestMixin, TestCase):
+    """
+    Tests that the profile page stays within its query budget
+    however many orders the user has placed
+    """
+    def test_profile_budget(self):
+        """
+        The profile page runs a fixed number of queries
+        """
+        user = User.objects.create_user(
+            username='test_user', password='test_password')
+        product = Product.objects.create(
+            name='Test Name', price='9.99', description='Test Description')
+        self.client.login(username='test_user', password='test_password')
+        for size in BUDGET_SIZES:
+            with self.subTest(size=size):
+                Order.objects.all().delete()
+                Order.objects.bulk_create([
+                    new_order(order_number=f'{i:032d}',
+                              user_profile=user.userprofile)
+                    for i in range(size)])
+                OrderLineItem.objects.bulk_create([
+                    OrderLineItem(order=order, product=product, quantity=1,
+                                  lineitem_total=product.price)
+                    for order in Order.objects.all()])
+                with self.assertQueryBudget('profile'):
+                    response = self.client.get('/profile/')
+                self.assertEqual(response.status_code, 200)
 
-# Create your tests here.
+    def test_order_history_budget(self):
+        """
+        A past order renders in a fixed number of queries, without
+        loading its products
+        """
+        User.objects.create_user(
+            username='test_user', password='test_password')
+        self.client.login(username='test_user', password='test_password')
+        for size in BUDGET_SIZES:
+            with self.subTest(size=size):
+                order = new_order()
+                order.save()
+                OrderLineItem.objects.bulk_create([
+                    OrderLineItem(order=order, product_name=f'Product {i}',
+                                  unit_price='9.99', quantity=1,
+                                  lineitem_total='9.99')
+                    for i in range(size)])
+                with self.assertQueryBudget('order_history') as queries:
+                    response = self.client.get(
+                        f'/profile/order_history/{order.order_number}')
+                self.assertContains(response, f'Product {size - 1}')
+                self.assertFalse(any(
+                    'products_product' in sql for sql in queries.queries))
@@ -2,12 +2,18 @@ from django.shortcuts import render, get_object_or_404, redirect, reverse
 from django.contrib import messages
 from django.http import Http404
 from django.contrib.auth.decorators import login_required
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
 from .models import UserProfile
 from .forms import UserProfileForm
 from products.models import Product
+from products.pagination import page_url, paginate
 
 from checkout.models import Order
 
+ORDERS_PER_PAGE = 10
+ORDER_ORDERING = ['-date', '-id']
+
 
 @login_required
 def profile(request):
@@ -26,12 +32,25 @@ def profile(request):
                 request, 'Update failed. Check again if the form is valid!')
     else:
         form = UserProfileForm(instance=profile)
-    orders = profile.orders.all()
+    # One page of orders, newest first, with their line items from one
+    # more query and their counts summed in the database
+    orders = profile.orders.annotate(
+        line_count=Count('lineitems'),
+        item_count=Coalesce(Sum('lineitems__quantity'), 0),
+    ).prefetch_related('lineitems')
+    page = paginate(
+        orders, ORDER_ORDERING, request.GET.get('cursor'), ORDERS_PER_PAGE)
 
     template = 'profiles/profile.html'
     context = {
         'form': form,
-        'orders': orders,
+        'profile': profile,
+        'orders': page,
+        'next_page_url': (
+            page_url(request, page.next_cursor) if page.has_next else None),
+        'previous_page_url': (
+            page_url(request, page.previous_cursor)
+            if page.has_previous else None),
         'on_profile_page': True,
     }
 
@@ -42,7 +61,11 @@ def order_history(request, order_number):
     """
     Returns the users order history.
     """
-    order = get_object_or_404(Order, order_number=order_number)
+    # The line items carry their products' details, so the products
+    # themselves are never loaded
+    order = get_object_or_404(
+        Order.objects.prefetch_related('lineitems'),
+        order_number=order_number)
     messages.info(request, (
         f'This is a past confirmation for order number {order_number}.'
         'Confirmation email was sent too your email address on the order date.'